@@ -1,15 +1,53 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from routes import analyze
 from routes import query
 from routes import upload
 from routes import auth_routes
-from services.vectorstore import search_invoice_text
+from routes import search
+from services.vectorstore import warm_vectorstore, ChromaInUseError
+from services.workers import shutdown_workers
+from services.jobs import start_job_workers, stop_job_workers
+from services.indexer import start_indexer, stop_indexer, get_index_backlog
+from database.db import async_session
+from services.llm_provider import start_llm_provider, stop_llm_provider
+from services.llm_scheduler import stop_llm_scheduler
+from services.batch_llm import stop_llm_batcher
+from services import metrics
+from services.llm_router import router_stats
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # --- Startup: pooled LLM clients + prebuilt chains, then resume queued analysis jobs ---
+    start_llm_provider()
+    try:
+        # Warm start: open the persistent vector index before the first /search
+        chunks = await asyncio.to_thread(warm_vectorstore)
+        print(f"Vector index ready: {chunks} chunks")
+    except ChromaInUseError:
+        raise  # a second worker on a local index would serve stale results
+    except Exception as e:
+        print("Vector index unavailable:", e)
+    await start_job_workers()
+    await start_indexer()
+    yield
+    # --- Shutdown: stop job workers and the indexer, the text-extraction process pool, pending LLM packs, then LLM clients ---
+    await stop_job_workers()
+    await stop_indexer()
+    shutdown_workers()
+    await stop_llm_batcher()
+    await stop_llm_scheduler()
+    await stop_llm_provider()
+
 
 app = FastAPI(
     title="Smart Invoice & Receipt Analyzer",
     description="LangChain-powered backend for automated invoice extraction.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # --- CORS (React frontend can talk to API) ---
@@ -25,20 +63,27 @@ app.add_middleware(
 app.include_router(upload.router, prefix="/api")
 app.include_router(analyze.router, prefix="/api")
 app.include_router(query.router, prefix="/api")
+app.include_router(search.router, prefix="/api")
 app.include_router(auth_routes.router)
 
 @app.get("/")
 def root():
     return {"message": "Smart Invoice Analyzer API is running 🚀"}
 
-@app.get("/search")
-async def search_invoices(q: str):
-    results = search_invoice_text(q)
-    
-    return [
-        {
-            "text": doc.page_content,
-            "metadata": doc.metadata
-        }
-        for doc in results
-    ]
+@app.get("/metrics")
+async def pipeline_metrics():
+    """In-process pipeline counters for this worker, plus the (shared) indexing backlog."""
+    try:
+        async with async_session() as db:
+            indexer = await get_index_backlog(db)
+    except Exception as e:
+        print("Index backlog unavailable:", e)
+        indexer = None
+    return {
+        "counters": metrics.snapshot(),
+        "llm_skip_rate": metrics.ratio("extractions_llm_skipped", "extractions_total"),
+        "prompt_token_savings": metrics.ratio("prompt_tokens_saved", "prompt_tokens_original"),
+        "embedding_cache_hit_rate": metrics.ratio("embedding_cache_hits", "embedding_cache_lookups"),
+        "llm_providers": router_stats(),
+        "indexer": indexer,
+    }
@@ -0,0 +1,89 @@
+# benchmarks/bench_chunking.py
+"""
+Chunking throughput on 100-page documents: the token-aware streaming chunker
+(services/chunker.iter_chunks) vs the 800-word sliding window it replaced.
+
+    python -m benchmarks.bench_chunking [--pages 100] [--repeat 5] [--text invoice.txt ...]
+
+The synthetic document is one invoice page per page (header, 40-row item
+table, totals; benchmarks/corpus.py) joined with page breaks. A second run
+adds a pasted blob with no whitespace on every page, which the chunker has
+to cut inside a word. Besides pages/s it reports the chunk count, the
+largest chunk in embedding tokens (never above CHUNK_MAX_TOKENS for
+iter_chunks; the old window ignored the limit) and the peak Python heap
+while chunking (tracemalloc): iter_chunks is consumed as a stream, the old
+window built every chunk up front.
+"""
+import argparse
+import random
+import string
+import time
+import tracemalloc
+
+from benchmarks.corpus import invoice_lines
+from services.chunker import iter_chunks, CHUNK_MAX_TOKENS
+from services.text_constants import PAGE_SEPARATOR
+from services.tokenizer import count_embedding_tokens
+
+
+def word_windows(text: str, chunk_size: int = 800, overlap: int = 120) -> list[str]:
+    """The previous chunk_text: 800-word slices of the whole document, 120 words of overlap."""
+    words = text.split()
+    chunks, start = [], 0
+    while start < len(words):
+        chunks.append(" ".join(words[start:start + chunk_size]))
+        start += chunk_size - overlap
+    return chunks
+
+
+def streamed(text: str) -> list[int]:
+    return [chunk.tokens for chunk in iter_chunks(text)]
+
+
+def windowed(text: str) -> list[int]:
+    return [count_embedding_tokens(chunk) for chunk in word_windows(text)]
+
+
+def make_document(pages: int, blob_chars: int = 0) -> str:
+    rng = random.Random(0)
+    out = []
+    for n in range(pages):
+        lines = invoice_lines(n, seed=1)
+        if blob_chars:
+            lines.append("Attachment: " + "".join(rng.choices(string.ascii_letters + string.digits + "+/", k=blob_chars)))
+        out.append("\n".join(lines))
+    return PAGE_SEPARATOR.join(out)
+
+
+def compare(label: str, text: str, pages: int, repeat: int) -> None:
+    print(f"{label} ({pages} pages, {len(text) / 1e6:.2f} MB, best of {repeat}, CHUNK_MAX_TOKENS={CHUNK_MAX_TOKENS})")
+    for name, chunk in (("iter_chunks", streamed), ("word window", windowed)):
+        best, sizes = float("inf"), []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            sizes = chunk(text)
+            best = min(best, time.perf_counter() - started)
+        tracemalloc.start()
+        chunk(text)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(
+            f"  {name:<12} {pages / best:>8.0f} pages/s   {len(text) / best / 1e6:>6.2f} MB/s   "
+            f"{len(sizes):>5} chunks   max {max(sizes):>6} tokens   peak heap {peak / 1e6:>6.2f} MB"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--text", nargs="*", default=[], help="extracted texts (pages separated by \\f) to chunk as well")
+    args = parser.parse_args()
+
+    count_embedding_tokens("warm up")  # load (or fail to load) the BPE file outside the timings
+    compare("invoice pages", make_document(args.pages), args.pages, args.repeat)
+    compare("invoice pages + 8k-char blob", make_document(args.pages, blob_chars=8000), args.pages, args.repeat)
+    for path in args.text:
+        with open(path) as f:
+            text = f.read()
+        compare(path, text, text.count(PAGE_SEPARATOR) + 1, args.repeat)
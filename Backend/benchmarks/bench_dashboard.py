@@ -0,0 +1,176 @@
+# benchmarks/bench_dashboard.py
+"""
+Dashboard stats latency: the single aggregate statement in
+db_services.get_dashboard_stats vs the eight sequential statements it
+replaced, on seeded invoices tables of growing size.
+
+    python -m benchmarks.bench_dashboard [--rows 10000 100000 1000000] [--vendors 300]
+        [--currencies 5] [--days 120] [--repeat 5] [--database-url URL]
+
+The table is topped up to each size in turn (so the 1M run reuses the
+first 100k rows). One user owns 80% of the invoices, the rest are spread
+over 20 others; created_at covers the last --days days, so both the
+current- and previous-month FILTER aggregates have rows. Each variant is
+timed for that user and for all users (user_id=None), median of --repeat
+runs after one warm-up, and the two outputs are compared.
+
+Defaults to a throwaway SQLite file (aiosqlite), where every statement is
+in-process: on Postgres each of the old eight statements also pays a
+network round trip. Pass --database-url postgresql+asyncpg://... to
+measure that; the invoices table there is dropped and recreated.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+_SEED_BATCH = 10000
+# Deterministic ids whose hex starts with a letter: the UUID columns have numeric affinity
+# on SQLite, so all-digit (or "…0e1"-like) hex strings would be stored as numbers and collide
+_ID_PREFIX = 0xA << 124
+_USER_PREFIX = 0xB << 124
+
+
+async def eight_statements(db, user_id=None) -> dict:
+    """get_dashboard_stats before the single-statement rewrite, as the baseline."""
+    from dateutil.relativedelta import relativedelta
+    from sqlalchemy import desc, func, select
+
+    from database.models import Invoice
+
+    now = datetime.now()
+    current_month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    next_month = current_month_start + relativedelta(months=1)
+    prev_month_start = current_month_start - relativedelta(months=1)
+
+    total_stmt = select(func.count()).select_from(Invoice)
+    sum_stmt = select(func.coalesce(func.sum(Invoice.total_amount), 0))
+    vendor_stmt = select(Invoice.vendor_name, func.count().label("count"), func.coalesce(func.sum(Invoice.total_amount), 0).label("sum")).group_by(Invoice.vendor_name).order_by(desc("sum")).limit(10)
+    current_month_count_stmt = select(func.count()).select_from(Invoice).where(Invoice.created_at >= current_month_start, Invoice.created_at < next_month)
+    current_month_sum_stmt = select(func.coalesce(func.sum(Invoice.total_amount), 0)).where(Invoice.created_at >= current_month_start, Invoice.created_at < next_month)
+    prev_month_count_stmt = select(func.count()).select_from(Invoice).where(Invoice.created_at >= prev_month_start, Invoice.created_at < current_month_start)
+    prev_month_sum_stmt = select(func.coalesce(func.sum(Invoice.total_amount), 0)).where(Invoice.created_at >= prev_month_start, Invoice.created_at < current_month_start)
+    currency_stmt = select(Invoice.currency, func.coalesce(func.sum(Invoice.total_amount), 0)).group_by(Invoice.currency)
+    statements = [total_stmt, sum_stmt, vendor_stmt, current_month_count_stmt, current_month_sum_stmt, prev_month_count_stmt, prev_month_sum_stmt, currency_stmt]
+    if user_id:
+        statements = [stmt.where(Invoice.user_id == user_id) for stmt in statements]
+
+    total, total_expenses, vendor_rows, current_month_count, current_month_sum, prev_month_count, prev_month_sum, currency_rows = [
+        (await db.execute(stmt)).all() for stmt in statements
+    ]
+    total, total_expenses = total[0][0], total_expenses[0][0]
+    current_month_count, current_month_sum = current_month_count[0][0], current_month_sum[0][0]
+    prev_month_count, prev_month_sum = prev_month_count[0][0], prev_month_sum[0][0]
+
+    invoice_trend = ((current_month_count - prev_month_count) / prev_month_count) * 100 if prev_month_count > 0 else 0.0
+    expense_trend = ((current_month_sum - prev_month_sum) / prev_month_sum) * 100 if prev_month_sum > 0 else 0.0
+    return {
+        "total_invoices": int(total),
+        "total_expenses": float(total_expenses or 0),
+        "top_vendors": [{"vendor_name": v[0], "count": int(v[1]), "sum": float(v[2] or 0)} for v in vendor_rows],
+        "expenses_by_currency": [{"currency": r[0] or "UNKNOWN", "sum": float(r[1] or 0)} for r in currency_rows],
+        "invoice_trend": round(invoice_trend, 1),
+        "expense_trend": round(expense_trend, 1),
+        "current_month_expenses": float(current_month_sum or 0),
+    }
+
+
+def _comparable(stats: dict) -> dict:
+    # GROUP BY output order isn't defined: compare the currencies as a set; sums to the cent
+    return {
+        **stats,
+        "total_expenses": round(stats["total_expenses"], 2),
+        "current_month_expenses": round(stats["current_month_expenses"], 2),
+        "top_vendors": [{**v, "sum": round(v["sum"], 2)} for v in stats["top_vendors"]],
+        "expenses_by_currency": sorted((c["currency"], round(c["sum"], 2)) for c in stats["expenses_by_currency"]),
+    }
+
+
+async def seed(engine, start: int, stop: int, args, owner: uuid.UUID, others: list) -> None:
+    """Insert invoices number start..stop-1 (deterministic per number)."""
+    from sqlalchemy import insert
+
+    from database.models import Invoice
+
+    vendors = [f"Vendor {i:03d}" for i in range(args.vendors)]
+    currencies = ["USD", "EUR", "GBP", "NGN", "JPY", "CAD", "AUD"][:args.currencies]
+    now = datetime.now(timezone.utc)
+    for batch_start in range(start, stop, _SEED_BATCH):
+        rows = []
+        for n in range(batch_start, min(batch_start + _SEED_BATCH, stop)):
+            rng = random.Random(n)
+            rows.append({
+                "id": uuid.UUID(int=_ID_PREFIX | n),
+                "user_id": owner if rng.random() < 0.8 else rng.choice(others),
+                "filename": f"invoice-{n}.pdf",
+                "vendor_name": rng.choice(vendors),
+                "total_amount": Decimal(rng.randint(100, 500000)) / 100,
+                "currency": rng.choice(currencies),
+                "processed": True,
+                "index_status": "indexed",
+                "created_at": now - timedelta(seconds=rng.randint(0, args.days * 86400)),
+            })
+        async with engine.begin() as conn:
+            await conn.execute(insert(Invoice), rows)
+
+
+async def timed(run, user_id, repeat: int) -> tuple[float, dict]:
+    from database.db import async_session
+
+    async with async_session() as db:
+        result = await run(db, user_id)  # warm-up: statement compilation, page cache
+        times = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            await run(db, user_id)
+            times.append(time.perf_counter() - started)
+    return statistics.median(times), result
+
+
+async def main(args) -> None:
+    from database.db import Base, engine
+    from database.models import Invoice
+    from services.db_services import get_dashboard_stats
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all, tables=[Invoice.__table__])
+        await conn.run_sync(Base.metadata.create_all, tables=[Invoice.__table__])
+
+    owner, others = uuid.UUID(int=_USER_PREFIX), [uuid.UUID(int=_USER_PREFIX | i) for i in range(1, 21)]
+    print(f"{args.vendors} vendors, {args.currencies} currencies over {args.days} days; one user owns ~80% of the rows")
+    print(f"{'rows':>9}  {'user':<9} {'eight statements':>17} {'one statement':>14} {'speedup':>8}  same output")
+    seeded = 0
+    for rows in sorted(args.rows):
+        await seed(engine, seeded, rows, args, owner, others)
+        seeded = rows
+        for label, user_id in (("one user", owner), ("all users", None)):
+            old_seconds, old = await timed(eight_statements, user_id, args.repeat)
+            new_seconds, new = await timed(get_dashboard_stats, user_id, args.repeat)
+            print(
+                f"{rows:>9}  {label:<9} {old_seconds * 1000:>14.1f} ms {new_seconds * 1000:>11.1f} ms {old_seconds / new_seconds:>7.1f}x  "
+                f"{_comparable(old) == _comparable(new)}"
+            )
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--vendors", type=int, default=300)
+    parser.add_argument("--currencies", type=int, default=5)
+    parser.add_argument("--days", type=int, default=120)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--database-url", help="default: a SQLite file in a temp dir")
+    args = parser.parse_args()
+
+    # database.db reads DATABASE_URL at import time; services.indexer (imported by db_services) needs a key
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite+aiosqlite:///{tempfile.mkdtemp(prefix='bench-dashboard-')}/dashboard.db"
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ.setdefault("INDEXER_WORKERS", "0")
+    asyncio.run(main(args))
@@ -0,0 +1,111 @@
+# benchmarks/bench_hybrid_recall.py
+"""
+Identifier search: recall@5 and latency of hybrid (BM25 + vector, rank
+fusion) vs vector-only search, for the invoice numbers, VAT IDs and SKUs
+users type into /search.
+
+    python -m benchmarks.bench_hybrid_recall [--chunks 20000] [--users 5] [--queries 300]
+        [--embed-ms 150] [--backend chroma|faiss] [--path DIR]
+
+Each query is an identifier taken from a random invoice, searched by that
+invoice's owner, bare ("INV-20931", which hybrid sends to BM25 only) or in
+a phrase ("invoice INV-20931", which is fused). The relevant invoices are
+the owner's invoices whose text contains the identifier; recall@5 is the
+share of them (at most 5) found in the first 5 results.
+
+The corpus and index come from bench_search_latency (reuse one with
+--path). Embeddings are HashEmbeddings (character trigrams), which, like
+real models, blur near-identical numbers; --embed-ms adds a sleep per query
+embedding to stand in for the embedding API round trip that hybrid
+search skips for bare identifiers.
+"""
+import argparse
+import asyncio
+import logging
+import random
+import re
+import statistics
+import tempfile
+import time
+import warnings
+from collections import defaultdict
+
+from benchmarks.bench_search_latency import build_index, percentiles, use_index
+from benchmarks.corpus import HashEmbeddings
+
+KINDS = {
+    "invoice number": lambda invoice, rng: invoice.invoice_number,
+    "VAT ID": lambda invoice, rng: invoice.vat_id,
+    "SKU": lambda invoice, rng: rng.choice(invoice.skus),
+}
+PHRASES = {"invoice number": "invoice {}", "VAT ID": "VAT ID {}", "SKU": "order with item {}"}
+
+
+def make_queries(invoices: list, count: int, seed: int = 2) -> list[tuple[str, str, str, set]]:
+    """(kind, query, user_id, relevant invoice ids), bare and phrased in turn."""
+    by_user = defaultdict(list)
+    for invoice in invoices:
+        by_user[invoice.user_id].append(invoice)
+    rng = random.Random(seed)
+    queries = []
+    for i in range(count):
+        invoice = rng.choice(invoices)
+        kind = rng.choice(list(KINDS))
+        identifier = KINDS[kind](invoice, rng)
+        pattern = re.compile(rf"(?<![\w-]){re.escape(identifier)}(?![\w-])")
+        relevant = {other.id for other in by_user[invoice.user_id] if pattern.search(other.raw_text)}
+        query = identifier if i % 2 == 0 else PHRASES[kind].format(identifier)
+        queries.append((kind, query, invoice.user_id, relevant))
+    return queries
+
+
+async def run(queries: list, mode: str) -> dict:
+    from services.search import search_invoices
+
+    recall, latency = defaultdict(list), defaultdict(list)
+    for kind, query, user_id, relevant in queries:
+        style = "bare" if " " not in query else "phrase"
+        started = time.perf_counter()
+        page = await search_invoices(query, user_id, k=5, mode=mode)
+        latency[style].append(time.perf_counter() - started)
+        found = {result["invoice_id"] for result in page["results"]}
+        score = len(found & relevant) / min(len(relevant), 5)
+        recall[kind].append(score)
+        recall[style].append(score)
+        recall["all"].append(score)
+    return {"recall": {key: statistics.mean(values) for key, values in recall.items()}, "latency": latency}
+
+
+async def main(args) -> None:
+    invoices = await asyncio.to_thread(
+        build_index, args.path, args.chunks, args.users, HashEmbeddings(latency=args.embed_ms / 1000)
+    )
+    queries = make_queries(invoices, args.queries)
+    print(f"{len(queries)} identifier queries, recall@5 (query embedding: {args.embed_ms:.0f}ms)")
+    results = {mode: await run(queries, mode) for mode in ("vector", "hybrid")}
+
+    keys = list(KINDS) + ["bare", "phrase", "all"]
+    print(f"  {'':<16}" + "".join(f"{mode:>10}" for mode in results))
+    for key in keys:
+        print(f"  {key:<16}" + "".join(f"{result['recall'][key]:>10.3f}" for result in results.values()))
+    print("latency")
+    for mode, result in results.items():
+        for style in ("bare", "phrase"):
+            print(f"  {mode:<8} {style:<7} {percentiles(result['latency'][style])}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chunks", type=int, default=20_000)
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--embed-ms", type=float, default=150, help="simulated embedding API latency per query")
+    parser.add_argument("--backend", choices=("chroma", "faiss"), default="chroma")
+    parser.add_argument("--path", help="index directory to build in, or reuse (default: a temp dir)")
+    args = parser.parse_args()
+    args.path = args.path or tempfile.mkdtemp(prefix="bench-hybrid-")
+
+    use_index(args.path, args.backend)
+    warnings.filterwarnings("ignore", message="Relevance scores must be between 0 and 1")
+    logging.getLogger("chromadb.telemetry.product.posthog").setLevel(logging.CRITICAL)
+    asyncio.run(main(args))
@@ -0,0 +1,109 @@
+# benchmarks/bench_image_preprocess.py
+"""
+OCR wall time, peak memory and field accuracy for phone-photo receipts,
+before (the full-size photo straight into Tesseract) and after the
+preprocessing pipeline (services/image_preprocess.py + TESSERACT_CONFIG).
+
+    python -m benchmarks.bench_image_preprocess [--photos 10] [--dir receipts/]
+
+Needs the tesseract binary. Without --dir, synthetic 12MP receipt photos are
+used (benchmarks/corpus.py); their vendor, receipt number and total are the
+fields checked for accuracy. With --dir, only timing and memory are reported.
+Each variant runs in a fresh process and reports its peak RSS growth. The
+OCR_* env vars configure the "after" pipeline as they do in the app.
+"""
+import argparse
+import io
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+import pytesseract
+from PIL import Image
+
+from benchmarks.corpus import make_receipt_photo
+from services.image_preprocess import load_image_for_ocr, preprocess_for_ocr, TESSERACT_CONFIG
+
+
+def _before(data: bytes) -> tuple[str, float]:
+    img = Image.open(io.BytesIO(data))
+    return pytesseract.image_to_string(img), 0.0
+
+
+def _after(data: bytes) -> tuple[str, float]:
+    started = time.perf_counter()
+    img = preprocess_for_ocr(load_image_for_ocr(io.BytesIO(data)))
+    preprocess_seconds = time.perf_counter() - started
+    return pytesseract.image_to_string(img, config=TESSERACT_CONFIG), preprocess_seconds
+
+
+def _peak_rss_mb() -> float:
+    # VmHWM resets on exec; ru_maxrss would carry over the parent's peak on Linux
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def run_variant(name: str, photos: list) -> dict:
+    """Runs in a child process: OCR every photo, return timings and field hits."""
+    baseline_rss = _peak_rss_mb()
+    ocr = _before if name == "before" else _after
+    total = preprocess = 0.0
+    found = expected = 0
+    for data, fields in photos:
+        started = time.perf_counter()
+        text, preprocess_seconds = ocr(data)
+        total += time.perf_counter() - started
+        preprocess += preprocess_seconds
+        normalized = " ".join(text.upper().split())
+        expected += len(fields)
+        found += sum(value.upper() in normalized for value in fields.values())
+    return {
+        "seconds": total,
+        "preprocess_seconds": preprocess,
+        "accuracy": found / expected if expected else None,
+        "peak_rss_mb": _peak_rss_mb() - baseline_rss,
+        # Largest tesseract subprocess (never below this process's RSS when it forked)
+        "tesseract_peak_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024),
+    }
+
+
+def _load_dir(path: str) -> list:
+    photos = []
+    for name in sorted(os.listdir(path)):
+        if name.lower().endswith((".jpg", ".jpeg", ".png")):
+            with open(os.path.join(path, name), "rb") as f:
+                photos.append((f.read(), {}))
+    return photos
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--photos", type=int, default=10)
+    parser.add_argument("--dir", help="directory of real receipt photos")
+    args = parser.parse_args()
+
+    photos = _load_dir(args.dir) if args.dir else [make_receipt_photo(seed) for seed in range(args.photos)]
+    print(f"{len(photos)} photos, TESSERACT_CONFIG={TESSERACT_CONFIG!r}")
+
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    for name in ("before", "after"):
+        with context.Pool(1) as pool:
+            results[name] = result = pool.apply(run_variant, (name, photos))
+        accuracy = f"{result['accuracy']:.0%}" if result["accuracy"] is not None else "n/a"
+        print(
+            f"{name:<7} {result['seconds'] / len(photos):>6.2f} s/photo"
+            f"   (preprocess {result['preprocess_seconds'] / len(photos):.2f})"
+            f"   peak RSS +{result['peak_rss_mb']:>5.1f} MB   tesseract {result['tesseract_peak_rss_mb']:>6.1f} MB"
+            f"   fields found {accuracy}"
+        )
+    print(f"speedup {results['before']['seconds'] / results['after']['seconds']:.1f}x")
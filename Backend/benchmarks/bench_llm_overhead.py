@@ -0,0 +1,120 @@
+# benchmarks/bench_llm_overhead.py
+"""
+Per-request client overhead of an LLM call against a local fake
+OpenAI-compatible server: a new ChatOpenAI + extraction chain per request
+(what extract_invoice_data used to do) vs the long-lived pooled provider
+(services/llm_provider.py).
+
+    python -m benchmarks.bench_llm_overhead [--calls 200] [--server-latency 0]
+
+The fake server answers instantly (or after --server-latency seconds), so the
+latency left over is client-side: building the client and chain, and
+connection setup. It also counts the TCP connections each variant opened.
+It speaks plain HTTP, so the TLS handshakes the pool saves against a real
+provider are not included: real savings are larger.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import threading
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+import uvicorn
+from fastapi import FastAPI, Request
+from langchain_openai import ChatOpenAI
+
+from langchain_components.chains import build_async_extraction_chain
+from services.llm_provider import get_llm_provider
+
+MODEL = "gpt-4o-mini"
+INVOICE_TEXT = "ACME Supplies Ltd\nInvoice No: INV-1001\nDate: 2025-03-14\nTotal: $108.00\n"
+ANSWER = {
+    "vendor_name": "ACME Supplies Ltd", "invoice_number": "INV-1001", "invoice_date": "2025-03-14",
+    "total_amount": 108.0, "tax_amount": 8.0, "currency": "USD",
+}
+
+fake = FastAPI()
+fake.state.latency = 0.0
+fake.state.connections = set()
+
+
+@fake.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    fake.state.connections.add(tuple(request.scope["client"]))
+    if fake.state.latency:
+        await asyncio.sleep(fake.state.latency)
+    message = {"role": "assistant", "content": json.dumps(ANSWER)}
+    if body.get("tools"):
+        # function-calling structured output
+        message = {"role": "assistant", "content": None, "tool_calls": [{
+            "id": "call_0", "type": "function",
+            "function": {"name": body["tools"][0]["function"]["name"], "arguments": json.dumps(ANSWER)},
+        }]}
+    return {
+        "id": "chatcmpl-bench", "object": "chat.completion", "created": int(time.time()), "model": body["model"],
+        "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120},
+    }
+
+
+def _start_fake_server() -> tuple[uvicorn.Server, str]:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(fake, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, f"http://127.0.0.1:{port}/v1"
+
+
+async def per_request_client(base_url: str):
+    llm = ChatOpenAI(model=MODEL, base_url=base_url, max_retries=0)
+    return await build_async_extraction_chain(llm)(INVOICE_TEXT)
+
+
+async def pooled_provider(base_url: str):
+    return await get_llm_provider().get_extraction_chain("openai", MODEL)(INVOICE_TEXT)
+
+
+async def _measure(label: str, call, base_url: str, calls: int) -> float:
+    await call(base_url)  # warm-up: imports, first chain build
+    fake.state.connections.clear()
+    latencies = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        await call(base_url)
+        latencies.append(time.perf_counter() - started)
+    p50 = statistics.median(latencies) * 1000
+    p95 = statistics.quantiles(latencies, n=20)[-1] * 1000
+    print(f"{label:<12} p50 {p50:>7.2f} ms   p95 {p95:>7.2f} ms   connections opened {len(fake.state.connections)}")
+    return p50
+
+
+async def main(calls: int, base_url: str) -> None:
+    before = await _measure("per-request", per_request_client, base_url, calls)
+    after = await _measure("pooled", pooled_provider, base_url, calls)
+    print(f"client overhead saved per call (p50): {before - after:.2f} ms")
+    await get_llm_provider().aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--server-latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    fake.state.latency = args.server_latency
+    server, base_url = _start_fake_server()
+    # The pooled provider reads the endpoint from the environment, like in the app
+    os.environ["OPENAI_BASE_URL"] = base_url
+    try:
+        asyncio.run(main(args.calls, base_url))
+    finally:
+        server.should_exit = True
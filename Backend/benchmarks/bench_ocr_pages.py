@@ -0,0 +1,62 @@
+# benchmarks/bench_ocr_pages.py
+"""
+Pages/sec OCRing a scanned PDF: page-parallel OCR (ocr_services.ocr_pdf_pages)
+vs the previous implementation, which rasterized the whole document up front
+(convert_from_path) and ran Tesseract on one page after the other.
+
+    python -m benchmarks.bench_ocr_pages [--pages 30] [--pdf scanned.pdf]
+
+Needs the tesseract binary. Without --pdf a synthetic scanned invoice is used
+(benchmarks/corpus.py). The baseline rasterizes with PyMuPDF at OCR_DPI,
+which is what convert_from_path did with poppler, so only the scheduling
+differs. Peak RSS is a process high-water mark, so the parallel run goes first.
+"""
+import argparse
+import resource
+import sys
+import time
+
+import pytesseract
+
+from benchmarks.corpus import make_pdf
+from services.ocr_services import ocr_pdf_pages, _open_pdf, _render_page, OCR_WORKERS, OCR_MAX_PAGES_IN_MEMORY
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def sequential_ocr(source: bytes) -> str:
+    with _open_pdf(source) as doc:
+        images = [_render_page(page) for page in doc]
+    text = ""
+    for img in images:
+        text += pytesseract.image_to_string(img)
+    return text
+
+
+def _run(label: str, extract, source: bytes, pages: int) -> None:
+    started = time.perf_counter()
+    text = extract(source)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<10} {pages / elapsed:>6.2f} pages/s   {elapsed:>7.2f}s   {len(text):>7} chars   peak RSS {_peak_rss_mb():>7.1f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pages", type=int, default=30)
+    parser.add_argument("--pdf", help="scanned PDF to use instead of the synthetic one")
+    args = parser.parse_args()
+
+    if args.pdf:
+        with open(args.pdf, "rb") as f:
+            source = f.read()
+    else:
+        source = make_pdf(scanned_pages=args.pages)
+    with _open_pdf(source) as doc:
+        pages = doc.page_count
+
+    print(f"{pages} scanned pages, {OCR_WORKERS} OCR workers, {OCR_MAX_PAGES_IN_MEMORY} pages in memory")
+    _run("parallel", ocr_pdf_pages, source, pages)
+    _run("sequential", sequential_ocr, source, pages)
@@ -0,0 +1,62 @@
+# benchmarks/bench_pdf_extraction.py
+"""
+PDF text extraction speed: the PyMuPDF hybrid engine (ocr_services.extract_pdf_text)
+vs pdfminer.six's extract_text, which the live path used before.
+
+    python -m benchmarks.bench_pdf_extraction [--pages 20] [--repeat 5] [--pdf invoice.pdf ...]
+
+Digital PDFs compare raw extraction speed. With the tesseract binary on the
+PATH a mixed PDF (digital cover + scanned receipts) is also run, to show how
+much text each engine recovers from it: pdfminer never OCRs.
+"""
+import argparse
+import io
+import shutil
+import time
+
+from pdfminer.high_level import extract_text as pdfminer_extract_text
+
+from benchmarks.corpus import make_pdf
+from services.ocr_services import extract_pdf_text, _open_pdf
+
+
+def _pdfminer(source: bytes) -> str:
+    return pdfminer_extract_text(io.BytesIO(source))
+
+
+def _time(extract, source: bytes, repeat: int) -> tuple[float, str]:
+    best, text = float("inf"), ""
+    for _ in range(repeat):
+        started = time.perf_counter()
+        text = extract(source)
+        best = min(best, time.perf_counter() - started)
+    return best, text
+
+
+def compare(label: str, source: bytes, repeat: int) -> None:
+    with _open_pdf(source) as doc:
+        pages = doc.page_count
+    print(f"{label} ({pages} pages, best of {repeat})")
+    results = {}
+    for name, extract in (("pymupdf", extract_pdf_text), ("pdfminer", _pdfminer)):
+        seconds, text = _time(extract, source, repeat)
+        results[name] = seconds
+        print(f"  {name:<9} {pages / seconds:>8.1f} pages/s   {seconds * 1000:>8.1f} ms   {len(text.strip()):>7} chars")
+    print(f"  speedup   {results['pdfminer'] / results['pymupdf']:.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--pdf", nargs="*", default=[], help="real PDFs to compare as well")
+    args = parser.parse_args()
+
+    compare("digital", make_pdf(digital_pages=args.pages), args.repeat)
+    if shutil.which("tesseract"):
+        compare("mixed", make_pdf(digital_pages=1, scanned_pages=3), 1)
+    else:
+        print("tesseract not found: skipping the mixed PDF")
+    for path in args.pdf:
+        with open(path, "rb") as f:
+            compare(path, f.read(), args.repeat)
@@ -0,0 +1,103 @@
+# benchmarks/bench_prompt_compaction.py
+"""
+Prompt compaction (services/prompt_compactor.py) on documents of varied
+length and layout: tokens saved, compaction latency, and whether the
+compacted text still carries the same invoice fields as the full text.
+
+    python -m benchmarks.bench_prompt_compaction [--docs 50] [--budget 1500] [--model gpt-4o-mini]
+
+Layouts (benchmarks/corpus.py):
+    receipt        till receipt, unlabelled columns (under budget: sent untouched)
+    invoice        VAT invoice with an SKU table and a currency code (15-45 rows)
+    long invoice   one page, 150-600 line items
+    statement      2-20 pages, each with a header, 40 items, totals and terms
+
+Agreement compares services/rule_extractor.extract_fields on the full and
+on the compacted text, field by field: the rules key on the same labels and
+values the LLM needs, so a field the rules read differently after
+compaction is one the LLM could no longer see. The LLM itself is not
+called. Latency is the compact_prompt_text call, token counting included.
+"""
+import argparse
+import random
+import statistics
+import time
+from collections import defaultdict
+
+from benchmarks.corpus import invoice_lines, receipt_lines, search_invoice
+from services.prompt_compactor import compact_prompt_text, PROMPT_TOKEN_BUDGET
+from services.rule_extractor import ALL_FIELDS, extract_fields
+from services.text_constants import PAGE_SEPARATOR
+
+TERMS = [
+    "Terms and conditions: payment is due within 30 days of the invoice date.",
+    "Late payments incur interest of 1.5% per month; liability is limited to the invoice amount.",
+    "Thank you for your business!",
+]
+
+LAYOUTS = {
+    "receipt": lambda n, rng: "\n".join(receipt_lines(n)[0]),
+    "invoice": lambda n, rng: search_invoice(n, users=1).raw_text,
+    "long invoice": lambda n, rng: "\n".join(invoice_lines(0, lines=rng.randint(150, 600), seed=n)),
+    "statement": lambda n, rng: PAGE_SEPARATOR.join(
+        "\n".join(invoice_lines(page, seed=n) + [""] + TERMS) for page in range(rng.randint(2, 20))
+    ),
+}
+
+
+def percentiles(samples: list[float]) -> str:
+    ms = sorted(sample * 1000 for sample in samples)
+    return f"p50 {statistics.median(ms):>6.2f} ms   p95 {ms[min(int(len(ms) * 0.95), len(ms) - 1)]:>6.2f} ms"
+
+
+def run(layout: str, docs: int, budget: int, model: str) -> dict:
+    rng = random.Random(layout)
+    original, compacted, latencies = [], [], []
+    agree, present = defaultdict(int), defaultdict(int)
+    for n in range(docs):
+        text = LAYOUTS[layout](n, rng)
+        started = time.perf_counter()
+        short, stats = compact_prompt_text(text, budget=budget, model=model)
+        latencies.append(time.perf_counter() - started)
+        original.append(stats["original_tokens"])
+        compacted.append(stats["compacted_tokens"])
+
+        full_fields, short_fields = extract_fields(text), extract_fields(short)
+        for field in ALL_FIELDS:
+            expected = full_fields.get(field, {}).get("value")
+            if expected is None:
+                continue
+            present[field] += 1
+            agree[field] += short_fields.get(field, {}).get("value") == expected
+    return {"original": original, "compacted": compacted, "latencies": latencies, "agree": agree, "present": present}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--docs", type=int, default=50, help="documents per layout")
+    parser.add_argument("--budget", type=int, default=PROMPT_TOKEN_BUDGET)
+    parser.add_argument("--model", default=None, help="model the tokens are counted for (default: o200k_base)")
+    args = parser.parse_args()
+
+    compact_prompt_text("warm-up " * 10, budget=args.budget, model=args.model)  # load the BPE file
+    print(f"{args.docs} documents per layout, budget {args.budget} tokens")
+    totals = {"agree": defaultdict(int), "present": defaultdict(int)}
+    for layout in LAYOUTS:
+        result = run(layout, args.docs, args.budget, args.model)
+        original, compacted = sum(result["original"]), sum(result["compacted"])
+        checked = sum(result["present"].values())
+        agreed = sum(result["agree"].values())
+        print(
+            f"  {layout:<13} tokens {statistics.mean(result['original']):>8.0f} -> {statistics.mean(result['compacted']):>6.0f} (mean)"
+            f"   saved {100 * (original - compacted) / original:>5.1f}%   {percentiles(result['latencies'])}"
+            f"   fields agree {agreed}/{checked}"
+        )
+        for field in ALL_FIELDS:
+            totals["agree"][field] += result["agree"][field]
+            totals["present"][field] += result["present"][field]
+
+    print("Per-field agreement (full vs compacted text, fields the rules found in the full text):")
+    for field in ALL_FIELDS:
+        present = totals["present"][field]
+        share = f"{100 * totals['agree'][field] / present:5.1f}%" if present else "    -"
+        print(f"  {field:<15} {share}  ({totals['agree'][field]}/{present})")
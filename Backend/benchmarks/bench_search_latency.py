@@ -0,0 +1,147 @@
+# benchmarks/bench_search_latency.py
+"""
+/search latency on a large index: 100k+ chunks spread over many tenants,
+queried through services/search.py with the user_id filter and the vendor,
+date-range and currency filters, and for the second page of results.
+
+    python -m benchmarks.bench_search_latency [--chunks 100000] [--users 50] [--queries 200]
+        [--backend chroma|faiss] [--path DIR] [--modes vector hybrid lexical]
+
+The index is built from the synthetic search corpus (benchmarks/corpus.py):
+invoices chunked by the real chunker and written with
+vectorstore.index_invoices, embedded offline by HashEmbeddings. Building
+100k chunks takes minutes, so pass --path to keep the index and reuse it on
+the next run (a temp dir is used otherwise). With --backend faiss the index
+is compacted (trained) after the build.
+
+Query embeddings are computed locally and cost next to nothing, so the
+numbers are the index lookups and the search pipeline (filters inside the
+index, top-k growth, collapsing chunks into invoices). Vector and hybrid
+queries pay the embedding API round trip on top, typically 100–300ms.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import statistics
+import tempfile
+import time
+import warnings
+from datetime import timedelta
+
+from benchmarks.corpus import HashEmbeddings, PRODUCTS, search_invoice
+
+SCENARIOS = {
+    "user only": lambda invoice: {},
+    "+ vendor": lambda invoice: {"vendor": invoice.vendor_name},
+    "+ date range (90 days)": lambda invoice: {
+        "date_from": invoice.invoice_date - timedelta(days=45), "date_to": invoice.invoice_date + timedelta(days=45),
+    },
+    "+ currency": lambda invoice: {"currency": invoice.currency},
+}
+
+
+def use_index(path: str, backend: str) -> None:
+    """Point the index env vars at `path`. Call before anything imports services."""
+    os.makedirs(path, exist_ok=True)
+    os.environ.update({
+        "VECTOR_BACKEND": backend,
+        "CHROMA_HOST": "",
+        "CHROMA_PATH": os.path.join(path, "chroma"),
+        "FAISS_PATH": os.path.join(path, "faiss"),
+        "LEXICAL_INDEX_PATH": os.path.join(path, "lexical.db"),
+        "CHUNK_MAX_TOKENS": os.environ.get("CHUNK_MAX_TOKENS", "128"),  # ~5 chunks per invoice
+        "ANONYMIZED_TELEMETRY": "False",
+    })
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{path}/unused.db")  # services.indexer imports the engine
+
+
+def build_index(path: str, chunks: int, users: int, embeddings, seed: int = 0, batch_size: int = 200) -> list:
+    """Index invoices until there are `chunks` chunks (or reuse the index in `path`); returns the invoices."""
+    from services import vectorstore
+    from services.indexer import invoice_index_item
+
+    vectorstore._embeddings = embeddings
+    manifest_path = os.path.join(path, "corpus.json")
+    wanted = {"chunks": chunks, "users": users, "seed": seed, "backend": vectorstore.VECTOR_BACKEND}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if {key: manifest.get(key) for key in wanted} == wanted:
+            vectorstore.warm_vectorstore()
+            print(f"Reusing the index in {path}: {manifest['chunks']} chunks, {manifest['invoices']} invoices")
+            return [search_invoice(n, users, seed) for n in range(manifest["invoices"])]
+        vectorstore.reset_vectorstore()
+
+    started = time.perf_counter()
+    invoices, written = [], 0
+    while written < chunks:
+        batch = [search_invoice(len(invoices) + i, users, seed) for i in range(batch_size)]
+        invoices += batch
+        written += vectorstore.index_invoices([invoice_index_item(invoice) for invoice in batch])["chunks"]
+    elapsed = time.perf_counter() - started
+    print(f"Indexed {written} chunks ({len(invoices)} invoices, {users} users) in {elapsed:.1f}s, {written / elapsed:.0f} chunks/s")
+
+    if vectorstore.VECTOR_BACKEND == "faiss":
+        from services import faiss_store
+
+        print("Compacted:", faiss_store.compact())
+    with open(manifest_path, "w") as f:
+        json.dump({**wanted, "chunks": chunks, "invoices": len(invoices)}, f)
+    return invoices
+
+
+def percentiles(samples: list[float]) -> str:
+    ms = sorted(sample * 1000 for sample in samples)
+    p95, p99 = (ms[min(int(len(ms) * q), len(ms) - 1)] for q in (0.95, 0.99))
+    return f"p50 {statistics.median(ms):>7.1f} ms   p95 {p95:>7.1f} ms   p99 {p99:>7.1f} ms"
+
+
+async def time_searches(invoices: list, mode: str, queries: int, extra_filters, page: int = 1, seed: int = 1) -> list[float]:
+    """Latency of `queries` searches, each by the owner of a random invoice; `page` > 1 follows cursors."""
+    from services.search import search_invoices
+
+    rng = random.Random(seed)
+    samples = []
+    for _ in range(queries):
+        invoice = rng.choice(invoices)
+        query = f"{rng.choice(PRODUCTS)} {rng.choice(PRODUCTS)}"
+        cursor = None
+        for _ in range(page - 1):
+            cursor = (await search_invoices(query, invoice.user_id, k=10, mode=mode, **extra_filters(invoice)))["next_cursor"]
+        started = time.perf_counter()
+        await search_invoices(query, invoice.user_id, k=10, cursor=cursor, mode=mode, **extra_filters(invoice))
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+async def main(args) -> None:
+    invoices = await asyncio.to_thread(build_index, args.path, args.chunks, args.users, HashEmbeddings())
+    print(f"{args.queries} queries per row, k=10")
+    for mode in args.modes:
+        for name, extra_filters in SCENARIOS.items():
+            samples = await time_searches(invoices, mode, args.queries, extra_filters)
+            print(f"  {mode:<8} {name:<24} {percentiles(samples)}")
+        samples = await time_searches(invoices, mode, args.queries, SCENARIOS["user only"], page=2)
+        print(f"  {mode:<8} {'page 2 (cursor)':<24} {percentiles(samples)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--backend", choices=("chroma", "faiss"), default="chroma")
+    parser.add_argument("--path", help="index directory to build in, or reuse (default: a temp dir)")
+    parser.add_argument("--modes", nargs="+", choices=("vector", "hybrid", "lexical"), default=["vector", "hybrid", "lexical"])
+    args = parser.parse_args()
+    args.path = args.path or tempfile.mkdtemp(prefix="bench-search-")
+
+    use_index(args.path, args.backend)
+    # Chroma's L2 distances map to "relevance" below 0 for far-away chunks; only the ranking matters here
+    warnings.filterwarnings("ignore", message="Relevance scores must be between 0 and 1")
+    logging.getLogger("chromadb.telemetry.product.posthog").setLevel(logging.CRITICAL)
+    asyncio.run(main(args))
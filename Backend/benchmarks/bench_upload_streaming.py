@@ -0,0 +1,85 @@
+# benchmarks/bench_upload_streaming.py
+"""
+Peak memory of one upload: streamed to disk (services/storage.py) vs read
+into memory with `await file.read()`, as /api/upload used to do.
+
+    python -m benchmarks.bench_upload_streaming [--size-mb 200]
+
+Reports the Python heap peak (tracemalloc) of each approach and the process
+peak RSS after each (ru_maxrss is a high-water mark, so the streamed run goes
+first). The streamed peak should stay around one UPLOAD_CHUNK_SIZE chunk
+however large the file is.
+"""
+import argparse
+import asyncio
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from starlette.datastructures import UploadFile
+
+from services.storage import stream_upload_to_temp, UPLOAD_CHUNK_SIZE
+
+
+def _peak_rss_kb() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak  # bytes on macOS, KB elsewhere
+
+
+def _make_source(size: int) -> str:
+    fd, path = tempfile.mkstemp(prefix="bench-upload-", suffix=".pdf")
+    block = os.urandom(1024 * 1024)
+    with os.fdopen(fd, "wb") as f:
+        for _ in range(size // len(block)):
+            f.write(block)
+    return path
+
+
+async def _streamed(path: str, size: int) -> None:
+    with open(path, "rb") as f:
+        temp_path, _, _ = await stream_upload_to_temp(UploadFile(f, filename="big.pdf"), ".pdf", max_size=size)
+    os.remove(temp_path)
+
+
+async def _in_memory(path: str, size: int) -> None:
+    with open(path, "rb") as f:
+        contents = await UploadFile(f, filename="big.pdf").read()
+    fd, temp_path = tempfile.mkstemp(suffix=".pdf")
+    with os.fdopen(fd, "wb") as out:
+        out.write(contents)
+    os.remove(temp_path)
+
+
+async def _traced(run, path: str, size: int) -> tuple[int, float]:
+    # Traced from inside the loop so the event loop and thread pool setup don't count
+    tracemalloc.start()
+    started = time.perf_counter()
+    await run(path, size)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, elapsed
+
+
+def _measure(label: str, run, path: str, size: int) -> None:
+    peak, elapsed = asyncio.run(_traced(run, path, size))
+    print(f"{label:<10} heap peak {peak / 1024:>10.0f} KB   process peak RSS {_peak_rss_kb() / 1024:>7.1f} MB   {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size-mb", type=int, default=200)
+    args = parser.parse_args()
+
+    size = args.size_mb * 1024 * 1024
+    path = _make_source(size)
+    try:
+        asyncio.run(_streamed(path, size))  # warm-up: thread pool, lazy imports
+        print(f"{args.size_mb} MB upload, {UPLOAD_CHUNK_SIZE // 1024} KB chunks")
+        _measure("streamed", _streamed, path, size)
+        _measure("in-memory", _in_memory, path, size)
+    finally:
+        os.remove(path)
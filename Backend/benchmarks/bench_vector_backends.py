@@ -0,0 +1,144 @@
+# benchmarks/bench_vector_backends.py
+"""
+FAISS vs Chroma on the same chunks: recall@10, search latency, memory and
+disk, for the Chroma store and one or more FAISS index specs.
+
+    python -m benchmarks.bench_vector_backends [--chunks 100000] [--users 20] [--queries 200]
+        [--faiss-specs IVF1024,PQ64 HNSW32] [--path DIR]
+
+Every backend indexes the synthetic search corpus (benchmarks/corpus.py,
+built by bench_search_latency.build_index; FAISS is compacted once at the
+end) in its own process, since the backend is picked at import time, and
+answers the same queries through vectorstore.search_chunks, scoped to one
+tenant (and, for half of them, one vendor). Recall@10 is measured against
+exact cosine top-10 among the chunks matching the same filter.
+
+Memory is read from /proc after the queries: RssAnon is private to the
+process (Chroma's HNSW index, FAISS's delta matrix and caches), RssFile is
+mapped file pages, which for the memory-mapped FAISS index are shared by
+every worker on the host. Linux only.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.corpus import HashEmbeddings, PRODUCTS, search_invoice
+
+
+def _proc_status() -> dict:
+    with open("/proc/self/status") as f:
+        return {line.split(":")[0]: int(line.split()[1]) // 1024 for line in f if line.startswith(("VmRSS", "RssAnon", "RssFile"))}
+
+
+def _disk_mb(path: str) -> float:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names) / 1e6
+
+
+def run_backend(backend: str, spec: str, path: str, args, results) -> None:
+    """In a fresh process: build (or reuse) the index, run the queries, report to `results`."""
+    from benchmarks.bench_search_latency import use_index
+
+    use_index(path, backend)
+    os.environ.update(FAISS_INDEX=spec or "", FAISS_COMPACT_DELTA="0")  # build_index compacts once, at the end
+    import logging
+    import warnings
+
+    warnings.filterwarnings("ignore", message="Relevance scores must be between 0 and 1")
+    logging.getLogger("chromadb.telemetry.product.posthog").setLevel(logging.CRITICAL)
+
+    from benchmarks.bench_search_latency import build_index
+    from services.vectorstore import search_chunks
+
+    started = time.perf_counter()
+    invoices = build_index(path, args.chunks, args.users, HashEmbeddings())
+    build_seconds = time.perf_counter() - started
+
+    queries = make_queries(invoices, args.queries)
+
+    latencies, found = [], []
+    for user_id, text, filters in queries:
+        begin = time.perf_counter()
+        hits = search_chunks(text, k=10, filters={"user_id": user_id, **filters})
+        latencies.append(time.perf_counter() - begin)
+        found.append([f"{doc.metadata['invoice_id']}::{doc.metadata['chunk_index']}" for doc, _ in hits])
+    results.put({"invoices": len(invoices), "queries": queries, "build_seconds": build_seconds, "latencies": latencies, "found": found, "memory": _proc_status(), "disk_mb": _disk_mb(path)})
+
+
+def exact_top10(invoices: list, queries: list) -> list[set]:
+    """Ground truth: exact cosine top-10 among the chunks matching each query's filter."""
+    from services.indexer import invoice_index_item
+
+    embeddings = HashEmbeddings()
+    chunk_ids, users, vendors, texts = [], [], [], []
+    for invoice in invoices:
+        invoice_id, chunks, meta = invoice_index_item(invoice)
+        for i, chunk in enumerate(chunks):
+            chunk_ids.append(f"{invoice_id}::{i}")
+            users.append(meta["user_id"])
+            vendors.append(meta["vendor"])
+            texts.append(chunk.text)
+    matrix = np.array(embeddings.embed_documents(texts), dtype=np.float32)
+    chunk_ids, users, vendors = np.array(chunk_ids), np.array(users), np.array(vendors)
+
+    truth = []
+    for user_id, text, filters in queries:
+        mask = users == user_id
+        if filters.get("vendor"):
+            mask &= vendors == filters["vendor"].strip().lower()
+        scores = matrix[mask] @ np.array(embeddings.embed_query(text), dtype=np.float32)
+        best = np.argsort(-scores)[:10]
+        truth.append(set(chunk_ids[mask][best]))
+    return truth
+
+
+def make_queries(invoices: list, count: int, seed: int = 3) -> list[tuple[str, str, dict]]:
+    rng = random.Random(seed)
+    queries = []
+    for i in range(count):
+        invoice = rng.choice(invoices)
+        filters = {"vendor": invoice.vendor_name} if i % 2 else {}
+        queries.append((invoice.user_id, f"{rng.choice(PRODUCTS)} {rng.choice(PRODUCTS)}", filters))
+    return queries
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--faiss-specs", nargs="+", default=["IVF1024,PQ64", "HNSW32"])
+    parser.add_argument("--path", help="directory for the indexes, reused across runs (default: a temp dir)")
+    args = parser.parse_args()
+    args.path = args.path or tempfile.mkdtemp(prefix="bench-backends-")
+
+    context = multiprocessing.get_context("spawn")
+    runs = [("chroma", None)] + [("faiss", spec) for spec in args.faiss_specs]
+    truth = None
+    for backend, spec in runs:
+        label = backend if spec is None else f"faiss {spec}"
+        results = context.Queue()
+        path = os.path.join(args.path, label.replace(" ", "-").replace(",", "_"))
+        process = context.Process(target=run_backend, args=(backend, spec, path, args, results))
+        process.start()
+        result = results.get()
+        process.join()
+        if truth is None:
+            # The corpus is deterministic: every run indexes the same invoices and asks the same queries
+            invoices = [search_invoice(n, args.users) for n in range(result["invoices"])]
+            truth = exact_top10(invoices, result["queries"])
+            print(f"{args.chunks} chunks, {len(invoices)} invoices, {args.users} users, {args.queries} queries (half also filtered by vendor)")
+
+        recall = statistics.mean(len(set(found) & expected) / max(len(expected), 1) for found, expected in zip(result["found"], truth))
+        ms = sorted(latency * 1000 for latency in result["latencies"])
+        memory = result["memory"]
+        print(
+            f"  {label:<20} recall@10 {recall:.3f}   p50 {statistics.median(ms):>6.1f} ms   p95 {ms[int(len(ms) * 0.95)]:>6.1f} ms   "
+            f"RSS {memory['VmRSS']:>5} MB (anon {memory['RssAnon']:>5}, file {memory['RssFile']:>5})   "
+            f"disk {result['disk_mb']:>6.0f} MB   build {result['build_seconds']:>5.0f}s"
+        )
@@ -0,0 +1,194 @@
+# benchmarks/corpus.py
+"""
+Synthetic invoices for the benchmarks, so they run without a private corpus:
+scanned PDFs (every page a bitmap), digital PDFs (text layer only) and mixed
+ones (a digital cover page with scanned receipts attached), receipt photos,
+and invoice texts (with their invoice numbers, VAT IDs and SKUs) for the
+search indexes, plus an offline embedding model to index them with.
+"""
+import io
+import random
+import time
+import uuid
+import zlib
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+import fitz  # PyMuPDF
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+PAGE_DPI = 200
+A4_POINTS = (595, 842)
+
+VENDORS = ["ACME Freight Ltd", "Northwind Traders", "Globex Logistics", "Initech Supplies"]
+
+
+def invoice_lines(page_no: int, lines: int = 40, seed: int = 0) -> list[str]:
+    rng = random.Random(seed * 1000 + page_no)
+    vendor = rng.choice(VENDORS)
+    out = [vendor, f"Invoice Number: INV-{seed:03d}-{page_no:04d}", "Invoice Date: 2024-03-15", ""]
+    subtotal = 0.0
+    for i in range(lines):
+        qty, price = rng.randint(1, 20), rng.randint(100, 50000) / 100
+        subtotal += qty * price
+        out.append(f"Item {i + 1:03d}  Freight handling zone {rng.randint(1, 9)}   {qty} x ${price:,.2f}   ${qty * price:,.2f}")
+    tax = round(subtotal * 0.08, 2)
+    out += ["", f"Subtotal: ${subtotal:,.2f}", f"Sales Tax (8%): ${tax:,.2f}", f"Total Due: ${subtotal + tax:,.2f}"]
+    return out
+
+
+def render_page_image(lines: list[str], dpi: int = PAGE_DPI) -> Image.Image:
+    """A page of text as a grayscale bitmap, like a flatbed scan."""
+    width, height = (round(side / 72 * dpi) for side in A4_POINTS)
+    img = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(img)
+    font = ImageFont.load_default(size=round(dpi / 72 * 10))
+    y = round(dpi / 2)
+    for line in lines:
+        draw.text((round(dpi / 2), y), line, fill=0, font=font)
+        y += round(dpi / 72 * 14)
+    return img
+
+
+def _add_scanned_page(doc: fitz.Document, lines: list[str]) -> None:
+    buf = io.BytesIO()
+    render_page_image(lines).save(buf, format="PNG")
+    page = doc.new_page(width=A4_POINTS[0], height=A4_POINTS[1])
+    page.insert_image(page.rect, stream=buf.getvalue())
+
+
+def _add_digital_page(doc: fitz.Document, lines: list[str]) -> None:
+    page = doc.new_page(width=A4_POINTS[0], height=A4_POINTS[1])
+    page.insert_text((36, 36), "\n".join(lines), fontsize=10)
+
+
+def make_pdf(scanned_pages: int = 0, digital_pages: int = 0, seed: int = 0) -> bytes:
+    """Digital pages first (the cover), then the scanned ones."""
+    with fitz.open() as doc:
+        for n in range(digital_pages):
+            _add_digital_page(doc, invoice_lines(n, seed=seed))
+        for n in range(digital_pages, digital_pages + scanned_pages):
+            _add_scanned_page(doc, invoice_lines(n, seed=seed))
+        return doc.tobytes(garbage=3, deflate=True)
+
+
+def receipt_lines(seed: int = 0, rng: random.Random = None) -> tuple[list[str], dict]:
+    """A till receipt's lines (unlabelled columns, upper case) and its expected fields."""
+    rng = rng or random.Random(seed)
+    vendor = rng.choice(VENDORS)
+    items = [(f"ITEM {i + 1:02d}", rng.randint(100, 9999) / 100) for i in range(rng.randint(6, 14))]
+    subtotal = round(sum(price for _, price in items), 2)
+    tax = round(subtotal * 0.08, 2)
+    total = round(subtotal + tax, 2)
+    lines = [vendor.upper(), f"RECEIPT #{seed:05d}", "03/15/2024", ""]
+    lines += [f"{name:<24}{price:>10.2f}" for name, price in items]
+    lines += ["", f"{'SUBTOTAL':<24}{subtotal:>10.2f}", f"{'TAX 8%':<24}{tax:>10.2f}", f"{'TOTAL':<24}{total:>10.2f}"]
+    return lines, {"vendor": vendor.upper(), "receipt": f"#{seed:05d}", "total": f"{total:.2f}"}
+
+
+def make_receipt_photo(seed: int = 0, size: tuple = (3024, 4032)) -> tuple[bytes, dict]:
+    """
+    A 12MP portrait phone photo of a receipt: slightly rotated paper filling
+    most of the frame on a darker table, saved as a colour JPEG. Returns (jpeg_bytes, expected_fields).
+    """
+    rng = random.Random(seed)
+    lines, expected = receipt_lines(seed, rng)
+
+    line_height = int(size[1] * 0.8 / len(lines))
+    font = ImageFont.load_default(size=int(line_height * 0.7))
+    paper = Image.new("RGB", (int(size[0] * 0.75), line_height * (len(lines) + 2)), (246, 244, 236))
+    draw = ImageDraw.Draw(paper)
+    for i, line in enumerate(lines):
+        draw.text((line_height, line_height * (i + 1)), line, fill=(30, 30, 30), font=font)
+    paper = paper.rotate(rng.uniform(-4, 4), resample=Image.BICUBIC, expand=True, fillcolor=(92, 70, 52))
+
+    photo = Image.new("RGB", size, (92, 70, 52))
+    photo.paste(paper, ((size[0] - paper.width) // 2, max((size[1] - paper.height) // 2, 0)))
+    buf = io.BytesIO()
+    photo.save(buf, format="JPEG", quality=90, dpi=(72, 72))
+    return buf.getvalue(), expected
+
+
+# Search corpus
+PRODUCTS = [
+    "freight handling", "pallet storage", "customs clearance", "office chairs", "laser printer toner",
+    "cloud hosting", "software licence", "consulting hours", "cleaning services", "fuel surcharge",
+    "packaging material", "courier delivery", "network switch", "maintenance contract", "catering",
+]
+CURRENCIES = ["USD", "EUR", "GBP"]
+
+
+def search_invoice(n: int, users: int, seed: int = 0) -> SimpleNamespace:
+    """
+    Invoice number `n` of the search corpus, shaped like the rows the indexer
+    reads (id, user_id, filename, raw_text, vendor_name, invoice_date, currency),
+    plus the identifiers in its text: invoice_number, vat_id and skus.
+    """
+    rng = random.Random(seed * 1_000_003 + n)
+    vendor = rng.choice(VENDORS)
+    invoice_number = f"INV-{20000 + n}"
+    vat_id = f"DE{rng.randint(100000000, 999999999)}"
+    invoice_date = date(2023, 1, 1) + timedelta(days=rng.randint(0, 729))
+    currency = rng.choice(CURRENCIES)
+    lines = [vendor, f"VAT ID: {vat_id}", f"Invoice Number: {invoice_number}", f"Invoice Date: {invoice_date:%Y-%m-%d}", ""]
+    skus, subtotal = [], 0.0
+    for _ in range(rng.randint(15, 45)):
+        sku = f"SKU-{rng.randint(10000, 99999)}"
+        qty, price = rng.randint(1, 20), rng.randint(100, 50000) / 100
+        skus.append(sku)
+        subtotal += qty * price
+        lines.append(f"{sku}  {rng.choice(PRODUCTS)} {rng.choice(PRODUCTS)}   {qty} x {price:,.2f}   {qty * price:,.2f}")
+    tax = round(subtotal * 0.19, 2)
+    lines += ["", f"Subtotal: {subtotal:,.2f}", f"VAT (19%): {tax:,.2f}", f"Total Due: {currency} {subtotal + tax:,.2f}"]
+    return SimpleNamespace(
+        id=str(uuid.UUID(int=seed << 64 | n)),
+        user_id=str(uuid.UUID(int=1 << 127 | rng.randrange(users))),
+        filename=f"{invoice_number}.pdf",
+        raw_text="\n".join(lines),
+        vendor_name=vendor,
+        invoice_date=invoice_date,
+        currency=currency,
+        invoice_number=invoice_number,
+        vat_id=vat_id,
+        skus=skus,
+    )
+
+
+class HashEmbeddings:
+    """
+    Offline stand-in for the embedding API: character trigrams hashed into
+    `dim` signed buckets, L2-normalized. Like a real model it places
+    "INV-20931" next to "INV-20913", which is what makes identifier queries
+    hard for vector search. `latency` (seconds) is slept per query to
+    stand in for the API round trip.
+    """
+
+    def __init__(self, dim: int = 256, latency: float = 0.0):
+        self.dim = dim
+        self.latency = latency
+        self._buckets: dict = {}
+
+    def _vector(self, text: str) -> list[float]:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        text = f" {text.lower()} "
+        for i in range(len(text) - 2):
+            gram = text[i:i + 3]
+            bucket = self._buckets.get(gram)
+            if bucket is None:
+                h = zlib.crc32(gram.encode())
+                bucket = self._buckets[gram] = (h % self.dim, 1.0 if h & 0x80000000 else -1.0)
+            vec[bucket[0]] += bucket[1]
+        norm = np.linalg.norm(vec)
+        return (vec / norm if norm else vec).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._vector(text)
+
+    def embed_with_stats(self, texts: list[str]) -> tuple[list[list[float]], dict]:
+        return self.embed_documents(texts), {"cached": [0] * len(texts), "hits": 0, "api_requests": 1}
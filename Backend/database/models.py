@@ -1,6 +1,6 @@
 # backend/models.py
 import uuid
-from sqlalchemy import Column, String, Date, TIMESTAMP, Text, Numeric, Boolean
+from sqlalchemy import Column, String, Date, TIMESTAMP, Text, Numeric, Boolean, Integer, JSON
 from sqlalchemy.dialects.postgresql import UUID as PG_UUID
 from sqlalchemy.sql import func
 from database.db import Base
@@ -30,3 +30,27 @@ class Invoice(Base):
     raw_text = Column(Text, nullable=True)
     processed = Column(Boolean, default=False)
     created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+    # Vector indexing, done by the background indexer (services/indexer.py)
+    index_status = Column(String(20), nullable=False, default="pending", server_default="pending", index=True)  # pending | indexing | indexed | failed | deleted
+    index_attempts = Column(Integer, default=0, server_default="0")
+    index_started_at = Column(TIMESTAMP(timezone=True), nullable=True)
+    indexed_at = Column(TIMESTAMP(timezone=True), nullable=True)
+    index_error = Column(Text, nullable=True)
+
+class AnalysisJob(Base):
+    __tablename__ = "analysis_jobs"
+    id = Column(PG_UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(PG_UUID(as_uuid=True), nullable=True)
+    filename = Column(String, nullable=True)  # original client filename
+    file_path = Column(String, nullable=False)  # stored copy in UPLOAD_DIR
+    owns_file = Column(Boolean, default=False)  # delete file_path once the job finishes
+    status = Column(String(20), nullable=False, default="queued", index=True)  # queued | running | succeeded | failed
+    stage = Column(String(30), nullable=True)  # current pipeline stage while running
+    timings = Column(JSON, nullable=True)  # per-stage durations in seconds
+    attempts = Column(Integer, default=0)
+    error = Column(Text, nullable=True)
+    invoice_id = Column(PG_UUID(as_uuid=True), nullable=True)  # set once saved
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+    started_at = Column(TIMESTAMP(timezone=True), nullable=True)
+    heartbeat_at = Column(TIMESTAMP(timezone=True), nullable=True)  # lease: refreshed while a worker runs the job
+    finished_at = Column(TIMESTAMP(timezone=True), nullable=True)
@@ -35,6 +35,7 @@ class InvoiceResponse(BaseModel):
     raw_text: Optional[str] = None
     processed: bool = False
     created_at: Optional[datetime] = None
+    index_status: Optional[str] = None
 
     class Config:
         orm_mode = True
@@ -60,3 +61,43 @@ class DashboardStats(BaseModel):
     current_month_expenses: Optional[float] = 0.0
 
 
+class AnalysisJobResponse(BaseModel):
+    id: UUID
+    status: str
+    stage: Optional[str] = None
+    filename: Optional[str] = None
+    attempts: int = 0
+    timings: dict = {}
+    error: Optional[str] = None
+    invoice_id: Optional[UUID] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    result: Optional[InvoiceResponse] = None
+
+    class Config:
+        from_attributes = True
+
+
+class SearchChunk(BaseModel):
+    text: str
+    chunk_index: Optional[int] = None
+    page_start: Optional[int] = None
+    page_end: Optional[int] = None
+    char_start: Optional[int] = None
+    char_end: Optional[int] = None
+    score: float
+
+class SearchResult(BaseModel):
+    invoice_id: str
+    score: float
+    filename: Optional[str] = None
+    vendor_name: Optional[str] = None
+    invoice_date: Optional[date] = None
+    currency: Optional[str] = None
+    chunks: List[SearchChunk] = []
+
+class SearchResponse(BaseModel):
+    results: List[SearchResult]
+    next_cursor: Optional[str] = None
+    mode: Optional[str] = None
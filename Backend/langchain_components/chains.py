@@ -1,7 +1,13 @@
 # LangChain_Components/extraction_chain.py
-from pydantic import BaseModel, Field
+from functools import lru_cache
+from typing import Optional
+from pydantic import BaseModel, Field, create_model
 from langchain_core.prompts import PromptTemplate
 
+# Bump whenever the prompt or the InvoiceData schema changes, so cached
+# extractions produced by the old prompt are no longer reused.
+EXTRACTION_PROMPT_VERSION = "1"
+
 
 # ✅ 1. Define the structured schema using Pydantic
 class InvoiceData(BaseModel):
@@ -13,16 +19,8 @@ class InvoiceData(BaseModel):
     currency: str | None = Field(None, description="Currency symbol or code (e.g., USD, NGN, EUR)")
 
 
-# ✅ 2. Build a chain factory (works with any LLM)
-def build_extraction_chain(llm):
-    """
-    Returns a universal extraction chain that can work with OpenAI, Gemini, Anthropic, etc.
-    """
-    # Wrap LLM to produce structured (typed) output
-    structured_llm = llm.with_structured_output(InvoiceData)
-
-    # Define the prompt template
-    prompt = PromptTemplate.from_template("""
+# ✅ 2. Shared prompt template (built once at import time)
+EXTRACTION_PROMPT = PromptTemplate.from_template("""
 You are an intelligent financial document extractor. 
 Given the raw text of an invoice or receipt, extract and return the following fields:
 - vendor_name
@@ -38,10 +36,137 @@ Invoice Text:
 {text}
 """)
 
+
+# ✅ 3. Build a chain factory (works with any LLM)
+def build_extraction_chain(llm):
+    """
+    Returns a universal extraction chain that can work with OpenAI, Gemini, Anthropic, etc.
+    """
+    # Wrap LLM to produce structured (typed) output
+    structured_llm = llm.with_structured_output(InvoiceData)
+
      # Return a callable function-like chain
     def run_extraction(text: str):
         # Format the input prompt manually and pass to LLM
-        final_prompt = prompt.format(text=text)
+        final_prompt = EXTRACTION_PROMPT.format(text=text)
         return structured_llm.invoke(final_prompt)  # returns an InvoiceData object
 
     return run_extraction
+
+
+# ✅ 4. Async variant for use inside request handlers (never blocks the event loop)
+def build_async_extraction_chain(llm):
+    """
+    Same as build_extraction_chain, but the returned coroutine function awaits
+    the LLM's native `ainvoke` instead of the blocking `invoke`.
+    """
+    structured_llm = llm.with_structured_output(InvoiceData)
+
+    async def arun_extraction(text: str):
+        final_prompt = EXTRACTION_PROMPT.format(text=text)
+        return await structured_llm.ainvoke(final_prompt)
+
+    return arun_extraction
+
+
+# ✅ 5. Partial extraction: only ask the LLM for fields the rule-based fast path couldn't resolve
+PARTIAL_EXTRACTION_PROMPT = PromptTemplate.from_template("""
+You are an intelligent financial document extractor. 
+Given the raw text of an invoice or receipt, extract and return ONLY the following fields:
+{field_list}
+
+If any field is missing, leave it blank or null.
+
+Invoice Text:
+{text}
+""")
+
+
+@lru_cache(maxsize=64)
+def partial_invoice_model(fields: tuple) -> type[BaseModel]:
+    """InvoiceData restricted to `fields`, all optional (built once per field set)."""
+    definitions = {
+        name: (Optional[InvoiceData.model_fields[name].annotation], Field(None, description=InvoiceData.model_fields[name].description))
+        for name in fields
+    }
+    return create_model("PartialInvoiceData", **definitions)
+
+
+def build_async_partial_extraction_chain(llm, fields):
+    """
+    Like build_async_extraction_chain, but the structured output only contains
+    `fields` — a smaller schema and a shorter answer than the full extraction.
+    """
+    fields = tuple(fields)
+    structured_llm = llm.with_structured_output(partial_invoice_model(fields))
+    field_list = "\n".join(f"- {name}" for name in fields)
+
+    async def arun_partial_extraction(text: str):
+        final_prompt = PARTIAL_EXTRACTION_PROMPT.format(field_list=field_list, text=text)
+        return await structured_llm.ainvoke(final_prompt)
+
+    return arun_partial_extraction
+
+
+# ✅ 6. The exact prompt a chain will send (used for token budgeting)
+def format_extraction_prompt(text: str, fields=None) -> str:
+    """Full prompt when `fields` is None, otherwise the partial prompt for `fields`."""
+    if fields is None:
+        return EXTRACTION_PROMPT.format(text=text)
+    field_list = "\n".join(f"- {name}" for name in fields)
+    return PARTIAL_EXTRACTION_PROMPT.format(field_list=field_list, text=text)
+
+
+# ✅ 7. Batch extraction: several short receipts in one structured-output request
+class InvoiceBatchItem(InvoiceData):
+    document_id: str = Field(..., description="The id from the document's '=== DOCUMENT <id> ===' line, copied exactly")
+
+
+class InvoiceBatch(BaseModel):
+    invoices: list[InvoiceBatchItem] = Field(..., description="One entry per document, in any order")
+
+
+BATCH_EXTRACTION_PROMPT = PromptTemplate.from_template("""
+You are an intelligent financial document extractor. 
+Below are several invoices or receipts. Each one starts with a line "=== DOCUMENT <id> ===".
+For EVERY document, extract and return the following fields, together with its document_id:
+- vendor_name
+- invoice_number
+- invoice_date
+- total_amount
+- tax_amount
+- currency
+
+Never mix fields between documents. If any field is missing, leave it blank or null.
+
+{documents}
+""")
+
+
+def format_batch_extraction_prompt(texts) -> str:
+    """Documents are numbered 1..n in order; the ids come back as `document_id`."""
+    documents = "\n\n".join(f"=== DOCUMENT {i} ===\n{text}" for i, text in enumerate(texts, start=1))
+    return BATCH_EXTRACTION_PROMPT.format(documents=documents)
+
+
+def build_async_batch_extraction_chain(llm):
+    """
+    Returns a coroutine function: list of texts → {position: InvoiceData}.
+    Items the model skipped, duplicated or numbered wrongly are simply absent,
+    so the caller can retry them one by one.
+    """
+    structured_llm = llm.with_structured_output(InvoiceBatch)
+
+    async def arun_batch_extraction(texts):
+        result = await structured_llm.ainvoke(format_batch_extraction_prompt(texts))
+        items = {}
+        for item in result.invoices:
+            try:
+                position = int(item.document_id.strip()) - 1
+            except ValueError:
+                continue
+            if 0 <= position < len(texts) and position not in items:
+                items[position] = InvoiceData(**item.model_dump(exclude={"document_id"}))
+        return items
+
+    return arun_batch_extraction
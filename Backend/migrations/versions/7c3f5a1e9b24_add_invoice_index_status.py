@@ -0,0 +1,39 @@
+"""Add vector indexing status to invoices
+
+Revision ID: 7c3f5a1e9b24
+Revises: 4b7e2c91a0d3
+Create Date: 2026-10-18 14:36:52.104213
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c3f5a1e9b24'
+down_revision: Union[str, Sequence[str], None] = '4b7e2c91a0d3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing invoices start as 'pending' so the indexer backfills them
+    op.add_column('invoices', sa.Column('index_status', sa.String(length=20), server_default='pending', nullable=False))
+    op.add_column('invoices', sa.Column('index_attempts', sa.Integer(), server_default='0', nullable=True))
+    op.add_column('invoices', sa.Column('index_started_at', sa.TIMESTAMP(timezone=True), nullable=True))
+    op.add_column('invoices', sa.Column('indexed_at', sa.TIMESTAMP(timezone=True), nullable=True))
+    op.add_column('invoices', sa.Column('index_error', sa.Text(), nullable=True))
+    op.create_index(op.f('ix_invoices_index_status'), 'invoices', ['index_status'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_invoices_index_status'), table_name='invoices')
+    op.drop_column('invoices', 'index_error')
+    op.drop_column('invoices', 'indexed_at')
+    op.drop_column('invoices', 'index_started_at')
+    op.drop_column('invoices', 'index_attempts')
+    op.drop_column('invoices', 'index_status')
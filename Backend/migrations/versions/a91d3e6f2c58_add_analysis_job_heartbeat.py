@@ -0,0 +1,28 @@
+"""Add a heartbeat (lease) to analysis jobs
+
+Revision ID: a91d3e6f2c58
+Revises: 7c3f5a1e9b24
+Create Date: 2026-10-18 20:12:40.518733
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a91d3e6f2c58'
+down_revision: Union[str, Sequence[str], None] = '7c3f5a1e9b24'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('analysis_jobs', sa.Column('heartbeat_at', sa.TIMESTAMP(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('analysis_jobs', 'heartbeat_at')
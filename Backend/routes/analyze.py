@@ -1,21 +1,42 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Form
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Form, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from services.extractor import extract_invoice_data
-from services.db_services import save_invoice
+from services.db_services import save_invoice, build_invoice_create
+from services.jobs import create_job, get_job
+from services.storage import stream_upload_to_path, stream_upload_to_temp, UploadTooLargeError, EmptyUploadError
+from services.batch_ingest import ingest_batch, iter_upload_entries, iter_zip_entries
+from services.llm_scheduler import LLMRateLimitError
 from deps import get_db
-from database.schemas import InvoiceCreate, InvoiceResponse
+from database.schemas import InvoiceResponse, AnalysisJobResponse
 from fastapi.responses import JSONResponse
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
+from uuid import UUID
+import os
+import uuid
 
 router = APIRouter(tags=["Analyze"])
 
 UPLOAD_DIR = Path("uploads")
 
+
+def _find_upload(file_id: str) -> Path:
+    """Stored upload for a file_id from /upload; the id must be a UUID before it goes near a glob."""
+    try:
+        file_id = str(uuid.UUID(file_id))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid file_id")
+    matching_files = list(UPLOAD_DIR.glob(f"{file_id}.*"))
+    if not matching_files:
+        raise HTTPException(status_code=404, detail="File not found. Please upload the file first.")
+    return matching_files[0]
+
+
 @router.post("/analyze", response_model=dict)
 async def analyze_invoice(
     file: Optional[UploadFile] = File(None),
     file_id: Optional[str] = Form(None),
+    user_id: Optional[UUID] = Form(None),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -27,31 +48,25 @@ async def analyze_invoice(
     Saves the extracted data to the database.
     """
     # 1️⃣ Determine the file source
+    temp_path = None
     if file_id:
-        # Load file from upload directory
-        matching_files = list(UPLOAD_DIR.glob(f"{file_id}.*"))
-        if not matching_files:
-            raise HTTPException(status_code=404, detail="File not found. Please upload the file first.")
-        
-        file_path = matching_files[0]
+        # Analyze the stored upload in place — no second transfer, no temp copy
+        file_path = _find_upload(file_id)
         filename = file_path.name
-        
-        # Create a file-like object for the extractor
-        with open(file_path, "rb") as f:
-            file_content = f.read()
-        
-        # We'll need to modify this to work with file path
-        # For now, raise an error suggesting direct upload
-        raise HTTPException(
-            status_code=501,
-            detail="File ID analysis not yet implemented. Please use direct file upload."
-        )
+        source, content_hash = str(file_path), None
     
     elif file:
         # Direct file upload
         if not file.filename.lower().endswith((".pdf", ".png", ".jpg", ".jpeg")):
             raise HTTPException(status_code=400, detail="Only PDF or image files supported")
         filename = file.filename
+
+        # Stream to a unique temp file, hashing as bytes arrive
+        try:
+            temp_path, _, content_hash = await stream_upload_to_temp(file, suffix=Path(filename).suffix.lower())
+        except (UploadTooLargeError, EmptyUploadError) as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        source = temp_path
     else:
         raise HTTPException(
             status_code=400,
@@ -60,24 +75,13 @@ async def analyze_invoice(
 
     try:
         # 2️⃣ Extract structured data from file using LangChain
-        result = await extract_invoice_data(file)
+        result = await extract_invoice_data(source, filename, content_hash=content_hash, user_id=user_id)
 
         if "error" in result:
             return JSONResponse({"error": result["error"]}, status_code=400)
 
-        structured = result.get("structured", {})
-
         # 3️⃣ Create Pydantic schema instance from extracted data
-        invoice_data = InvoiceCreate(
-            filename=filename,
-            vendor_name=structured.get("vendor_name"),
-            invoice_number=structured.get("invoice_number"),
-            invoice_date=structured.get("invoice_date"),
-            total_amount=structured.get("total_amount"),
-            tax_amount=structured.get("tax_amount"),
-            currency=structured.get("currency"),
-            raw_text=result.get("raw_text"),
-        )
+        invoice_data = build_invoice_create(result, filename, user_id)
 
         # 4️⃣ Save to database using the db service
         saved_invoice = await save_invoice(db, invoice_data)
@@ -87,7 +91,104 @@ async def analyze_invoice(
         
         response_data = InvoiceResponse.model_validate(saved_invoice)
 
-        return {"status": "success", "data": response_data}
+        return {"status": "success", "cached": result.get("cached", False), "data": response_data}
+
+    except LLMRateLimitError as e:
+        # Provider limit reached even after backoff: tell the client when to retry
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": str(int(e.retry_after))},
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if temp_path:
+            os.remove(temp_path)
+
+
+@router.post("/analyze/batch", response_model=dict)
+async def analyze_batch(
+    files: Optional[List[UploadFile]] = File(None),
+    archive: Optional[UploadFile] = File(None),
+    user_id: Optional[UUID] = Form(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Analyzes many invoices in one request.
+    Accepts either:
+    - Several files (files parameter, repeated)
+    - A ZIP archive of PDFs/images (archive parameter), streamed entry by entry
+
+    Returns one summary with a per-file status; a bad file never fails the batch.
+    """
+    if archive:
+        if not archive.filename.lower().endswith(".zip"):
+            raise HTTPException(status_code=400, detail="Archive must be a .zip file")
+        entries = iter_zip_entries(archive.file)
+    elif files:
+        entries = iter_upload_entries(files)
+    else:
+        raise HTTPException(
+            status_code=400,
+            detail="Either 'files' or 'archive' must be provided"
+        )
 
+    try:
+        summary = await ingest_batch(db, entries, user_id=user_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+    return {"status": "success", "data": summary}
+
+
+@router.post("/analyze/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def submit_analysis_job(
+    file: Optional[UploadFile] = File(None),
+    file_id: Optional[str] = Form(None),
+    user_id: Optional[UUID] = Form(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Queues an invoice for background analysis and returns a job id immediately.
+    Poll GET /analyze/jobs/{job_id} for the state, per-stage timings and result.
+    """
+    if file_id:
+        file_path = _find_upload(file_id)
+        filename = file_path.name
+        owns_file = False  # the upload belongs to /upload, leave it in place
+
+    elif file:
+        file_ext = Path(file.filename).suffix.lower()
+        if file_ext not in (".pdf", ".png", ".jpg", ".jpeg"):
+            raise HTTPException(status_code=400, detail="Only PDF or image files supported")
+
+        # Persist the upload so queued work survives a restart
+        UPLOAD_DIR.mkdir(exist_ok=True)
+        file_path = UPLOAD_DIR / f"{uuid.uuid4()}{file_ext}"
+        try:
+            await stream_upload_to_path(file, str(file_path))
+        except (UploadTooLargeError, EmptyUploadError) as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        filename = file.filename
+        owns_file = True
+    else:
+        raise HTTPException(
+            status_code=400,
+            detail="Either 'file' or 'file_id' must be provided"
+        )
+
+    job = await create_job(db, str(file_path), filename, user_id=user_id, owns_file=owns_file)
+    return {"status": "success", "data": {"job_id": job.id, "status": job.status}}
+
+
+@router.get("/analyze/jobs/{job_id}", response_model=AnalysisJobResponse)
+async def get_analysis_job(job_id: UUID, db: AsyncSession = Depends(get_db)):
+    """
+    Returns the state of an analysis job, its per-stage timings and,
+    once it has succeeded, the saved invoice.
+    """
+    job = await get_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
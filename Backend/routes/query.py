@@ -3,6 +3,7 @@ from fastapi import APIRouter, Depends, HTTPException, Query, Path
 from deps import get_db
 from sqlalchemy.ext.asyncio import AsyncSession
 from services.db_services import get_invoices, get_invoice_by_id, delete_invoice, get_dashboard_stats
+from services.indexer import enqueue_reindex
 from database.schemas import InvoiceListResponse, InvoiceResponse, DashboardStats
 from typing import Optional
 
@@ -42,3 +43,11 @@ async def remove_invoice(invoice_id: str, hard: bool = Query(True), db: AsyncSes
     if not deleted:
         raise HTTPException(status_code=404, detail="Invoice not found")
     return {"status": "success", "data": deleted}
+
+@router.post("/invoices/{invoice_id}/reindex")
+async def reindex_invoice(invoice_id: str, db: AsyncSession = Depends(get_db)):
+    # Idempotent: queues the invoice again, its chunks are replaced when re-indexed
+    queued = await enqueue_reindex(db, [invoice_id.strip()])
+    if not queued:
+        raise HTTPException(status_code=404, detail="Invoice not found or already indexing")
+    return {"status": "queued", "invoice_id": invoice_id}
@@ -0,0 +1,34 @@
+# backend/routes/search.py
+from fastapi import APIRouter, HTTPException, Query
+from services.search import search_invoices, InvalidCursorError, SEARCH_MAX_K
+from database.schemas import SearchResponse
+from datetime import date
+from typing import Optional
+from uuid import UUID
+
+router = APIRouter(tags=["Search"])
+
+@router.get("/search", response_model=SearchResponse)
+async def search(
+    q: str = Query(..., min_length=1),
+    user_id: UUID = Query(...),
+    k: int = Query(10, ge=1, le=SEARCH_MAX_K),
+    cursor: Optional[str] = None,
+    vendor: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    currency: Optional[str] = None,
+    mode: Optional[str] = Query(None, pattern="^(hybrid|vector|lexical)$"),
+):
+    """
+    Hybrid (BM25 + semantic) search over one user's invoices; one result per
+    invoice with its matching chunks. Pass `next_cursor` back as `cursor`
+    for the next page.
+    """
+    try:
+        return await search_invoices(
+            q, str(user_id), k=k, cursor=cursor,
+            vendor=vendor, date_from=date_from, date_to=date_to, currency=currency, mode=mode,
+        )
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -4,6 +4,7 @@ import os
 import uuid
 from pathlib import Path
 from typing import Optional
+from services.storage import stream_upload_to_path, UploadTooLargeError, EmptyUploadError, MAX_UPLOAD_SIZE
 
 router = APIRouter(tags=["Upload"])
 
@@ -12,7 +13,7 @@ UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
 
 ALLOWED_EXTENSIONS = {".pdf", ".png", ".jpg", ".jpeg"}
-MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+MAX_FILE_SIZE = MAX_UPLOAD_SIZE  # 10MB by default
 
 @router.post("/upload")
 async def upload_file(file: UploadFile = File(...)):
@@ -28,27 +29,16 @@ async def upload_file(file: UploadFile = File(...)):
             detail=f"File type not supported. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"
         )
     
-    # 2️⃣ Read file content and validate size
-    contents = await file.read()
-    file_size = len(contents)
-    
-    if file_size > MAX_FILE_SIZE:
-        raise HTTPException(
-            status_code=400,
-            detail=f"File too large. Maximum size: {MAX_FILE_SIZE / 1024 / 1024}MB"
-        )
-    
-    if file_size == 0:
-        raise HTTPException(status_code=400, detail="Empty file uploaded")
-    
-    # 3️⃣ Generate unique file ID and save file
+    # 2️⃣ Generate unique file ID
     file_id = str(uuid.uuid4())
     safe_filename = f"{file_id}{file_ext}"
     file_path = UPLOAD_DIR / safe_filename
-    
+
+    # 3️⃣ Stream to disk in chunks, enforcing the size limit and hashing as bytes arrive
     try:
-        with open(file_path, "wb") as f:
-            f.write(contents)
+        file_size, sha256 = await stream_upload_to_path(file, str(file_path), MAX_FILE_SIZE)
+    except (UploadTooLargeError, EmptyUploadError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
     
@@ -60,6 +50,7 @@ async def upload_file(file: UploadFile = File(...)):
             "filename": file.filename,
             "file_path": str(file_path),
             "file_size": file_size,
+            "sha256": sha256,
             "content_type": file.content_type,
             "message": "File uploaded successfully. Use the file_id to analyze this invoice."
         }
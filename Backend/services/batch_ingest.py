@@ -0,0 +1,231 @@
+# services/batch_ingest.py
+"""
+Bulk ingestion for month-end loads (hundreds to thousands of receipts).
+
+Files come either as a list of uploads or as one ZIP archive. ZIP entries are
+streamed one at a time from the (disk-spooled) upload into a temp file, so the
+archive is never unpacked in memory; members past BATCH_MAX_FILES are
+reported as skipped without being extracted. Extraction fans out with a
+bounded semaphore (BATCH_CONCURRENCY) and results are written as they
+arrive, BATCH_INSERT_SIZE rows per bulk insert, so at most one sub-batch of
+extracted text is held in memory. With BATCH_LLM_PACKING, concurrent LLM
+calls are packed several documents per request. A bad file only marks its
+own entry as failed: if a bulk insert fails, its rows are retried one by one.
+"""
+import asyncio
+import os
+import shutil
+import tempfile
+import zipfile
+from pathlib import Path
+from typing import AsyncIterator, Iterable, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from services.db_services import build_invoice_create, save_invoices_bulk
+from services.extractor import extract_invoice_data
+from services.batch_llm import BATCH_LLM_PACKING
+from services.storage import stream_upload_to_temp, UploadTooLargeError, EmptyUploadError
+
+load_dotenv()
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "5000"))
+BATCH_INSERT_SIZE = int(os.getenv("BATCH_INSERT_SIZE", "100"))
+BATCH_MAX_ENTRY_SIZE = int(os.getenv("BATCH_MAX_ENTRY_SIZE", str(10 * 1024 * 1024)))  # 10MB, same as /upload
+
+ALLOWED_EXTENSIONS = {".pdf", ".png", ".jpg", ".jpeg"}
+COPY_BUFFER_SIZE = 256 * 1024
+
+
+class BatchEntry:
+    """One file in a batch: its name and a temp file on disk (or an error, or skipped)."""
+
+    def __init__(self, filename: str, path: Optional[str] = None, error: Optional[str] = None, skipped: bool = False):
+        self.filename = filename
+        self.path = path
+        self.error = error
+        self.skipped = skipped
+
+
+def _copy_to_temp(src, suffix: str) -> str:
+    fd, temp_path = tempfile.mkstemp(prefix="batch-", suffix=suffix)
+    with os.fdopen(fd, "wb") as dst:
+        shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+    return temp_path
+
+
+def _check_name(filename: str) -> Optional[str]:
+    if Path(filename).suffix.lower() not in ALLOWED_EXTENSIONS:
+        return f"Unsupported file type. Allowed types: {', '.join(sorted(ALLOWED_EXTENSIONS))}"
+    return None
+
+
+async def iter_upload_entries(files: Iterable) -> AsyncIterator[BatchEntry]:
+    for count, upload in enumerate(files, start=1):
+        if count > BATCH_MAX_FILES:
+            yield BatchEntry(upload.filename, skipped=True)
+            continue
+        error = _check_name(upload.filename)
+        if error:
+            yield BatchEntry(upload.filename, error=error)
+            continue
+        await upload.seek(0)
+        try:
+            path, _, _ = await stream_upload_to_temp(upload, Path(upload.filename).suffix.lower(), BATCH_MAX_ENTRY_SIZE)
+        except (UploadTooLargeError, EmptyUploadError) as e:
+            yield BatchEntry(upload.filename, error=str(e))
+            continue
+        yield BatchEntry(upload.filename, path=path)
+
+
+def _list_zip_members(zf: zipfile.ZipFile) -> list[zipfile.ZipInfo]:
+    return [
+        info for info in zf.infolist()
+        if not info.is_dir() and not info.filename.startswith("__MACOSX/")
+    ]
+
+
+def _extract_zip_member(zf: zipfile.ZipFile, info: zipfile.ZipInfo) -> str:
+    with zf.open(info) as src:
+        return _copy_to_temp(src, Path(info.filename).suffix.lower())
+
+
+async def iter_zip_entries(archive_file) -> AsyncIterator[BatchEntry]:
+    """Yield archive members one at a time; only the current member touches disk."""
+    try:
+        zf = zipfile.ZipFile(archive_file)
+    except zipfile.BadZipFile:
+        yield BatchEntry("archive", error="Invalid ZIP archive")
+        return
+
+    with zf:
+        for count, info in enumerate(_list_zip_members(zf), start=1):
+            filename = Path(info.filename).name
+            if count > BATCH_MAX_FILES:
+                # Over the limit: report it, but don't unpack it
+                yield BatchEntry(filename, skipped=True)
+                continue
+            error = _check_name(filename)
+            if not error and info.file_size > BATCH_MAX_ENTRY_SIZE:
+                error = f"File too large. Maximum size: {BATCH_MAX_ENTRY_SIZE / 1024 / 1024}MB"
+            if error:
+                yield BatchEntry(filename, error=error)
+                continue
+            try:
+                path = await asyncio.to_thread(_extract_zip_member, zf, info)
+            except Exception as e:
+                yield BatchEntry(filename, error=f"Could not read archive entry: {e}")
+                continue
+            yield BatchEntry(filename, path=path)
+
+
+async def _process_entry(entry: BatchEntry, semaphore: asyncio.Semaphore, user_id=None) -> Tuple[BatchEntry, dict]:
+    try:
+        return entry, await extract_invoice_data(entry.path, entry.filename, user_id=user_id, llm_batching=BATCH_LLM_PACKING)
+    except Exception as e:
+        return entry, {"error": str(e)}
+    finally:
+        semaphore.release()
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+
+async def _save_extracted(db: AsyncSession, pending: list, results: list) -> None:
+    """
+    Bulk-insert one sub-batch of (slot, result, invoice); if the insert fails,
+    retry row by row so a bad row only fails its own file.
+    """
+    invoices = [invoice for _, _, invoice in pending]
+    try:
+        saved_rows = await save_invoices_bulk(db, invoices)
+    except Exception as e:
+        await db.rollback()
+        print("Bulk insert failed, saving the batch row by row:", e)
+        saved_rows = []
+        for invoice in invoices:
+            try:
+                saved_rows.extend(await save_invoices_bulk(db, [invoice]))
+            except Exception as row_error:
+                await db.rollback()
+                saved_rows.append(row_error)
+
+    for (slot, result, invoice), saved in zip(pending, saved_rows):
+        if isinstance(saved, Exception):
+            results[slot] = {"filename": invoice.filename, "status": "failed", "error": f"Could not save invoice: {saved}"}
+        else:
+            results[slot] = {
+                "filename": invoice.filename,
+                "status": "succeeded",
+                "invoice_id": saved["id"],
+                "cached": result.get("cached", False),
+            }
+
+
+async def ingest_batch(db: AsyncSession, entries: AsyncIterator[BatchEntry], user_id=None) -> dict:
+    """
+    Extract every entry with at most BATCH_CONCURRENCY in flight, insert the
+    successes BATCH_INSERT_SIZE at a time as they finish and return a
+    per-file summary.
+    """
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    in_flight = {}  # task → slot
+    pending = []  # extracted, not yet inserted: (slot, result, invoice)
+    results = []  # per-file status, in input order
+    count = 0
+
+    def collect(task: asyncio.Task) -> None:
+        slot = in_flight.pop(task)
+        entry, result = task.result()
+        if "error" in result:
+            results[slot] = {"filename": entry.filename, "status": "failed", "error": result["error"]}
+            return
+        try:
+            pending.append((slot, result, build_invoice_create(result, entry.filename, user_id)))
+        except Exception as e:
+            results[slot] = {"filename": entry.filename, "status": "failed", "error": f"Invalid extracted data: {e}"}
+
+    async def flush(force: bool = False) -> None:
+        while len(pending) >= BATCH_INSERT_SIZE or (force and pending):
+            batch = pending[:BATCH_INSERT_SIZE]
+            del pending[:BATCH_INSERT_SIZE]
+            await _save_extracted(db, batch, results)
+
+    async for entry in entries:
+        count += 1
+        if entry.skipped or count > BATCH_MAX_FILES:
+            results.append({"filename": entry.filename, "status": "skipped", "error": f"Batch limit of {BATCH_MAX_FILES} files reached"})
+            if entry.path:
+                os.remove(entry.path)
+            continue
+        if entry.error:
+            results.append({"filename": entry.filename, "status": "failed", "error": entry.error})
+            continue
+
+        # Backpressure: don't pull the next entry off the archive until a slot is free
+        await semaphore.acquire()
+        results.append(None)
+        in_flight[asyncio.create_task(_process_entry(entry, semaphore, user_id))] = len(results) - 1
+
+        for task in [task for task in in_flight if task.done()]:
+            collect(task)
+        await flush()
+
+    while in_flight:
+        done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            collect(task)
+        await flush()
+    await flush(force=True)
+
+    statuses = [r["status"] for r in results]
+    return {
+        "total": len(results),
+        "succeeded": statuses.count("succeeded"),
+        "failed": statuses.count("failed"),
+        "skipped": statuses.count("skipped"),
+        "results": results,
+    }
@@ -0,0 +1,284 @@
+# services/batch_llm.py
+"""
+Batched LLM extraction for bulk backfills.
+
+Two modes:
+
+1. Packed requests (online). `extract_packed(text)` is called per document
+   like a normal chain, but concurrent calls are coalesced for up to
+   BATCH_LLM_WINDOW seconds and sent as ONE structured-output request that
+   returns a list of InvoiceData (see chains.build_async_batch_extraction_chain).
+   Only short documents are packed. Results are mapped back by position, and
+   any document the model skipped (or a whole pack that failed) is retried on
+   its own with the single-document chain.
+   Used by /analyze/batch when BATCH_LLM_PACKING=true.
+
+2. Offline batch files. `write_batch_requests` writes one request per
+   document in the OpenAI Batch API JSONL format (custom_id = document id);
+   `collect_batch_results` maps the downloaded output file back to the
+   documents and retries failed or unparsable items individually.
+
+       python -m services.batch_llm prepare requests.jsonl invoices/*.pdf
+       python -m services.batch_llm collect requests.jsonl output.jsonl results.jsonl
+
+Env vars:
+    BATCH_LLM_PACKING         enable packed requests for /analyze/batch
+    BATCH_LLM_MAX_DOCS        documents per packed request
+    BATCH_LLM_MAX_TOKENS      prompt tokens per packed request
+    BATCH_LLM_MAX_DOC_TOKENS  longer documents are always sent alone
+    BATCH_LLM_WINDOW          seconds to wait for more documents before sending
+"""
+import asyncio
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from langchain_components.chains import InvoiceData, format_extraction_prompt
+from services import metrics
+from services.llm_provider import get_llm_provider, LLM_PROVIDER, LLM_MODEL
+from services.llm_router import route_extraction, get_target
+from services.llm_scheduler import run_llm_call
+from services.tokenizer import count_tokens
+
+load_dotenv()
+
+BATCH_LLM_PACKING = os.getenv("BATCH_LLM_PACKING", "false").lower() in ("1", "true", "yes")
+BATCH_LLM_MAX_DOCS = int(os.getenv("BATCH_LLM_MAX_DOCS", "10"))
+BATCH_LLM_MAX_TOKENS = int(os.getenv("BATCH_LLM_MAX_TOKENS", "8000"))
+BATCH_LLM_MAX_DOC_TOKENS = int(os.getenv("BATCH_LLM_MAX_DOC_TOKENS", "1000"))
+BATCH_LLM_WINDOW = float(os.getenv("BATCH_LLM_WINDOW", "0.2"))
+
+
+async def _extract_single(text: str, user_id=None) -> InvoiceData:
+    return await route_extraction(text, user_id=user_id)
+
+
+# 1) Packed requests
+class _Waiter:
+    def __init__(self, text: str, tokens: int, user_id):
+        self.text = text
+        self.tokens = tokens
+        self.user_id = user_id
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class LLMBatcher:
+    """Coalesces concurrent single-document extractions into packed requests."""
+
+    def __init__(self):
+        self._pending: list[_Waiter] = []
+        self._pending_tokens = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set[asyncio.Task] = set()  # in-flight packs (the loop only keeps weak references)
+
+    async def extract(self, text: str, user_id=None) -> InvoiceData:
+        tokens = count_tokens(text, LLM_MODEL)
+        if tokens > BATCH_LLM_MAX_DOC_TOKENS:
+            return await _extract_single(text, user_id)
+
+        if self._pending_tokens + tokens > BATCH_LLM_MAX_TOKENS:
+            self._flush()
+        waiter = _Waiter(text, tokens, user_id)
+        self._pending.append(waiter)
+        self._pending_tokens += tokens
+
+        if len(self._pending) >= BATCH_LLM_MAX_DOCS:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(BATCH_LLM_WINDOW, self._flush)
+        return await waiter.future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pack, self._pending, self._pending_tokens = self._pending, [], 0
+        if pack:
+            task = asyncio.create_task(self._run_pack(pack))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def close(self) -> None:
+        """Send what is still waiting for its window and wait for every in-flight pack."""
+        self._flush()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _run_pack(self, pack: list[_Waiter]) -> None:
+        items = {}
+        if len(pack) > 1:
+            chain = get_llm_provider().get_batch_extraction_chain()
+            texts = [w.text for w in pack]
+            target = get_target(LLM_PROVIDER, LLM_MODEL)  # same buckets as routed calls to this model
+            try:
+                items = await run_llm_call(
+                    lambda: chain(texts),
+                    user_id=pack[0].user_id,
+                    tokens=sum(w.tokens for w in pack) + 50 * len(pack),  # prompt + per-document framing
+                    limits=target.limits if target else None,
+                )
+                metrics.increment("llm_batch_requests")
+                metrics.increment("llm_batch_documents", len(items))
+            except Exception as e:
+                print("Packed LLM request failed, retrying documents individually:", e)
+
+        # Anything the pack didn't answer goes out on its own
+        async def settle(position: int, waiter: _Waiter):
+            if waiter.future.done():
+                return
+            if position in items:
+                waiter.future.set_result(items[position])
+                return
+            if len(pack) > 1:
+                metrics.increment("llm_batch_retries")
+            try:
+                waiter.future.set_result(await _extract_single(waiter.text, waiter.user_id))
+            except Exception as e:
+                if not waiter.future.done():
+                    waiter.future.set_exception(e)
+
+        await asyncio.gather(*(settle(i, w) for i, w in enumerate(pack)))
+
+
+_batcher: Optional[LLMBatcher] = None
+
+
+def get_llm_batcher() -> LLMBatcher:
+    global _batcher
+    if _batcher is None:
+        _batcher = LLMBatcher()
+    return _batcher
+
+
+async def extract_packed(text: str, user_id=None) -> InvoiceData:
+    return await get_llm_batcher().extract(text, user_id)
+
+
+async def stop_llm_batcher() -> None:
+    global _batcher
+    if _batcher is not None:
+        await _batcher.close()
+        _batcher = None
+
+
+# 2) Offline batch files (OpenAI Batch API format)
+def build_batch_request(custom_id: str, text: str, model: str = LLM_MODEL) -> dict:
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {
+            "model": model,
+            "messages": [{"role": "user", "content": format_extraction_prompt(text)}],
+            "response_format": {
+                "type": "json_schema",
+                "json_schema": {"name": "InvoiceData", "schema": InvoiceData.model_json_schema()},
+            },
+        },
+    }
+
+
+def write_batch_requests(documents, path: str, model: str = LLM_MODEL) -> int:
+    """`documents` yields (custom_id, text). Returns the number of requests written."""
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for custom_id, text in documents:
+            f.write(json.dumps(build_batch_request(custom_id, text, model)) + "\n")
+            count += 1
+    return count
+
+
+def _read_jsonl(path: str) -> dict:
+    rows = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                rows[row["custom_id"]] = row
+    return rows
+
+
+def _parse_batch_output(row: Optional[dict]) -> Optional[InvoiceData]:
+    try:
+        response = row["response"]
+        if response["status_code"] != 200:
+            return None
+        content = response["body"]["choices"][0]["message"]["content"]
+        return InvoiceData.model_validate_json(content)
+    except Exception:
+        return None
+
+
+def _prompt_text(request: dict) -> str:
+    prompt = request["body"]["messages"][0]["content"]
+    return prompt.split("Invoice Text:", 1)[-1].strip()
+
+
+async def collect_batch_results(requests_path: str, output_path: str) -> dict:
+    """
+    Map the batch output back to every request by custom_id. Items that are
+    missing, errored or don't validate as InvoiceData are retried one by one.
+    Returns {custom_id: {"structured": dict, "retried": bool} | {"error": str}}.
+    """
+    requests = _read_jsonl(requests_path)
+    outputs = _read_jsonl(output_path) if os.path.exists(output_path) else {}
+
+    results = {}
+    retry = []
+    for custom_id in requests:
+        parsed = _parse_batch_output(outputs.get(custom_id))
+        if parsed is None:
+            retry.append(custom_id)
+        else:
+            results[custom_id] = {"structured": parsed.model_dump(), "retried": False}
+
+    async def retry_one(custom_id: str):
+        try:
+            result = await _extract_single(_prompt_text(requests[custom_id]))
+            results[custom_id] = {"structured": result.model_dump(), "retried": True}
+        except Exception as e:
+            results[custom_id] = {"error": str(e)}
+
+    await asyncio.gather(*(retry_one(custom_id) for custom_id in retry))
+    return {custom_id: results[custom_id] for custom_id in requests}
+
+
+def _prepare(out_path: str, files: list[str]) -> None:
+    from services.prompt_compactor import compact_prompt_text, PROMPT_COMPACTION_ENABLED
+    from services.text_extraction import extract_text_from_source
+
+    def documents():
+        for file in files:
+            text = extract_text_from_source(file, Path(file).name)
+            if not text.strip():
+                print(f"{file}: no text, skipped")
+                continue
+            if PROMPT_COMPACTION_ENABLED:
+                text, _ = compact_prompt_text(text, model=LLM_MODEL)
+            yield file, text
+
+    count = write_batch_requests(documents(), out_path)
+    print(f"Wrote {count} requests to {out_path}")
+
+
+def _collect(requests_path: str, output_path: str, out_path: str) -> None:
+    results = asyncio.run(collect_batch_results(requests_path, output_path))
+    with open(out_path, "w", encoding="utf-8") as f:
+        for custom_id, result in results.items():
+            f.write(json.dumps({"custom_id": custom_id, **result}) + "\n")
+    retried = sum(1 for r in results.values() if r.get("retried"))
+    failed = sum(1 for r in results.values() if "error" in r)
+    print(f"{len(results)} documents: {retried} retried individually, {failed} failed → {out_path}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 4 and sys.argv[1] == "prepare":
+        _prepare(sys.argv[2], sys.argv[3:])
+    elif len(sys.argv) == 5 and sys.argv[1] == "collect":
+        _collect(sys.argv[2], sys.argv[3], sys.argv[4])
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -1,12 +1,225 @@
-def chunk_text(text: str, chunk_size: int = 800, overlap: int = 120) -> list[str]:
-    words = text.split()
-    chunks = []
-    start = 0
-
-    while start < len(words):
-        end = start + chunk_size
-        chunk = " ".join(words[start:end])
-        chunks.append(chunk)
-        start = end - overlap  # sliding window
-
-    return chunks
+# services/chunker.py
+"""
+Token-aware, structure-aware chunking for the search indexes.
+
+iter_chunks() streams chunks (a generator: nothing but the current chunk
+is held in memory) sized in embedding-model tokens, never cutting inside a
+line unless the line alone is over the limit (it is then cut at
+whitespace, and a word over the limit, like a pasted base64 blob, by token
+count). Lines are grouped into blocks — a header/text block, a line-item
+table (rows ending in an amount), a totals block — and a chunk only breaks
+inside a block when the block alone is over the limit; those breaks repeat
+up to CHUNK_OVERLAP_TOKENS of trailing lines for context. Blank lines and
+page breaks (\\f, see text_constants.PAGE_SEPARATOR) also end a block.
+
+Every chunk carries the pages it spans and its character offsets in the
+source text. Chunks made only of whitespace, noise or boilerplate (terms
+and conditions, "page 2 of 5", …) are skipped.
+
+Env vars:
+    CHUNK_MAX_TOKENS      max embedding tokens per chunk
+    CHUNK_OVERLAP_TOKENS  context repeated when a block has to be split
+"""
+import os
+import re
+from typing import Iterator, NamedTuple
+
+from dotenv import load_dotenv
+
+from services.prompt_compactor import BOILERPLATE_RE
+from services.text_constants import PAGE_SEPARATOR
+from services.rule_extractor import AMOUNT_RE, SUBTOTAL_LABEL_RE, TAX_LABEL_RE, TOTAL_LABELS
+from services.tokenizer import count_embedding_tokens
+
+load_dotenv()
+
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "512"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "64"))
+
+_LINE_RE = re.compile(r"([^\n\f]*)(\n|\f|$)")
+_ALNUM_RE = re.compile(r"[A-Za-z0-9]")
+_ROW_AMOUNT_RE = re.compile(rf"(?:{AMOUNT_RE.pattern})\s*\S{{0,4}}\s*$")
+
+TEXT, ITEM, TOTAL = "text", "item", "total"  # block kinds
+
+
+class Chunk(NamedTuple):
+    text: str
+    page_start: int  # 1-based
+    page_end: int
+    char_start: int  # offsets into the source text
+    char_end: int
+    tokens: int
+
+    @property
+    def metadata(self) -> dict:
+        return {
+            "page_start": self.page_start,
+            "page_end": self.page_end,
+            "char_start": self.char_start,
+            "char_end": self.char_end,
+            "tokens": self.tokens,
+        }
+
+
+class _Line(NamedTuple):
+    text: str
+    page: int
+    start: int
+    end: int
+    tokens: int
+
+
+def _iter_lines(text: str) -> Iterator[tuple]:
+    """(page, start, end, line) for every line, without splitting the whole text."""
+    page = 1
+    for match in _LINE_RE.finditer(text):
+        yield page, match.start(1), match.end(1), match.group(1)
+        if match.group(2) == PAGE_SEPARATOR:
+            page += 1
+        if match.end() >= len(text):
+            break
+
+
+def _kind(line: str) -> str:
+    if any(pattern.search(line) for pattern, _ in TOTAL_LABELS) or SUBTOTAL_LABEL_RE.search(line) or TAX_LABEL_RE.search(line):
+        return TOTAL
+    if _ROW_AMOUNT_RE.search(line) and len(_ALNUM_RE.findall(line)) > 4:
+        return ITEM
+    return TEXT
+
+
+def _iter_blocks(text: str) -> Iterator[list]:
+    """Runs of non-blank lines of the same kind, split at blank lines and page breaks."""
+    block, kind, page = [], None, 1
+    for line_page, start, end, line in _iter_lines(text):
+        stripped = line.strip()
+        line_kind = _kind(stripped) if stripped else None
+        if block and (not stripped or line_page != page or line_kind != kind):
+            yield block
+            block = []
+        page = line_page
+        if stripped:
+            kind = line_kind
+            # Keep offsets on the stripped text
+            start += len(line) - len(line.lstrip())
+            end -= len(line) - len(line.rstrip())
+            block.append(_Line(stripped, line_page, start, end, count_embedding_tokens(stripped)))
+    if block:
+        yield block
+
+
+def _hard_split(text: str, start: int, end: int, max_tokens: int) -> Iterator[tuple[int, int, int]]:
+    """A word over the limit (base64, a long run of digits or dashes): cut it by token count."""
+    chars_per_token = (end - start) / count_embedding_tokens(text[start:end])
+    while start < end:
+        size = min(max(1, int(max_tokens * chars_per_token)), end - start)
+        tokens = count_embedding_tokens(text[start:start + size])
+        while tokens > max_tokens and size > 1:
+            size = max(1, size * 9 // 10)
+            tokens = count_embedding_tokens(text[start:start + size])
+        yield start, start + size, tokens
+        start += size
+
+
+def _split_long_line(line: _Line, max_tokens: int) -> Iterator[_Line]:
+    """
+    A single line over the limit: cut at whitespace into pieces of at most
+    max_tokens, and inside words that are over the limit on their own.
+    """
+    spans, previous_end = [], 0  # (start, end, tokens) in line.text
+    for word in re.finditer(r"\S+", line.text):
+        # Counted with the whitespace before it, as it is tokenized inside the piece
+        tokens = count_embedding_tokens(line.text[previous_end:word.end()])
+        if tokens > max_tokens:
+            spans.extend(_hard_split(line.text, word.start(), word.end(), max_tokens))
+        else:
+            spans.append((word.start(), word.end(), tokens))
+        previous_end = word.end()
+
+    def piece(start: int, end: int) -> _Line:
+        text = line.text[start:end]
+        return _Line(text, line.page, line.start + start, line.start + end, count_embedding_tokens(text))
+
+    group_start, group_end, group_tokens = None, 0, 0
+    for start, end, tokens in spans:
+        if group_start is not None and group_tokens + tokens > max_tokens:
+            yield piece(group_start, group_end)
+            group_start, group_tokens = None, 0
+        if group_start is None:
+            group_start = start
+        group_end = end
+        group_tokens += tokens
+    if group_start is not None:
+        yield piece(group_start, group_end)
+
+
+def _is_filler(line: _Line) -> bool:
+    return len(_ALNUM_RE.findall(line.text)) < 2 or bool(BOILERPLATE_RE.search(line.text))
+
+
+def _make_chunk(lines: list) -> Chunk:
+    return Chunk(
+        text="\n".join(line.text for line in lines),
+        page_start=lines[0].page,
+        page_end=lines[-1].page,
+        char_start=lines[0].start,
+        char_end=lines[-1].end,
+        tokens=sum(line.tokens for line in lines) + len(lines) - 1,  # + newlines
+    )
+
+
+def iter_chunks(text: str, max_tokens: int = CHUNK_MAX_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> Iterator[Chunk]:
+    current, current_tokens = [], 0
+
+    def flush():
+        nonlocal current, current_tokens
+        chunk = None
+        if current and not all(_is_filler(line) for line in current):
+            chunk = _make_chunk(current)
+        current, current_tokens = [], 0
+        return chunk
+
+    for block in _iter_blocks(text):
+        block_tokens = sum(line.tokens + 1 for line in block)
+
+        # 1️⃣ Whole block fits next to what we have: keep it together
+        if current_tokens + block_tokens <= max_tokens:
+            current.extend(block)
+            current_tokens += block_tokens
+            continue
+
+        # 2️⃣ Block fits in a chunk of its own: start a fresh one
+        if block_tokens <= max_tokens:
+            chunk = flush()
+            if chunk:
+                yield chunk
+            current, current_tokens = list(block), block_tokens
+            continue
+
+        # 3️⃣ Block alone is too big: keep filling, break between lines, with overlap
+        for line in block:
+            parts = [line] if line.tokens < max_tokens else list(_split_long_line(line, max_tokens))
+            for part in parts:
+                if current and current_tokens + part.tokens + 1 > max_tokens:
+                    tail, tail_tokens = [], 0
+                    for previous in reversed(current):
+                        if tail_tokens + previous.tokens + 1 > overlap_tokens:
+                            break
+                        tail.insert(0, previous)
+                        tail_tokens += previous.tokens + 1
+                    chunk = flush()
+                    if chunk:
+                        yield chunk
+                    if tail_tokens + part.tokens + 1 <= max_tokens:
+                        current, current_tokens = tail, tail_tokens
+                current.append(part)
+                current_tokens += part.tokens + 1
+
+    chunk = flush()
+    if chunk:
+        yield chunk
+
+
+def chunk_text(text: str, max_tokens: int = CHUNK_MAX_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> list[str]:
+    return [chunk.text for chunk in iter_chunks(text, max_tokens, overlap_tokens)]
@@ -1,12 +1,30 @@
 # backend/services/db_service.py
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import insert, select, delete, desc, func
+from sqlalchemy import insert, select, delete, desc, func, and_, cast, literal_column, null, union_all, String
 from database.models import Invoice
 from datetime import date
 from typing import Tuple, List, Optional
 from database.models import Invoice  # your SQLAlchemy model
 from database.schemas import InvoiceCreate, InvoiceResponse, DashboardStats
 from sqlalchemy.sql import text
+from services.indexer import notify_indexer, remove_from_index
+
+def build_invoice_create(result: dict, filename: str, user_id=None) -> InvoiceCreate:
+    """Map an extractor result onto the InvoiceCreate schema."""
+    structured = result.get("structured", {})
+    fields = dict(
+        filename=filename,
+        vendor_name=structured.get("vendor_name"),
+        invoice_number=structured.get("invoice_number"),
+        invoice_date=structured.get("invoice_date"),
+        total_amount=structured.get("total_amount"),
+        tax_amount=structured.get("tax_amount"),
+        currency=structured.get("currency"),
+        raw_text=result.get("text"),
+    )
+    if user_id:
+        fields["user_id"] = user_id
+    return InvoiceCreate(**fields)
 
 async def save_invoice(db: AsyncSession, invoice_in: InvoiceCreate):
     stmt = (
@@ -27,6 +45,7 @@ async def save_invoice(db: AsyncSession, invoice_in: InvoiceCreate):
     )
     result = await db.execute(stmt)
     await db.commit()
+    notify_indexer()  # chunk + embed in the background, not in this request
     # row = result.fetchone()
     # return row
     
@@ -50,8 +69,40 @@ async def save_invoice(db: AsyncSession, invoice_in: InvoiceCreate):
       "raw_text": invoice_obj.raw_text,
       "processed": invoice_obj.processed,
       "created_at": invoice_obj.created_at,
+      "index_status": invoice_obj.index_status,
 }
 
+async def save_invoices_bulk(db: AsyncSession, invoices_in: List[InvoiceCreate], batch_size: int = 500) -> List[dict]:
+    """
+    Insert many invoices with multi-row INSERT ... RETURNING statements
+    (one round trip per `batch_size` rows instead of one per invoice).
+    Returned rows are in the same order as `invoices_in`.
+    """
+    saved = []
+    for start in range(0, len(invoices_in), batch_size):
+        batch = invoices_in[start:start + batch_size]
+        rows = [
+            {
+                "user_id": inv.user_id,
+                "filename": inv.filename,
+                "vendor_name": inv.vendor_name,
+                "invoice_number": inv.invoice_number,
+                "invoice_date": inv.invoice_date,
+                "total_amount": inv.total_amount,
+                "tax_amount": inv.tax_amount,
+                "currency": inv.currency,
+                "raw_text": inv.raw_text,
+                "processed": True,
+            }
+            for inv in batch
+        ]
+        stmt = insert(Invoice).returning(Invoice, sort_by_parameter_order=True)
+        result = await db.execute(stmt, rows)
+        saved.extend(invoice_to_dict(inv) for inv in result.scalars().all())
+    await db.commit()
+    notify_indexer()
+    return saved
+
 async def get_invoices_for_user(db: AsyncSession, user_id):
     stmt = select(Invoice).where(Invoice.user_id == user_id).order_by(Invoice.created_at.desc())
     result = await db.execute(stmt)
@@ -72,6 +123,7 @@ def invoice_to_dict(invoice) -> dict:
         "raw_text": invoice.raw_text,
         "processed": invoice.processed,
         "created_at": invoice.created_at,
+        "index_status": invoice.index_status,
     }
 
 # 1) Paginated invoices
@@ -106,8 +158,10 @@ async def delete_invoice(db: AsyncSession, invoice_id, soft: bool = True):
         if not invoice:
             return None
         invoice.processed = False
+        invoice.index_status = "deleted"
         await db.commit()
         await db.refresh(invoice)
+        await remove_from_index([invoice.id])
         return invoice_to_dict(invoice)
     else:
         # hard delete
@@ -115,7 +169,10 @@ async def delete_invoice(db: AsyncSession, invoice_id, soft: bool = True):
         res = await db.execute(stmt)
         await db.commit()
         invoice_obj = res.scalars().first()
-        return invoice_to_dict(invoice_obj) if invoice_obj else None
+        if not invoice_obj:
+            return None
+        await remove_from_index([invoice_obj.id])
+        return invoice_to_dict(invoice_obj)
 
 # 4) Dashboard stats
 async def get_dashboard_stats(db: AsyncSession, user_id: Optional[str] = None):
@@ -130,37 +187,57 @@ async def get_dashboard_stats(db: AsyncSession, user_id: Optional[str] = None):
     # Get previous month start and end
     prev_month_start = current_month_start - relativedelta(months=1)
     
-    # Total invoices count
-    total_stmt = select(func.count()).select_from(Invoice)
-    sum_stmt = select(func.coalesce(func.sum(Invoice.total_amount), 0))
-    vendor_stmt = select(Invoice.vendor_name, func.count().label("count"), func.coalesce(func.sum(Invoice.total_amount), 0).label("sum")).group_by(Invoice.vendor_name).order_by(desc("sum")).limit(10)
-
-    # Current month stats
-    current_month_count_stmt = select(func.count()).select_from(Invoice).where(Invoice.created_at >= current_month_start, Invoice.created_at < next_month)
-    current_month_sum_stmt = select(func.coalesce(func.sum(Invoice.total_amount), 0)).where(Invoice.created_at >= current_month_start, Invoice.created_at < next_month)
-    
-    # Previous month stats
-    prev_month_count_stmt = select(func.count()).select_from(Invoice).where(Invoice.created_at >= prev_month_start, Invoice.created_at < current_month_start)
-    prev_month_sum_stmt = select(func.coalesce(func.sum(Invoice.total_amount), 0)).where(Invoice.created_at >= prev_month_start, Invoice.created_at < current_month_start)
+    in_current_month = and_(Invoice.created_at >= current_month_start, Invoice.created_at < next_month)
+    in_prev_month = and_(Invoice.created_at >= prev_month_start, Invoice.created_at < current_month_start)
 
+    # One statement, one scan of the user's invoices: count/sum per (vendor, currency)
+    # with the month figures as FILTER aggregates, then totals, top vendors and
+    # currencies rolled up from those groups.
+    groups_stmt = (
+        select(
+            Invoice.vendor_name,
+            Invoice.currency,
+            func.count().label("invoices"),
+            func.coalesce(func.sum(Invoice.total_amount), 0).label("amount"),
+            func.count().filter(in_current_month).label("current_month_count"),
+            func.coalesce(func.sum(Invoice.total_amount).filter(in_current_month), 0).label("current_month_sum"),
+            func.count().filter(in_prev_month).label("prev_month_count"),
+            func.coalesce(func.sum(Invoice.total_amount).filter(in_prev_month), 0).label("prev_month_sum"),
+        )
+        .group_by(Invoice.vendor_name, Invoice.currency)
+    )
     if user_id:
-        total_stmt = total_stmt.where(Invoice.user_id == user_id)
-        sum_stmt = sum_stmt.where(Invoice.user_id == user_id)
-        vendor_stmt = vendor_stmt.where(Invoice.user_id == user_id)
-        current_month_count_stmt = current_month_count_stmt.where(Invoice.user_id == user_id)
-        current_month_sum_stmt = current_month_sum_stmt.where(Invoice.user_id == user_id)
-        prev_month_count_stmt = prev_month_count_stmt.where(Invoice.user_id == user_id)
-        prev_month_sum_stmt = prev_month_sum_stmt.where(Invoice.user_id == user_id)
-
-    total = (await db.execute(total_stmt)).scalar_one()
-    total_expenses = (await db.execute(sum_stmt)).scalar_one()
-    vendor_rows = (await db.execute(vendor_stmt)).all()
-
-    # Get current and previous month data
-    current_month_count = (await db.execute(current_month_count_stmt)).scalar_one()
-    current_month_sum = (await db.execute(current_month_sum_stmt)).scalar_one()
-    prev_month_count = (await db.execute(prev_month_count_stmt)).scalar_one()
-    prev_month_sum = (await db.execute(prev_month_sum_stmt)).scalar_one()
+        groups_stmt = groups_stmt.where(Invoice.user_id == user_id)
+    groups = groups_stmt.cte("groups")
+
+    figures = ("invoices", "amount", "current_month_count", "current_month_sum", "prev_month_count", "prev_month_sum")
+
+    def rollup(kind, key, *summed):
+        # Typed NULLs: Postgres types a bare NULL in a subquery as text, which won't UNION with numeric
+        columns = [
+            func.sum(groups.c[name]).label(name) if name in summed else cast(null(), groups.c[name].type).label(name)
+            for name in figures
+        ]
+        return select(literal_column(f"'{kind}'").label("kind"), key.label("key"), *columns)
+
+    totals_stmt = rollup("total", cast(null(), String), *figures)
+    vendor_stmt = (
+        rollup("vendor", groups.c.vendor_name, "invoices", "amount")
+        .group_by(groups.c.vendor_name)
+        .order_by(desc("amount"))
+        .limit(10)
+        .subquery()
+    )
+    currency_stmt = rollup("currency", groups.c.currency, "amount").group_by(groups.c.currency)
+    rows = (await db.execute(union_all(totals_stmt, select(vendor_stmt), currency_stmt))).all()
+
+    totals = next(r for r in rows if r.kind == "total")
+    total = totals.invoices or 0
+    total_expenses = totals.amount or 0
+    current_month_count = int(totals.current_month_count or 0)
+    current_month_sum = totals.current_month_sum or 0
+    prev_month_count = int(totals.prev_month_count or 0)
+    prev_month_sum = totals.prev_month_sum or 0
 
     # Calculate trends (percentage change)
     invoice_trend = 0.0
@@ -172,14 +249,10 @@ async def get_dashboard_stats(db: AsyncSession, user_id: Optional[str] = None):
     if prev_month_sum > 0:
         expense_trend = ((current_month_sum - prev_month_sum) / prev_month_sum) * 100
 
-    top_vendors = [{"vendor_name": v[0], "count": int(v[1]), "sum": float(v[2] or 0)} for v in vendor_rows]
-
-    # Expenses by currency aggregation
-    currency_stmt = select(Invoice.currency, func.coalesce(func.sum(Invoice.total_amount), 0)).group_by(Invoice.currency)
-    if user_id:
-        currency_stmt = currency_stmt.where(Invoice.user_id == user_id)
-    currency_rows = (await db.execute(currency_stmt)).all()
-    expenses_by_currency = [{"currency": r[0] or "UNKNOWN", "sum": float(r[1] or 0)} for r in currency_rows]
+    # UNION ALL doesn't keep the subquery's ORDER BY: sort the (at most 10) vendor rows here
+    vendor_rows = sorted((r for r in rows if r.kind == "vendor"), key=lambda r: r.amount or 0, reverse=True)
+    top_vendors = [{"vendor_name": r.key, "count": int(r.invoices), "sum": float(r.amount or 0)} for r in vendor_rows]
+    expenses_by_currency = [{"currency": r.key or "UNKNOWN", "sum": float(r.amount or 0)} for r in rows if r.kind == "currency"]
 
     return {
         "total_invoices": int(total),
@@ -0,0 +1,179 @@
+# services/embedding_cache.py
+"""
+Content-addressed cache in front of the embedding API.
+
+Invoices repeat a lot of byte-identical text (vendor footers, payment
+terms), so chunk vectors are cached by SHA-256 of (model, text) in a local
+SQLite file (float32 blobs), shared by the uvicorn workers on the host.
+Only cache misses are sent to the API, de-duplicated and packed into as few
+requests as the provider allows (EMBEDDING_BATCH_SIZE inputs and
+EMBEDDING_MAX_BATCH_TOKENS tokens per request).
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+
+from services import metrics
+from services.tokenizer import count_embedding_tokens
+
+load_dotenv()
+
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+EMBEDDING_CACHE_PATH = Path(os.getenv("EMBEDDING_CACHE_PATH", "cache/embedding_cache.db"))
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "100000"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "2048"))  # OpenAI: max inputs per request
+EMBEDDING_MAX_BATCH_TOKENS = int(os.getenv("EMBEDDING_MAX_BATCH_TOKENS", "250000"))  # OpenAI: 300k per request
+
+_SQL_VARIABLES = 500  # keys per IN (...) lookup
+
+_lock = threading.Lock()
+_conn: Optional[sqlite3.Connection] = None
+
+
+def _get_conn() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        EMBEDDING_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(EMBEDDING_CACHE_PATH, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_accessed ON embeddings (accessed_at)")
+        conn.commit()
+        _conn = conn
+    return _conn
+
+
+def _key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+def get_cached_vectors(keys: list[str]) -> dict:
+    if not EMBEDDING_CACHE_ENABLED or not keys:
+        return {}
+    found = {}
+    now = time.time()
+    with _lock:
+        conn = _get_conn()
+        for start in range(0, len(keys), _SQL_VARIABLES):
+            batch = keys[start:start + _SQL_VARIABLES]
+            placeholders = ",".join("?" * len(batch))
+            for key, blob in conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch):
+                found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+        if found:
+            conn.executemany("UPDATE embeddings SET accessed_at = ? WHERE key = ?", [(now, key) for key in found])
+            conn.commit()
+    return found
+
+
+def store_vectors(vectors: dict) -> None:
+    if not EMBEDDING_CACHE_ENABLED or not vectors:
+        return
+    now = time.time()
+    with _lock:
+        conn = _get_conn()
+        conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vector, accessed_at) VALUES (?, ?, ?)",
+            [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in vectors.items()],
+        )
+        _evict(conn)
+        conn.commit()
+
+
+def _evict(conn: sqlite3.Connection) -> None:
+    # Least recently used entries beyond the entry limit
+    (count,) = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+    excess = count - EMBEDDING_CACHE_MAX_ENTRIES
+    if excess > 0:
+        conn.execute(
+            "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY accessed_at ASC LIMIT ?)",
+            (excess,),
+        )
+
+
+def clear_embedding_cache() -> None:
+    with _lock:
+        conn = _get_conn()
+        conn.execute("DELETE FROM embeddings")
+        conn.commit()
+
+
+def _request_batches(texts: list[str]):
+    """Split texts into API requests under both the input-count and token limits."""
+    batch, tokens = [], 0
+    for text in texts:
+        cost = count_embedding_tokens(text)
+        if batch and (len(batch) >= EMBEDDING_BATCH_SIZE or tokens + cost > EMBEDDING_MAX_BATCH_TOKENS):
+            yield batch
+            batch, tokens = [], 0
+        batch.append(text)
+        tokens += cost
+    if batch:
+        yield batch
+
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an Embeddings model with the cache and request batching."""
+
+    def __init__(self, embeddings: Embeddings, model: Optional[str] = None):
+        self.embeddings = embeddings
+        self.model = model or getattr(embeddings, "model", type(embeddings).__name__)
+
+    def embed_with_stats(self, texts: list[str]) -> tuple[list[list[float]], dict]:
+        """
+        Returns (vectors, stats); stats has `cached` (one flag per text),
+        `hits`, `misses` and `api_requests`.
+        """
+        keys = [_key(self.model, text) for text in texts]
+        vectors = get_cached_vectors(list(set(keys)))
+        cached = [key in vectors for key in keys]
+
+        # Unique misses only: the same footer twice in one batch is embedded once
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+
+        api_requests = 0
+        if missing:
+            new_vectors = {}
+            miss_keys = list(missing)
+            position = 0
+            for batch in _request_batches(list(missing.values())):
+                for key, vector in zip(miss_keys[position:position + len(batch)], self.embeddings.embed_documents(batch)):
+                    new_vectors[key] = vector
+                position += len(batch)
+                api_requests += 1
+            store_vectors(new_vectors)
+            vectors.update(new_vectors)
+
+        hits = sum(cached)
+        metrics.increment("embedding_cache_lookups", len(texts))
+        metrics.increment("embedding_cache_hits", hits)
+        metrics.increment("embedding_cache_misses", len(texts) - hits)
+        metrics.increment("embedding_api_requests", api_requests)
+        stats = {"cached": cached, "hits": hits, "misses": len(texts) - hits, "api_requests": api_requests}
+        return [vectors[key] for key in keys], stats
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.embed_with_stats(texts)[0]
+
+    def embed_query(self, text: str) -> list[float]:
+        # Queries are rarely repeated verbatim and must stay fast: no cache
+        return self.embeddings.embed_query(text)
@@ -0,0 +1,144 @@
+# services/extraction_cache.py
+"""
+Content-addressed cache for invoice extractions.
+
+Entries are keyed by the SHA-256 of the uploaded bytes plus the extraction
+version (prompt version + model), so re-uploads of the same file skip text
+extraction and the LLM entirely. Backed by a local SQLite file so it survives
+restarts and is shared between uvicorn workers on the same host.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CACHE_ENABLED = os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+CACHE_PATH = Path(os.getenv("EXTRACTION_CACHE_PATH", "cache/extraction_cache.db"))
+CACHE_MAX_ENTRIES = int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", "10000"))
+CACHE_MAX_BYTES = int(os.getenv("EXTRACTION_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))  # 256MB
+CACHE_MAX_AGE_SECONDS = float(os.getenv("EXTRACTION_CACHE_MAX_AGE_DAYS", "30")) * 86400
+
+_lock = threading.Lock()
+_conn: Optional[sqlite3.Connection] = None
+
+
+def _get_conn() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(CACHE_PATH, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS extractions (
+                key TEXT PRIMARY KEY,
+                raw_text TEXT NOT NULL,
+                structured TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_extractions_accessed ON extractions (accessed_at)")
+        conn.commit()
+        _conn = conn
+    return _conn
+
+
+def hash_bytes(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def hash_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def build_cache_key(content_sha256: str, extraction_version: str) -> str:
+    """Cache key = content hash + whatever determines the extraction output."""
+    return f"{content_sha256}:{extraction_version}"
+
+
+def get_cached_extraction(key: str) -> Optional[dict]:
+    """Return {"text", "structured"} for a cache hit, or None."""
+    if not CACHE_ENABLED:
+        return None
+
+    now = time.time()
+    with _lock:
+        conn = _get_conn()
+        row = conn.execute(
+            "SELECT raw_text, structured, created_at FROM extractions WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        raw_text, structured, created_at = row
+        if now - created_at > CACHE_MAX_AGE_SECONDS:
+            conn.execute("DELETE FROM extractions WHERE key = ?", (key,))
+            conn.commit()
+            return None
+
+        conn.execute("UPDATE extractions SET accessed_at = ? WHERE key = ?", (now, key))
+        conn.commit()
+
+    return {"text": raw_text, "structured": json.loads(structured)}
+
+
+def store_extraction(key: str, text: str, structured: dict) -> None:
+    if not CACHE_ENABLED:
+        return
+
+    payload = json.dumps(structured, default=str)
+    size = len(text.encode("utf-8")) + len(payload)
+    now = time.time()
+    with _lock:
+        conn = _get_conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO extractions (key, raw_text, structured, size, created_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (key, text, payload, size, now, now),
+        )
+        _evict(conn, now)
+        conn.commit()
+
+
+def _evict(conn: sqlite3.Connection, now: float) -> None:
+    # 1️⃣ Age-based: drop anything older than the max age
+    conn.execute("DELETE FROM extractions WHERE created_at < ?", (now - CACHE_MAX_AGE_SECONDS,))
+
+    # 2️⃣ Size-based: drop least recently used entries until both limits hold
+    count, total_size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM extractions").fetchone()
+    if count <= CACHE_MAX_ENTRIES and total_size <= CACHE_MAX_BYTES:
+        return
+
+    excess_entries = max(count - CACHE_MAX_ENTRIES, 0)
+    excess_bytes = max(total_size - CACHE_MAX_BYTES, 0)
+    to_delete = []
+    freed = 0
+    for key, size in conn.execute("SELECT key, size FROM extractions ORDER BY accessed_at ASC"):
+        if len(to_delete) >= excess_entries and freed >= excess_bytes:
+            break
+        to_delete.append((key,))
+        freed += size
+    conn.executemany("DELETE FROM extractions WHERE key = ?", to_delete)
+
+
+def clear_cache() -> None:
+    with _lock:
+        conn = _get_conn()
+        conn.execute("DELETE FROM extractions")
+        conn.commit()
@@ -1,74 +1,180 @@
 # Services/extractor.py
-import os
-import pytesseract
-from pdfminer.high_level import extract_text
-from PIL.Image import Image
-from langchain_components.chains import build_extraction_chain
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_openai import ChatOpenAI
+import asyncio
+import mmap
+import time
+from pathlib import Path
+from langchain_components.chains import EXTRACTION_PROMPT_VERSION
 from dotenv import load_dotenv
-from services.chunker import chunk_text
-from services.vectorstore import add_invoice_chunks
+from services.extraction_cache import build_cache_key, get_cached_extraction, hash_bytes, hash_file, store_extraction
+from services.text_extraction import extract_text_from_source
+from services.workers import run_cpu_bound
+from services.llm_router import route_extraction, LLM_ROUTER_PROVIDERS
+from services.llm_provider import LLM_MODEL
+from services.batch_llm import extract_packed
+from services.prompt_compactor import compact_prompt_text, PROMPT_COMPACTION_ENABLED, PROMPT_COMPACTOR_VERSION, PROMPT_TOKEN_BUDGET
+from services.rule_extractor import (
+    extract_fields, unresolved_fields, confident_values,
+    ALL_FIELDS, RULE_EXTRACTION_ENABLED, RULE_EXTRACTOR_VERSION,
+)
+from services.layout_templates import (
+    read_layout, extract_with_template, validate_extraction, learn_from_extraction,
+    record_hit, invalidate_template, TEMPLATES_ENABLED,
+)
+from services.image_preprocess import PREPROCESS_VERSION, OCR_SETTINGS_HASH
+from services import metrics
 # from config import get_llm 
 
 load_dotenv()
 
-async def extract_invoice_data(file):
+# Anything that changes the extraction output must be part of the cache key
+EXTRACTION_VERSION = (
+    f"{EXTRACTION_PROMPT_VERSION}:{LLM_ROUTER_PROVIDERS}:rules-{RULE_EXTRACTOR_VERSION if RULE_EXTRACTION_ENABLED else 'off'}"
+    f":compact-{f'{PROMPT_COMPACTOR_VERSION}/{PROMPT_TOKEN_BUDGET}' if PROMPT_COMPACTION_ENABLED else 'off'}"
+    f":ocr-{PREPROCESS_VERSION}/{OCR_SETTINGS_HASH}:templates-{'on' if TEMPLATES_ENABLED else 'off'}"
+)
+
+
+def _apply_layout_template(source):
+    layout = read_layout(source)
+    return layout, extract_with_template(layout)
+
+
+async def extract_invoice_data(source, filename: str, content_hash: str | None = None, user_id=None, llm_batching: bool = False):
     """
     Takes a file (PDF or image), extracts text using OCR or PDF parser,
     then runs LangChain extraction to identify key invoice fields.
+
+    `source` is either a path to a file already on disk (temp upload,
+    UPLOAD_DIR copy, queued job, batch entry) or an in-memory buffer
+    (bytes / memoryview / mmap). Paths are read in place, never copied.
+    `user_id` is used for fair queuing of LLM calls between users.
+    `llm_batching` packs the LLM call together with other concurrent
+    documents (bulk backfills, see services/batch_llm.py).
+    Returns the extraction result plus per-stage timings in seconds.
     """
+    if isinstance(source, Path):
+        source = str(source)
+    elif isinstance(source, (memoryview, mmap.mmap, bytearray)):
+        source = bytes(source)  # process-pool workers need a picklable buffer
+
+    timings = {}
+
+    # --- Step 0: Content-addressed cache lookup ---
+    started = time.perf_counter()
+    if content_hash is None:
+        if isinstance(source, bytes):
+            content_hash = hash_bytes(source)
+        else:
+            content_hash = await asyncio.to_thread(hash_file, source)
+    cache_key = build_cache_key(content_hash, EXTRACTION_VERSION)
+    cached = get_cached_extraction(cache_key)
+    timings["cache_lookup"] = time.perf_counter() - started
+    if cached:
+        metrics.increment("extraction_cache_hits")
+        return {
+            "text": cached["text"],
+            "structured": cached["structured"],
+            "cached": True,
+            "timings": timings,
+        }
+
+    # --- Step 2: Extract text (CPU-bound → process pool, off the event loop) ---
+    started = time.perf_counter()
+    text = await run_cpu_bound(extract_text_from_source, source, filename)
+    timings["text_extraction"] = time.perf_counter() - started
 
-    # --- Step 1: Save uploaded file temporarily ---
-    temp_path = f"/tmp/{file.filename}"
-    with open(temp_path, "wb") as f:
-        f.write(await file.read())
+    if not text.strip():
+        return {"error": "No text could be extracted from file.", "timings": timings}
 
-    # --- Step 2: Extract text ---
-    text = ""
-    if file.filename.lower().endswith(".pdf"):
-        try:
-            text = extract_text(temp_path)
-        except Exception as e:
-            print("PDF extraction error:", e)
-    else:
+    # --- Step 3: Vendor layout template (repeat vendors, PDFs only) ---
+    structured_data, method, layout, fields, missing = None, None, None, {}, []
+    if TEMPLATES_ENABLED and filename.lower().endswith(".pdf"):
+        started = time.perf_counter()
         try:
-            img = Image.open(temp_path)
-            text = pytesseract.image_to_string(img)
+            layout, template_values = await asyncio.to_thread(_apply_layout_template, source)
         except Exception as e:
-            print("OCR error:", e)
-
-    if not text.strip():
-        return {"error": "No text could be extracted from file."}
-
-    # --- Step 3: Run LangChain extraction ---
-    # llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash")
-    # llm = get_llm()
-    llm = ChatOpenAI(model="gpt-4o-mini")
-    extract_chain = build_extraction_chain(llm)
-    result = extract_chain(text)  # ✅ call the returned function directly
+            print("Layout template error:", e)
+            template_values = None
+        if template_values is not None:
+            if validate_extraction(template_values, text):
+                structured_data, method = template_values, "template"
+                record_hit(layout["fingerprint"])
+            else:
+                # The vendor changed its layout (or the template was wrong): relearn
+                invalidate_template(layout["fingerprint"])
+                metrics.increment("template_invalidations")
+        timings["template_extraction"] = time.perf_counter() - started
+
+    if structured_data is None:
+        # --- Step 3a: Rule-based fast path (regexes, currency symbols, dates) ---
+        started = time.perf_counter()
+        fields = extract_fields(text) if RULE_EXTRACTION_ENABLED else {}
+        structured_data = confident_values(fields)
+        missing = unresolved_fields(fields) if RULE_EXTRACTION_ENABLED else list(ALL_FIELDS)
+        timings["rule_extraction"] = time.perf_counter() - started
+
+        # --- Step 3b: LLM only for what the rules couldn't resolve ---
+        if missing:
+            # Only invoice-relevant text goes into the prompt, within a token budget
+            started = time.perf_counter()
+            prompt_text = text
+            if PROMPT_COMPACTION_ENABLED:
+                prompt_text, compaction = compact_prompt_text(text, model=LLM_MODEL)
+                metrics.increment("prompt_tokens_original", compaction["original_tokens"])
+                metrics.increment("prompt_tokens_saved", compaction["tokens_saved"])
+                timings["prompt_compaction"] = time.perf_counter() - started
+
+            started = time.perf_counter()
+            if llm_batching:
+                # Full schema in a shared request; only the missing fields are used below
+                result = await extract_packed(prompt_text, user_id=user_id)
+            else:
+                # Fastest healthy provider; rate limits, fairness and retries via the scheduler
+                result = await route_extraction(prompt_text, None if len(missing) == len(ALL_FIELDS) else missing, user_id=user_id)
+            method = "llm" if len(missing) == len(ALL_FIELDS) else "rules+llm"
+            timings["llm_extraction"] = time.perf_counter() - started
+
+            llm_data = result if isinstance(result, dict) else result.dict()
+            for name in missing:
+                # Keep a low-confidence rule value rather than nothing
+                fallback = fields[name]["value"] if name in fields else None
+                value = llm_data.get(name)
+                structured_data[name] = value if value not in (None, "") else fallback
+        else:
+            method = "rules"
+
+        for name in ALL_FIELDS:
+            # Weak optional rule values ("$" → USD) beat nothing when the LLM wasn't asked
+            structured_data.setdefault(name, fields[name]["value"] if name in fields else None)
+
+        # Teach the vendor template from validated extractions
+        if layout and validate_extraction(structured_data, text):
+            try:
+                await asyncio.to_thread(learn_from_extraction, layout, structured_data)
+            except Exception as e:
+                print("Layout template learning error:", e)
+
+    metrics.increment("extractions_total")
+    metrics.increment(f"extractions_method_{method}")
+    metrics.increment("llm_fields_requested", len(missing))
+    if method in ("rules", "template"):
+        metrics.increment("extractions_llm_skipped")
+
+    # --- Step 4: Semantic search indexing happens in the background indexer
+    # (services/indexer.py) once the invoice row is saved ---
 
-    
-    structured_data = result if isinstance(result, dict) else result.dict()
-
-      
-    # --- Step 4: Optional – Prepare for semantic search ---
     try:
-        chunks = chunk_text(text)
-        metadata = {"filename": file.filename}
-        invoice_id = structured_data.get("invoice_id", file.filename)
-        add_invoice_chunks(invoice_id, chunks, metadata)
+        store_extraction(cache_key, text, structured_data)
     except Exception as e:
-        print("Vectorstore error:", e)
-
-   
-    # --- Step 5: Clean up ---
-    os.remove(temp_path)
+        print("Extraction cache error:", e)
 
     return {
-        "invoice_id": structured_data.get("invoice_id"),
         "text": text,
-        "structured": structured_data
+        "structured": structured_data,
+        "cached": False,
+        "extraction_method": method,
+        "field_confidence": {name: f["confidence"] for name, f in fields.items()},
+        "timings": timings,
     }
    
    
@@ -0,0 +1,490 @@
+# services/faiss_store.py
+"""
+FAISS vector backend (VECTOR_BACKEND=faiss), for indexes too large for Chroma.
+
+Layout (FAISS_PATH):
+    meta.db            SQLite: one row per live chunk — metadata, filter
+                       columns and the float32 vector (source of truth)
+    index-<gen>.faiss  the trained base index, built by `compact`
+
+The base index is opened memory-mapped and read-only, so every uvicorn
+worker on the host shares the same pages and RSS stays flat as it grows
+(IVF indexes; faiss reads HNSW graphs into each process's memory). Quantized
+(PQ/SQ) scores are approximate, so FAISS_REFINE × k candidates are re-ranked
+with the exact stored vectors.
+Chunks written after the last compaction (the "delta": ids above the
+base watermark) are searched exactly from an in-process matrix. Replaced
+or deleted chunks simply stop being live rows; their stale vectors in the
+base (tombstones, until the next compaction drops them) are never
+returned, because every search is restricted (IDSelector) to the live ids
+matching the tenant filter.
+
+Those ids are looked up once per filter and cached with their selector
+and delta positions (FAISS_SELECTOR_CACHE filters per process), so a
+search costs O(tenant size) only after the tenant's chunks changed:
+every write bumps a per-tenant version in meta.db, which invalidates that
+tenant's cached filters in every worker, and a compaction invalidates all.
+
+Compaction retrains the index on a sample of live vectors, rebuilds it
+from every live row and swaps it in atomically; workers pick up the new
+generation on their next search. It runs automatically after the index
+write that takes the delta past FAISS_COMPACT_DELTA rows (which keeps
+the in-memory delta bounded), and can be run by hand or from cron:
+
+    python -m services.faiss_store compact
+    python -m services.faiss_store stats
+
+Env vars:
+    FAISS_PATH               index directory
+    FAISS_INDEX              faiss index_factory spec, e.g. "IVF4096,PQ64",
+                             "IVF1024,SQ8", "HNSW32" or "HNSW32_SQ8"
+    FAISS_NPROBE             IVF lists probed per search
+    FAISS_EF_SEARCH          HNSW search depth
+    FAISS_EXACT_SEARCH_MAX   filters matching fewer chunks are searched exactly
+    FAISS_TRAIN_SAMPLE       vectors used to train IVF/PQ/SQ
+    FAISS_REFINE             ANN candidates per result, re-ranked with exact scores
+    FAISS_COMPACT_DELTA      compact once this many chunks were written since the last compaction (0 = never)
+    FAISS_SELECTOR_CACHE     filters whose allowed ids are cached per process
+"""
+import argparse
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+import faiss
+import numpy as np
+from dotenv import load_dotenv
+
+from services.lexical_index import filter_clause
+
+load_dotenv()
+
+FAISS_PATH = Path(os.getenv("FAISS_PATH", "vector_store/faiss"))
+FAISS_INDEX = os.getenv("FAISS_INDEX", "IVF1024,PQ64")
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))
+FAISS_EXACT_SEARCH_MAX = int(os.getenv("FAISS_EXACT_SEARCH_MAX", "2000"))
+FAISS_TRAIN_SAMPLE = int(os.getenv("FAISS_TRAIN_SAMPLE", "50000"))
+FAISS_REFINE = int(os.getenv("FAISS_REFINE", "10"))
+FAISS_COMPACT_DELTA = int(os.getenv("FAISS_COMPACT_DELTA", "100000"))
+FAISS_SELECTOR_CACHE = int(os.getenv("FAISS_SELECTOR_CACHE", "1024"))
+
+FILTER_BOOST_MAX = 16  # max nprobe/efSearch multiplier for selective filters
+_ADD_BATCH = 10000
+_SQL_VARIABLES = 500
+
+_lock = threading.Lock()
+_conn: Optional[sqlite3.Connection] = None
+_base = {"generation": None, "index": None}
+_delta = {"generation": None, "last_id": 0, "ids": np.empty(0, dtype=np.int64), "vectors": None}
+_selectors: "OrderedDict[tuple, dict]" = OrderedDict()  # filter → allowed ids, selector, delta positions
+
+
+def _get_conn() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        FAISS_PATH.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(FAISS_PATH / "meta.db", check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS vectors (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chunk_id TEXT NOT NULL UNIQUE,
+                invoice_id TEXT NOT NULL,
+                user_id TEXT,
+                vendor TEXT,
+                invoice_day INTEGER,
+                currency TEXT,
+                text TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                vector BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_vectors_invoice ON vectors (invoice_id);
+            CREATE INDEX IF NOT EXISTS idx_vectors_user ON vectors (user_id);
+            CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS tenants (user_id TEXT PRIMARY KEY, version INTEGER NOT NULL);
+            """
+        )
+        conn.commit()
+        _conn = conn
+    return _conn
+
+
+def _state(conn: sqlite3.Connection) -> dict:
+    state = dict(conn.execute("SELECT key, value FROM state").fetchall())
+    return {
+        "generation": int(state.get("generation", 0)),
+        "watermark": int(state.get("watermark", 0)),
+        "spec": state.get("spec"),
+        "base_vectors": int(state.get("base_vectors", 0)),
+    }
+
+
+def _normalized(vectors) -> np.ndarray:
+    matrix = np.ascontiguousarray(vectors, dtype=np.float32)
+    faiss.normalize_L2(matrix)  # inner product = cosine similarity
+    return matrix
+
+
+def _from_blobs(blobs) -> np.ndarray:
+    return np.vstack([np.frombuffer(blob, dtype=np.float32) for blob in blobs])
+
+
+# 1) Writes (callers hold vectorstore.write_lock)
+def _delete(conn: sqlite3.Connection, invoice_ids: list[str]) -> set:
+    """Delete the invoices' rows; returns the tenants they belonged to."""
+    users = set()
+    for start in range(0, len(invoice_ids), _SQL_VARIABLES):
+        batch = invoice_ids[start:start + _SQL_VARIABLES]
+        placeholders = ",".join("?" * len(batch))
+        users.update(row[0] for row in conn.execute(f"SELECT DISTINCT user_id FROM vectors WHERE invoice_id IN ({placeholders})", batch))
+        conn.execute(f"DELETE FROM vectors WHERE invoice_id IN ({placeholders})", batch)
+    return users
+
+
+def _bump_tenants(conn: sqlite3.Connection, users) -> None:
+    """The tenants' chunks changed: their cached filters (in every worker) are stale."""
+    conn.executemany(
+        "INSERT INTO tenants (user_id, version) VALUES (?, 1) ON CONFLICT (user_id) DO UPDATE SET version = version + 1",
+        [(user,) for user in users if user is not None],
+    )
+
+
+def replace_chunks(invoice_ids: list[str], ids: list[str], texts: list[str], metadatas: list[dict], embeddings) -> None:
+    """Replace every chunk of `invoice_ids`; new rows land in the delta until the next compaction."""
+    rows = [
+        (
+            chunk_id, meta["invoice_id"], meta.get("user_id"), meta.get("vendor"), meta.get("invoice_day"),
+            meta.get("currency"), text, json.dumps(meta), vector.tobytes(),
+        )
+        for chunk_id, text, meta, vector in zip(ids, texts, metadatas, _normalized(embeddings) if ids else [])
+    ]
+    with _lock:
+        conn = _get_conn()
+        with conn:
+            users = _delete(conn, invoice_ids)
+            conn.executemany(
+                "INSERT INTO vectors (chunk_id, invoice_id, user_id, vendor, invoice_day, currency, text, metadata, vector) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            _bump_tenants(conn, users | {row[2] for row in rows})
+
+
+def delete_invoices(invoice_ids: list[str]) -> None:
+    with _lock:
+        conn = _get_conn()
+        with conn:
+            _bump_tenants(conn, _delete(conn, invoice_ids))
+
+
+def clear() -> None:
+    with _lock:
+        conn = _get_conn()
+        with conn:
+            conn.execute("DELETE FROM vectors")
+            # Keep the generation monotonic: a worker still holding the old base must see a
+            # new generation (one without a base index, until the next compaction)
+            generation = _state(conn)["generation"] + 1
+            conn.execute("DELETE FROM state")
+            conn.execute("INSERT INTO state (key, value) VALUES ('generation', ?)", (str(generation),))
+            conn.execute("UPDATE tenants SET version = version + 1")
+        for path in FAISS_PATH.glob("index-*.faiss"):
+            path.unlink()
+        _base.update(generation=None, index=None)
+        _delta.update(generation=None, last_id=0, ids=np.empty(0, dtype=np.int64), vectors=None)
+        _selectors.clear()
+
+
+def count() -> int:
+    with _lock:
+        return _get_conn().execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+
+
+def chunk_counts() -> dict:
+    """{invoice_id: number of live chunks}."""
+    with _lock:
+        return dict(_get_conn().execute("SELECT invoice_id, COUNT(*) FROM vectors GROUP BY invoice_id").fetchall())
+
+
+# 2) Reads
+def _index_path(generation: int) -> Path:
+    return FAISS_PATH / f"index-{generation}.faiss"
+
+
+def _refresh(conn: sqlite3.Connection) -> dict:
+    """Reopen the base after a compaction and pull new delta rows (caller holds _lock)."""
+    state = _state(conn)
+    if _base["generation"] != state["generation"]:
+        index = None
+        if state["spec"]:
+            # Memory-mapped + read-only: pages are shared by every worker on the host
+            index = faiss.read_index(str(_index_path(state["generation"])), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        _base.update(generation=state["generation"], index=index)
+    if _delta["generation"] != state["generation"]:
+        _delta.update(generation=state["generation"], last_id=state["watermark"], ids=np.empty(0, dtype=np.int64), vectors=None)
+
+    rows = conn.execute("SELECT id, vector FROM vectors WHERE id > ? ORDER BY id", (_delta["last_id"],)).fetchall()
+    if rows:
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        vectors = _from_blobs(row[1] for row in rows)
+        _delta["ids"] = np.concatenate([_delta["ids"], ids])
+        _delta["vectors"] = vectors if _delta["vectors"] is None else np.vstack([_delta["vectors"], vectors])
+        _delta["last_id"] = int(ids[-1])
+    return state
+
+
+def warm() -> int:
+    with _lock:
+        conn = _get_conn()
+        _refresh(conn)
+        return conn.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+
+
+def _search_params(spec: str, selector, boost: float):
+    if spec.startswith("IVF"):
+        nlist = int(re.match(r"IVF(\d+)", spec).group(1))
+        return faiss.SearchParametersIVF(sel=selector, nprobe=min(nlist, math.ceil(FAISS_NPROBE * boost)))
+    if "HNSW" in spec:
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=math.ceil(FAISS_EF_SEARCH * boost))
+    return faiss.SearchParameters(sel=selector)
+
+
+def _top_k(scores: np.ndarray, ids: np.ndarray, k: int) -> list[tuple[int, float]]:
+    if len(ids) > k:
+        best = np.argpartition(-scores, k)[:k]
+        scores, ids = scores[best], ids[best]
+    order = np.argsort(-scores)
+    return [(int(ids[i]), float(scores[i])) for i in order]
+
+
+def _exact(conn: sqlite3.Connection, ids: np.ndarray, query: np.ndarray, k: int) -> list[tuple[int, float]]:
+    """Exact top-k among `ids`, scored against the stored float32 vectors."""
+    hits = []
+    for start in range(0, len(ids), _SQL_VARIABLES):
+        batch = ids[start:start + _SQL_VARIABLES].tolist()
+        rows = conn.execute(f"SELECT id, vector FROM vectors WHERE id IN ({','.join('?' * len(batch))})", batch).fetchall()
+        if rows:
+            found = np.array([row[0] for row in rows], dtype=np.int64)
+            hits.extend(_top_k(_from_blobs(row[1] for row in rows) @ query, found, k))
+    return sorted(hits, key=lambda hit: hit[1], reverse=True)[:k]
+
+
+def _tenant_version(conn: sqlite3.Connection, filters: dict) -> int:
+    row = conn.execute("SELECT version FROM tenants WHERE user_id = ?", (str(filters["user_id"]),)).fetchone()
+    return row[0] if row else 0
+
+
+def _allowed(conn: sqlite3.Connection, state: dict, filters: dict, version: tuple) -> dict:
+    """
+    The live ids matching `filters`: all of them, the base ones as an
+    IDSelector and the delta ones as positions in the delta matrix. Cached
+    per filter until `version` (generation, tenant version) changes
+    (caller holds _lock, after _refresh).
+    """
+    condition, params = filter_clause(filters)
+    key = (condition, tuple(params))
+    entry = _selectors.get(key)
+    if entry is not None and entry["version"] == version:
+        _selectors.move_to_end(key)
+        return entry
+
+    ids = np.fromiter((row[0] for row in conn.execute(f"SELECT id FROM vectors WHERE {condition}", params)), dtype=np.int64)
+    # Rows committed by another worker since _refresh aren't in the delta matrix yet; the
+    # version they bumped makes the next search rebuild this entry
+    ids = ids[ids <= max(_delta["last_id"], state["watermark"])]
+    base_ids = ids[ids <= state["watermark"]]
+    entry = {
+        "version": version,
+        "ids": ids,
+        "base_count": len(base_ids),
+        "selector": faiss.IDSelectorBatch(base_ids) if len(base_ids) else None,
+        "delta_positions": np.searchsorted(_delta["ids"], ids[ids > state["watermark"]]),
+    }
+    _selectors[key] = entry
+    while len(_selectors) > FAISS_SELECTOR_CACHE:
+        _selectors.popitem(last=False)
+    return entry
+
+
+def search(query_vector, k: int, filters: dict) -> list[tuple[str, dict, float]]:
+    """Top-k (text, metadata, cosine score) among the chunks matching `filters`."""
+    query = _normalized([query_vector])
+    with _lock:
+        conn = _get_conn()
+        # Read before _refresh: a write landing in between leaves the entry stale, never wrong
+        tenant_version = _tenant_version(conn, filters)
+        state = _refresh(conn)
+        allowed = _allowed(conn, state, filters, (state["generation"], tenant_version))
+        if not len(allowed["ids"]):
+            return []
+
+        if len(allowed["ids"]) <= FAISS_EXACT_SEARCH_MAX:
+            # Small tenant / filter: exact scores from the stored vectors
+            hits = _exact(conn, allowed["ids"], query[0], k)
+        else:
+            # Base: ANN restricted to the allowed ids; probe wider when the filter is selective
+            hits = []
+            if allowed["selector"] is not None and _base["index"] is not None:
+                boost = min(max(_base["index"].ntotal / allowed["base_count"], 1.0), FILTER_BOOST_MAX)
+                search_params = _search_params(state["spec"], allowed["selector"], boost)
+                # Quantized scores are approximate: over-fetch, then re-rank exactly
+                _, ids = _base["index"].search(query, k * FAISS_REFINE, params=search_params)
+                hits = _exact(conn, ids[0][ids[0] >= 0], query[0], k)
+            # Delta (chunks written since the last compaction): exact, from memory
+            positions = allowed["delta_positions"]
+            if len(positions):
+                hits += _top_k(_delta["vectors"][positions] @ query[0], _delta["ids"][positions], k)
+            hits = sorted(hits, key=lambda hit: hit[1], reverse=True)[:k]
+
+        if not hits:
+            return []
+        scores = dict(hits)
+        placeholders = ",".join("?" * len(scores))
+        rows = conn.execute(f"SELECT id, text, metadata FROM vectors WHERE id IN ({placeholders})", list(scores)).fetchall()
+    found = {row[0]: (row[1], json.loads(row[2])) for row in rows}
+    return [(*found[i], score) for i, score in hits if i in found]
+
+
+# 3) Compaction / retraining
+def _buildable_spec(spec: str, n: int) -> str:
+    """Fall back to a flat index while there are too few vectors to train `spec`."""
+    nlist = re.match(r"IVF(\d+)", spec)
+    if nlist and n < 39 * int(nlist.group(1)):
+        return "Flat"
+    if re.search(r"PQ\d+", spec) and n < 256 * 39:
+        return "Flat"
+    return spec
+
+
+def _delta_size(conn: sqlite3.Connection, state: dict) -> int:
+    return conn.execute("SELECT COUNT(*) FROM vectors WHERE id > ?", (state["watermark"],)).fetchone()[0]
+
+
+def compact(spec: str = FAISS_INDEX, min_delta: int = 0) -> Optional[dict]:
+    """
+    Retrain and rebuild the base index from every live chunk, then swap it
+    in. With `min_delta`, does nothing (returns None) unless that many chunks
+    were written since the last compaction.
+    """
+    from services.vectorstore import write_lock
+
+    started = time.perf_counter()
+    with write_lock():
+        with _lock:
+            conn = _get_conn()
+            state = _state(conn)
+            if min_delta and _delta_size(conn, state) < min_delta:
+                return None  # another worker got here first
+            n, watermark = conn.execute("SELECT COUNT(*), COALESCE(MAX(id), 0) FROM vectors").fetchone()
+        if not n:
+            return {"vectors": 0, "spec": None, "generation": state["generation"], "seconds": 0.0}
+
+        effective = _buildable_spec(spec, n)
+        factory = effective if effective.startswith("IVF") else f"IDMap2,{effective}"
+
+        # 1️⃣ Train on a random sample of live vectors
+        with _lock:
+            sample = conn.execute(
+                "SELECT vector FROM vectors ORDER BY RANDOM() LIMIT ?", (FAISS_TRAIN_SAMPLE,)
+            ).fetchall()
+        train = _from_blobs(row[0] for row in sample)
+        index = faiss.index_factory(train.shape[1], factory, faiss.METRIC_INNER_PRODUCT)
+        if not index.is_trained:
+            index.train(train)
+        del train, sample
+
+        # 2️⃣ Add every live vector, streamed in batches
+        last_id = 0
+        while True:
+            with _lock:
+                rows = conn.execute(
+                    "SELECT id, vector FROM vectors WHERE id > ? AND id <= ? ORDER BY id LIMIT ?",
+                    (last_id, watermark, _ADD_BATCH),
+                ).fetchall()
+            if not rows:
+                break
+            index.add_with_ids(_from_blobs(row[1] for row in rows), np.array([row[0] for row in rows], dtype=np.int64))
+            last_id = rows[-1][0]
+
+        # 3️⃣ Write the new generation, then point readers at it
+        generation = state["generation"] + 1
+        tmp = FAISS_PATH / f"index-{generation}.faiss.tmp"
+        faiss.write_index(index, str(tmp))
+        os.replace(tmp, _index_path(generation))
+        with _lock:
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)",
+                    [
+                        ("generation", str(generation)), ("watermark", str(watermark)),
+                        ("spec", effective), ("base_vectors", str(index.ntotal)),
+                    ],
+                )
+        # Keep the previous generation for workers that are just about to open it
+        # (open mmaps of deleted files stay valid anyway)
+        keep = {_index_path(generation), _index_path(generation - 1)}
+        for path in FAISS_PATH.glob("index-*.faiss"):
+            if path not in keep:
+                path.unlink()
+
+    return {
+        "vectors": int(index.ntotal),
+        "spec": effective,
+        "generation": generation,
+        "index_bytes": _index_path(generation).stat().st_size,
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+def compact_if_needed() -> Optional[dict]:
+    """Compact once the delta is past FAISS_COMPACT_DELTA chunks (vectorstore calls this after each write)."""
+    if FAISS_COMPACT_DELTA <= 0:
+        return None
+    with _lock:
+        conn = _get_conn()
+        if _delta_size(conn, _state(conn)) < FAISS_COMPACT_DELTA:
+            return None
+    try:
+        return compact(min_delta=FAISS_COMPACT_DELTA)
+    except Exception as e:
+        # The chunks are safely in meta.db; the next write retries
+        print("FAISS compaction failed:", e)
+        return None
+
+
+def stats() -> dict:
+    with _lock:
+        conn = _get_conn()
+        state = _state(conn)
+        total = conn.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+        delta = _delta_size(conn, state)
+    path = _index_path(state["generation"])
+    return {
+        **state,
+        "vectors": total,
+        "delta": delta,
+        # Base vectors whose chunk was deleted or replaced since the last compaction
+        "tombstones": max(0, state["base_vectors"] - (total - delta)),
+        "index_bytes": path.stat().st_size if state["spec"] and path.exists() else 0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FAISS vector index maintenance")
+    parser.add_argument("command", choices=["compact", "stats"])
+    parser.add_argument("--index", default=FAISS_INDEX, help="index_factory spec for compact")
+    args = parser.parse_args()
+    if args.command == "compact":
+        print(compact(args.index))
+    else:
+        print(stats())
@@ -0,0 +1,189 @@
+# services/image_preprocess.py
+"""
+Preprocessing for photographed receipts before Tesseract.
+
+Phone photos arrive as ~12MP colour JPEGs, far above what Tesseract needs.
+The pipeline (each step toggled by env vars):
+    1. decode at reduced size (JPEG draft mode) and cap the effective DPI
+    2. grayscale
+    3. crop to the detected document (paper) region
+    4. deskew (projection-profile search over small angles)
+    5. binarize (Otsu)
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+from dotenv import load_dotenv
+from PIL import Image, ImageOps
+
+load_dotenv()
+
+
+def _flag(name: str, default: str = "true") -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+OCR_PREPROCESS_ENABLED = _flag("OCR_PREPROCESS_ENABLED")
+OCR_TARGET_DPI = int(os.getenv("OCR_TARGET_DPI", "300"))
+OCR_MAX_LONG_SIDE = int(os.getenv("OCR_MAX_LONG_SIDE", "2200"))  # px, used when the image has no DPI info
+OCR_CROP = _flag("OCR_CROP")
+OCR_DESKEW = _flag("OCR_DESKEW")
+OCR_BINARIZE = _flag("OCR_BINARIZE")
+OCR_DESKEW_MAX_ANGLE = float(os.getenv("OCR_DESKEW_MAX_ANGLE", "5"))
+OCR_DESKEW_STEP = float(os.getenv("OCR_DESKEW_STEP", "0.5"))
+
+# LSTM engine + "single column of text of variable sizes" suits receipts;
+# preserve_interword_spaces keeps amount columns apart.
+TESSERACT_CONFIG = os.getenv("TESSERACT_CONFIG", "--oem 1 --psm 4 -c preserve_interword_spaces=1")
+
+# Bump when the pipeline itself changes; the settings hash covers the env vars.
+# Both are part of the extraction cache key (services/extractor.py).
+PREPROCESS_VERSION = "1"
+OCR_SETTINGS_HASH = hashlib.sha1(json.dumps([
+    OCR_PREPROCESS_ENABLED, OCR_TARGET_DPI, OCR_MAX_LONG_SIDE, OCR_CROP, OCR_DESKEW, OCR_BINARIZE,
+    OCR_DESKEW_MAX_ANGLE, OCR_DESKEW_STEP, TESSERACT_CONFIG,
+]).encode()).hexdigest()[:12]
+
+_ANALYSIS_SIZE = 800  # px, long side of the thumbnail used for crop/deskew analysis
+
+
+def _target_scale(img: Image.Image) -> float:
+    dpi = img.info.get("dpi")
+    if dpi and dpi[0] and dpi[0] > OCR_TARGET_DPI:
+        return OCR_TARGET_DPI / float(dpi[0])
+    long_side = max(img.size)
+    if long_side > OCR_MAX_LONG_SIDE:
+        return OCR_MAX_LONG_SIDE / long_side
+    return 1.0
+
+
+def load_image_for_ocr(source) -> Image.Image:
+    """
+    Open an image and downscale it as early as possible. For JPEGs, draft mode
+    lets libjpeg decode straight to grayscale at 1/2, 1/4 or 1/8 size, so the
+    full 12MP bitmap is never materialized.
+    """
+    img = Image.open(source)
+    if OCR_PREPROCESS_ENABLED:
+        scale = _target_scale(img)
+        if scale < 1.0:
+            w, h = img.size
+            img.draft("L", (int(w * scale), int(h * scale)))
+            dpi = img.info.get("dpi")
+            if dpi and img.size[0] != w:
+                # Keep the DPI metadata in step with the reduced decode size
+                ratio = img.size[0] / w
+                img.info["dpi"] = (dpi[0] * ratio, dpi[1] * ratio)
+    img = ImageOps.exif_transpose(img)
+    return img
+
+
+def otsu_threshold(gray: np.ndarray) -> int:
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    total = hist.sum()
+    if total == 0:
+        return 128
+    levels = np.arange(256)
+    weight_bg = np.cumsum(hist)
+    weight_fg = total - weight_bg
+    mean_cum = np.cumsum(hist * levels)
+    mean_total = mean_cum[-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_bg = mean_cum / weight_bg
+        mean_fg = (mean_total - mean_cum) / weight_fg
+        between = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+    return int(np.nanargmax(between))
+
+
+def _thumbnail(gray: Image.Image) -> tuple[Image.Image, float]:
+    factor = max(gray.size) / _ANALYSIS_SIZE
+    if factor <= 1:
+        return gray, 1.0
+    small = gray.resize((int(gray.width / factor), int(gray.height / factor)), Image.BILINEAR)
+    return small, factor
+
+
+def crop_to_document(gray: Image.Image) -> Image.Image:
+    """Crop to the bright paper region (rows/columns that are mostly paper)."""
+    small, factor = _thumbnail(gray)
+    arr = np.asarray(small)
+    paper = arr > otsu_threshold(arr)
+
+    rows = np.flatnonzero(paper.mean(axis=1) > 0.2)
+    cols = np.flatnonzero(paper.mean(axis=0) > 0.2)
+    if rows.size == 0 or cols.size == 0:
+        return gray
+
+    top, bottom = rows[0], rows[-1] + 1
+    left, right = cols[0], cols[-1] + 1
+    # Ignore implausible crops (mostly-dark page, detection noise)
+    if (bottom - top) * (right - left) < 0.2 * arr.size:
+        return gray
+
+    margin = 4
+    box = (
+        max(int((left - margin) * factor), 0),
+        max(int((top - margin) * factor), 0),
+        min(int((right + margin) * factor), gray.width),
+        min(int((bottom + margin) * factor), gray.height),
+    )
+    return gray.crop(box)
+
+
+def estimate_skew(gray: Image.Image) -> float:
+    """Angle (degrees) that makes text lines horizontal: maximizes row-profile variance."""
+    small, _ = _thumbnail(gray)
+    arr = np.asarray(small)
+    dark = arr <= otsu_threshold(arr)
+    # Only ink on the paper counts: the table showing in the corners of a
+    # rotated receipt would otherwise dominate the row profile
+    paper = ~dark
+    on_paper = (np.cumsum(paper, axis=1) > 0) & (np.cumsum(paper[:, ::-1], axis=1)[:, ::-1] > 0)
+    ink = Image.fromarray(((dark & on_paper) * 255).astype(np.uint8))
+
+    best_angle, best_score = 0.0, -1.0
+    steps = int(OCR_DESKEW_MAX_ANGLE / OCR_DESKEW_STEP)
+    for i in range(-steps, steps + 1):
+        angle = i * OCR_DESKEW_STEP
+        rotated = np.asarray(ink.rotate(angle, resample=Image.NEAREST, expand=False, fillcolor=0))
+        score = rotated.sum(axis=1, dtype=np.float64).var()
+        if score > best_score:
+            best_angle, best_score = angle, score
+    return best_angle
+
+
+def binarize(gray: Image.Image) -> Image.Image:
+    threshold = otsu_threshold(np.asarray(gray))
+    return gray.point(lambda p: 255 if p > threshold else 0)
+
+
+def preprocess_for_ocr(img: Image.Image) -> Image.Image:
+    """Run the configured preprocessing steps; returns a grayscale (or binary) image."""
+    if not OCR_PREPROCESS_ENABLED:
+        return img
+
+    # 1️⃣ Cap resolution (draft mode may already have done most of the work)
+    scale = _target_scale(img)
+    if scale < 1.0:
+        img = img.resize((max(int(img.width * scale), 1), max(int(img.height * scale), 1)), Image.LANCZOS)
+
+    # 2️⃣ Grayscale
+    gray = img.convert("L")
+
+    # 3️⃣ Crop to the receipt itself
+    if OCR_CROP:
+        gray = crop_to_document(gray)
+
+    # 4️⃣ Deskew
+    if OCR_DESKEW:
+        angle = estimate_skew(gray)
+        if angle:
+            gray = gray.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+
+    # 5️⃣ Binarize
+    if OCR_BINARIZE:
+        gray = binarize(gray)
+
+    return gray
@@ -0,0 +1,111 @@
+# services/index_maintenance.py
+"""
+Consistency checks and compaction for the search indexes.
+
+    python -m services.index_maintenance check [--fix]
+    python -m services.index_maintenance compact
+
+check compares the invoices table with the vector store and the BM25 index
+(services/lexical_index.py), per invoice:
+    orphaned    chunks of invoices that were deleted (or soft-deleted), or
+                keyed by something that isn't an invoice id (chunks indexed
+                before ids were the DB UUID were keyed by filename)
+    missing     invoices marked indexed with text but no chunks in an index
+    mismatched  a different number of chunks in the two indexes
+With --fix orphans are deleted and missing/mismatched invoices are queued
+for the background indexer (services/indexer.py).
+
+compact physically drops deleted chunks: with VECTOR_BACKEND=faiss the base
+index is rebuilt without them (faiss_store.compact), and the BM25 index is
+optimized and vacuumed. Chroma applies deletions itself and has no
+compaction API, so only the BM25 index is compacted there.
+"""
+import argparse
+import asyncio
+import uuid
+
+from sqlalchemy import select, func
+
+from database.db import async_session
+from database.models import Invoice
+from services import lexical_index
+from services.indexer import enqueue_reindex
+from services.vectorstore import delete_invoice_vectors, indexed_chunk_counts, VECTOR_BACKEND
+
+if VECTOR_BACKEND == "faiss":
+    from services import faiss_store
+
+PAGE_SIZE = 5000
+
+
+async def _db_invoices() -> dict:
+    """{invoice_id: (index_status, has_text)} for every invoice."""
+    invoices, last_id = {}, None
+    has_text = func.coalesce(func.length(Invoice.raw_text), 0) > 0
+    async with async_session() as db:
+        while True:
+            query = select(Invoice.id, Invoice.index_status, has_text).order_by(Invoice.id).limit(PAGE_SIZE)
+            if last_id is not None:
+                query = query.where(Invoice.id > last_id)
+            rows = (await db.execute(query)).all()
+            if not rows:
+                break
+            invoices.update({str(invoice_id): (status, text) for invoice_id, status, text in rows})
+            last_id = rows[-1][0]
+    return invoices
+
+
+async def check(fix: bool = False) -> dict:
+    invoices = await _db_invoices()
+    vector_counts, lexical_counts = await asyncio.gather(
+        asyncio.to_thread(indexed_chunk_counts),
+        asyncio.to_thread(lexical_index.chunk_counts),
+    )
+
+    orphaned, missing, mismatched = [], [], []
+    for invoice_id in set(vector_counts) | set(lexical_counts):
+        status = invoices.get(invoice_id, (None, False))[0]
+        if status is None or status == "deleted":
+            orphaned.append(invoice_id)
+        elif status == "indexed" and vector_counts.get(invoice_id, 0) != lexical_counts.get(invoice_id, 0):
+            mismatched.append(invoice_id)
+    for invoice_id, (status, has_text) in invoices.items():
+        if status == "indexed" and has_text and (invoice_id not in vector_counts or invoice_id not in lexical_counts):
+            if invoice_id not in mismatched:
+                missing.append(invoice_id)
+
+    report = {
+        "invoices": len(invoices),
+        "vector_chunks": sum(vector_counts.values()),
+        "lexical_chunks": sum(lexical_counts.values()),
+        "orphaned": len(orphaned),
+        "missing": len(missing),
+        "mismatched": len(mismatched),
+    }
+    if fix:
+        await asyncio.to_thread(delete_invoice_vectors, orphaned)
+        requeue = [uuid.UUID(invoice_id) for invoice_id in missing + mismatched]
+        async with async_session() as db:
+            report["requeued"] = await enqueue_reindex(db, requeue) if requeue else 0
+        report["removed"] = len(orphaned)
+    return report
+
+
+async def compact() -> dict:
+    result = {}
+    if VECTOR_BACKEND == "faiss":
+        result["faiss"] = await asyncio.to_thread(faiss_store.compact)
+    await asyncio.to_thread(lexical_index.optimize)
+    result["lexical_chunks"] = await asyncio.to_thread(lexical_index.count_chunks)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search index consistency checks and compaction")
+    parser.add_argument("command", choices=["check", "compact"])
+    parser.add_argument("--fix", action="store_true", help="remove orphaned chunks and requeue missing invoices")
+    args = parser.parse_args()
+    if args.command == "check":
+        print(asyncio.run(check(fix=args.fix)))
+    else:
+        print(asyncio.run(compact()))
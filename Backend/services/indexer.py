@@ -0,0 +1,291 @@
+# services/indexer.py
+"""
+Background vector indexer.
+
+Saving an invoice never waits for chunking/embedding: rows are inserted with
+index_status='pending' and a pool of indexer tasks picks them up in batches
+(one embedding call + one upsert per batch, see vectorstore.index_invoices).
+Like the analysis jobs, the queue *is* the table: claims are an atomic
+`UPDATE ... WHERE index_status='pending'`, so several uvicorn workers can run
+indexers side by side and nothing is lost on restart: a claimed batch holds
+a lease (index_started_at, refreshed while the batch runs) and every live
+indexer periodically requeues rows whose lease expired.
+
+Statuses: pending → indexing → indexed | failed (after INDEXER_MAX_ATTEMPTS),
+and deleted for soft-deleted invoices, which are never re-queued.
+Re-queuing an invoice (enqueue_reindex) is idempotent: its chunks are
+replaced, never duplicated. Deleting an invoice removes its chunks
+(remove_from_index); an invoice deleted while its batch was being indexed
+is caught when the batch is marked indexed and removed again.
+
+Env vars:
+    INDEXER_WORKERS        indexer tasks per process (0 = don't index in this process)
+    INDEXER_BATCH_SIZE     invoices per batch
+    INDEXER_POLL_INTERVAL  seconds between polls when idle
+    INDEXER_MAX_ATTEMPTS   attempts before an invoice is marked failed
+    INDEXER_LEASE_SECONDS  'indexing' rows without a heartbeat for this long are requeued
+"""
+import asyncio
+import os
+import time
+import traceback
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import select, update, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.db import async_session
+from database.models import Invoice
+from services import metrics
+from services.chunker import iter_chunks
+from services.vectorstore import index_invoices, delete_invoice_vectors
+
+load_dotenv()
+
+INDEXER_WORKERS = int(os.getenv("INDEXER_WORKERS", "1"))
+INDEXER_BATCH_SIZE = int(os.getenv("INDEXER_BATCH_SIZE", "32"))
+INDEXER_POLL_INTERVAL = float(os.getenv("INDEXER_POLL_INTERVAL", "5"))
+INDEXER_MAX_ATTEMPTS = int(os.getenv("INDEXER_MAX_ATTEMPTS", "5"))
+INDEXER_LEASE_SECONDS = int(os.getenv("INDEXER_LEASE_SECONDS", "120"))
+INDEXER_HEARTBEAT_INTERVAL = INDEXER_LEASE_SECONDS / 4
+INDEXER_MAX_BACKOFF = 300  # seconds, idle time after repeated failed batches
+
+_worker_tasks: list[asyncio.Task] = []
+_wakeup: Optional[asyncio.Event] = None
+_last_lease_sweep = 0.0
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _get_wakeup() -> asyncio.Event:
+    global _wakeup
+    if _wakeup is None:
+        _wakeup = asyncio.Event()
+    return _wakeup
+
+
+def notify_indexer() -> None:
+    """Nudge idle indexers in this process (new invoices were saved)."""
+    _get_wakeup().set()
+
+
+# 1) Queue
+async def enqueue_reindex(db: AsyncSession, invoice_ids: Optional[list] = None) -> int:
+    """Mark invoices (or all of them) for (re)indexing. Returns the number queued."""
+    stmt = update(Invoice).where(Invoice.index_status.notin_(("indexing", "deleted")))
+    if invoice_ids is not None:
+        stmt = stmt.where(Invoice.id.in_(invoice_ids))
+    res = await db.execute(stmt.values(index_status="pending", index_attempts=0, index_error=None))
+    await db.commit()
+    notify_indexer()
+    return res.rowcount
+
+
+async def get_index_backlog(db: AsyncSession) -> dict:
+    """Invoice counts per index_status; `pending` is the backlog depth."""
+    rows = await db.execute(select(Invoice.index_status, func.count()).group_by(Invoice.index_status))
+    backlog = {"pending": 0, "indexing": 0, "indexed": 0, "failed": 0, "deleted": 0}
+    backlog.update({status: count for status, count in rows.all()})
+    return backlog
+
+
+async def _claim_batch(db: AsyncSession) -> list:
+    """Atomically move up to INDEXER_BATCH_SIZE pending invoices to 'indexing'."""
+    candidates = (
+        select(Invoice.id)
+        .where(Invoice.index_status == "pending")
+        .order_by(Invoice.created_at)
+        .limit(INDEXER_BATCH_SIZE)
+    )
+    ids = (await db.execute(candidates)).scalars().all()
+    if not ids:
+        return []
+    res = await db.execute(
+        update(Invoice)
+        .where(Invoice.id.in_(ids), Invoice.index_status == "pending")
+        .values(index_status="indexing", index_started_at=_now(), index_attempts=Invoice.index_attempts + 1)
+        .returning(*INDEX_COLUMNS, Invoice.index_attempts)
+    )
+    rows = res.all()
+    await db.commit()
+    return rows
+
+
+async def _requeue_expired() -> None:
+    """Invoices whose indexer stopped heartbeating (crash, restart, deploy) go back to the queue."""
+    cutoff = _now() - timedelta(seconds=INDEXER_LEASE_SECONDS)
+    expired = (Invoice.index_status == "indexing", Invoice.index_started_at < cutoff)
+    async with async_session() as db:
+        await db.execute(
+            update(Invoice)
+            .where(*expired, Invoice.index_attempts >= INDEXER_MAX_ATTEMPTS)
+            .values(index_status="failed", index_error="Indexer lost while indexing")
+        )
+        await db.execute(update(Invoice).where(*expired).values(index_status="pending"))
+        await db.commit()
+
+
+async def _sweep_expired_leases() -> None:
+    global _last_lease_sweep
+    if time.monotonic() - _last_lease_sweep < INDEXER_HEARTBEAT_INTERVAL:
+        return
+    _last_lease_sweep = time.monotonic()
+    try:
+        await _requeue_expired()
+    except Exception as e:
+        print("Could not requeue expired indexing work:", e)
+
+
+async def _heartbeat(ids: list) -> None:
+    """Keep the lease of a claimed batch alive until cancelled."""
+    while True:
+        await asyncio.sleep(INDEXER_HEARTBEAT_INTERVAL)
+        try:
+            async with async_session() as db:
+                await db.execute(
+                    update(Invoice)
+                    .where(Invoice.id.in_(ids), Invoice.index_status == "indexing")
+                    .values(index_started_at=_now())
+                )
+                await db.commit()
+        except Exception as e:
+            print("Indexer heartbeat error:", e)
+
+
+# 2) Indexing
+INDEX_COLUMNS = (
+    Invoice.id, Invoice.user_id, Invoice.filename, Invoice.raw_text,
+    Invoice.vendor_name, Invoice.invoice_date, Invoice.currency,
+)
+
+
+def invoice_index_item(row) -> tuple:
+    """
+    (invoice_id, chunks, metadata) for vectorstore.index_invoices. The
+    metadata carries what search filters on inside the index: the owner,
+    a normalized vendor, the date as a sortable YYYYMMDD int and the currency.
+    """
+    metadata = {
+        "filename": row.filename,
+        "user_id": str(row.user_id) if row.user_id else None,
+        "vendor_name": row.vendor_name,
+        "vendor": row.vendor_name.strip().lower() if row.vendor_name else None,
+        "invoice_date": row.invoice_date.isoformat() if row.invoice_date else None,
+        "invoice_day": int(row.invoice_date.strftime("%Y%m%d")) if row.invoice_date else None,
+        "currency": row.currency.strip().upper() if row.currency else None,
+    }
+    return str(row.id), list(iter_chunks(row.raw_text or "")), metadata
+
+
+async def remove_from_index(invoice_ids: list) -> None:
+    """Drop deleted invoices' chunks from the vector and BM25 indexes."""
+    if not invoice_ids:
+        return
+    try:
+        await asyncio.to_thread(delete_invoice_vectors, [str(invoice_id) for invoice_id in invoice_ids])
+    except Exception as e:
+        # The consistency checker (services/index_maintenance.py) catches leftovers
+        print("Failed to remove invoices from the index:", e)
+
+
+async def _mark_indexed(db: AsyncSession, ids: list) -> None:
+    res = await db.execute(
+        update(Invoice)
+        .where(Invoice.id.in_(ids), Invoice.index_status == "indexing")
+        .values(index_status="indexed", indexed_at=_now(), index_error=None)
+        .returning(Invoice.id)
+    )
+    marked = set(res.scalars().all())
+    await db.commit()
+    # Deleted while we were indexing them: take the chunks we just wrote back out
+    await remove_from_index([invoice_id for invoice_id in ids if invoice_id not in marked])
+
+
+async def _mark_failed(db: AsyncSession, row, error: str) -> None:
+    # Back to the queue until the attempts run out
+    status = "failed" if (row.index_attempts or 0) >= INDEXER_MAX_ATTEMPTS else "pending"
+    await db.execute(
+        update(Invoice)
+        .where(Invoice.id == row.id, Invoice.index_status == "indexing")
+        .values(index_status=status, index_error=error)
+    )
+    await db.commit()
+
+
+async def index_batch(db: AsyncSession, rows: list) -> int:
+    """Index claimed rows; returns how many failed."""
+    try:
+        await asyncio.to_thread(index_invoices, [invoice_index_item(row) for row in rows])
+        await _mark_indexed(db, [row.id for row in rows])
+        metrics.increment("invoices_indexed", len(rows))
+        return 0
+    except Exception:
+        traceback.print_exc()
+
+    # One bad invoice shouldn't fail its whole batch: retry them one by one
+    failed = 0
+    for row in rows:
+        try:
+            await asyncio.to_thread(index_invoices, [invoice_index_item(row)])
+            await _mark_indexed(db, [row.id])
+            metrics.increment("invoices_indexed")
+        except Exception as e:
+            await _mark_failed(db, row, str(e))
+            metrics.increment("invoice_index_failures")
+            failed += 1
+    return failed
+
+
+# 3) Worker pool
+async def _worker_loop(worker_no: int) -> None:
+    wakeup = _get_wakeup()
+    failures_in_a_row = 0
+    while True:
+        delay = INDEXER_POLL_INTERVAL
+        await _sweep_expired_leases()
+        try:
+            async with async_session() as db:
+                rows = await _claim_batch(db)
+                if rows:
+                    heartbeat = asyncio.create_task(_heartbeat([row.id for row in rows]))
+                    try:
+                        failed = await index_batch(db, rows)
+                    finally:
+                        heartbeat.cancel()
+                    failures_in_a_row = failures_in_a_row + 1 if failed == len(rows) else 0
+                    if not failures_in_a_row:
+                        continue
+                    # Everything failing (embedding API down?): back off before the retry
+                    delay = min(INDEXER_POLL_INTERVAL * 2 ** failures_in_a_row, INDEXER_MAX_BACKOFF)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Indexer worker {worker_no} error:", e)
+
+        if failures_in_a_row:
+            await asyncio.sleep(delay)
+            continue
+        # Idle: wait for new invoices in this process or the next poll tick
+        wakeup.clear()
+        try:
+            await asyncio.wait_for(wakeup.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def start_indexer() -> None:
+    if INDEXER_WORKERS <= 0 or _worker_tasks:
+        return
+    for i in range(INDEXER_WORKERS):
+        _worker_tasks.append(asyncio.create_task(_worker_loop(i)))
+
+
+async def stop_indexer() -> None:
+    for task in _worker_tasks:
+        task.cancel()
+    await asyncio.gather(*_worker_tasks, return_exceptions=True)
+    _worker_tasks.clear()
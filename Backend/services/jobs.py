@@ -0,0 +1,273 @@
+# services/jobs.py
+"""
+Asynchronous analysis jobs.
+
+`POST /api/analyze/jobs` stores the file in UPLOAD_DIR and inserts a row in
+`analysis_jobs`; a bounded pool of worker tasks claims queued rows from the
+database and runs the usual extractor + save_invoice pipeline. Because the
+queue *is* the table, queued work survives restarts and can be shared between
+several uvicorn workers (claims are an atomic `UPDATE ... WHERE status='queued'`).
+
+A running job holds a lease: its worker refreshes `heartbeat_at` every
+ANALYSIS_JOB_LEASE_SECONDS / 4. Every live worker periodically puts jobs whose
+lease expired (process crashed, was restarted or redeployed) back in the
+queue, or fails them once they've used up their attempts.
+
+Env vars:
+    ANALYSIS_JOB_WORKERS        worker tasks per process (0 = submit-only process)
+    ANALYSIS_JOB_POLL_INTERVAL  seconds between polls when idle
+    ANALYSIS_JOB_MAX_ATTEMPTS   retries for unexpected errors
+    ANALYSIS_JOB_LEASE_SECONDS  "running" jobs without a heartbeat for this long are requeued
+"""
+import asyncio
+import os
+import time
+import traceback
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import select, update, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.db import async_session
+from database.models import AnalysisJob
+from services.db_services import build_invoice_create, save_invoice, get_invoice_by_id
+from services.extractor import extract_invoice_data
+
+load_dotenv()
+
+JOB_WORKERS = int(os.getenv("ANALYSIS_JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("ANALYSIS_JOB_POLL_INTERVAL", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("ANALYSIS_JOB_MAX_ATTEMPTS", "3"))
+JOB_LEASE_SECONDS = int(os.getenv("ANALYSIS_JOB_LEASE_SECONDS", "120"))
+JOB_HEARTBEAT_INTERVAL = JOB_LEASE_SECONDS / 4
+
+_worker_tasks: list[asyncio.Task] = []
+_wakeup: Optional[asyncio.Event] = None
+_last_lease_sweep = 0.0
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _get_wakeup() -> asyncio.Event:
+    global _wakeup
+    if _wakeup is None:
+        _wakeup = asyncio.Event()
+    return _wakeup
+
+
+# 1) Job rows
+async def create_job(db: AsyncSession, file_path: str, filename: str, user_id=None, owns_file: bool = True) -> AnalysisJob:
+    job = AnalysisJob(
+        file_path=file_path,
+        filename=filename,
+        user_id=user_id,
+        owns_file=owns_file,
+        status="queued",
+        timings={},
+        attempts=0,
+    )
+    db.add(job)
+    await db.commit()
+    await db.refresh(job)
+
+    # Nudge idle workers in this process instead of waiting for the next poll
+    _get_wakeup().set()
+    return job
+
+
+async def get_job(db: AsyncSession, job_id) -> Optional[dict]:
+    res = await db.execute(select(AnalysisJob).where(AnalysisJob.id == job_id))
+    job = res.scalar_one_or_none()
+    if not job:
+        return None
+
+    data = {
+        "id": job.id,
+        "status": job.status,
+        "stage": job.stage,
+        "filename": job.filename,
+        "attempts": job.attempts or 0,
+        "timings": job.timings or {},
+        "error": job.error,
+        "invoice_id": job.invoice_id,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "result": None,
+    }
+    if job.status == "succeeded" and job.invoice_id:
+        data["result"] = await get_invoice_by_id(db, job.invoice_id)
+    return data
+
+
+async def _claim_next_job(db: AsyncSession) -> Optional[AnalysisJob]:
+    """Atomically move the oldest queued job to 'running'. Safe across processes."""
+    candidates = await db.execute(
+        select(AnalysisJob.id)
+        .where(AnalysisJob.status == "queued")
+        .order_by(AnalysisJob.created_at)
+        .limit(5)
+    )
+    for (job_id,) in candidates.all():
+        res = await db.execute(
+            update(AnalysisJob)
+            .where(AnalysisJob.id == job_id, AnalysisJob.status == "queued")
+            .values(
+                status="running", stage="queued", started_at=_now(), heartbeat_at=_now(),
+                attempts=AnalysisJob.attempts + 1,
+            )
+        )
+        await db.commit()
+        if res.rowcount == 1:
+            job = (await db.execute(select(AnalysisJob).where(AnalysisJob.id == job_id))).scalar_one()
+            return job
+    return None
+
+
+async def _requeue_expired_jobs() -> None:
+    """Jobs whose worker stopped heartbeating (crash, restart, deploy) go back to the queue."""
+    cutoff = _now() - timedelta(seconds=JOB_LEASE_SECONDS)
+    expired = (
+        AnalysisJob.status == "running",
+        func.coalesce(AnalysisJob.heartbeat_at, AnalysisJob.started_at) < cutoff,
+    )
+    async with async_session() as db:
+        # A job that keeps taking its worker down doesn't get requeued forever
+        await db.execute(
+            update(AnalysisJob)
+            .where(*expired, AnalysisJob.attempts >= JOB_MAX_ATTEMPTS)
+            .values(status="failed", stage=None, error="Worker lost while running the job", finished_at=_now())
+        )
+        await db.execute(update(AnalysisJob).where(*expired).values(status="queued", stage=None))
+        await db.commit()
+
+
+async def _sweep_expired_leases() -> None:
+    global _last_lease_sweep
+    if time.monotonic() - _last_lease_sweep < JOB_HEARTBEAT_INTERVAL:
+        return
+    _last_lease_sweep = time.monotonic()
+    try:
+        await _requeue_expired_jobs()
+    except Exception as e:
+        print("Could not requeue expired analysis jobs:", e)
+
+
+async def _heartbeat(job_id) -> None:
+    """Keep the lease of a running job alive until cancelled."""
+    while True:
+        await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+        try:
+            async with async_session() as db:
+                await db.execute(
+                    update(AnalysisJob)
+                    .where(AnalysisJob.id == job_id, AnalysisJob.status == "running")
+                    .values(heartbeat_at=_now())
+                )
+                await db.commit()
+        except Exception as e:
+            print("Analysis job heartbeat error:", e)
+
+
+# 2) Pipeline
+async def _set_stage(db: AsyncSession, job: AnalysisJob, stage: str) -> None:
+    job.stage = stage
+    await db.commit()
+
+
+async def _finish(db: AsyncSession, job: AnalysisJob, status: str, error: Optional[str] = None) -> None:
+    job.status = status
+    job.stage = None
+    job.error = error
+    job.finished_at = _now()
+    await db.commit()
+
+    if job.owns_file and status in ("succeeded", "failed"):
+        try:
+            os.remove(job.file_path)
+        except OSError:
+            pass
+
+
+async def run_job(db: AsyncSession, job: AnalysisJob) -> None:
+    timings = {}
+    try:
+        # 1️⃣ Extract (cache → text → LLM → index)
+        await _set_stage(db, job, "extracting")
+        result = await extract_invoice_data(job.file_path, job.filename, user_id=job.user_id)
+        timings.update(result.get("timings", {}))
+
+        if "error" in result:
+            job.timings = timings
+            await _finish(db, job, "failed", result["error"])
+            return
+
+        # 2️⃣ Save invoice row
+        await _set_stage(db, job, "saving")
+        started = time.perf_counter()
+        saved = await save_invoice(db, build_invoice_create(result, job.filename, job.user_id))
+        timings["save"] = time.perf_counter() - started
+
+        job.invoice_id = saved["id"]
+        job.timings = timings
+        await _finish(db, job, "succeeded")
+
+    except Exception as e:
+        traceback.print_exc()
+        await db.rollback()
+        await db.refresh(job)
+        job.timings = timings
+        if (job.attempts or 0) < JOB_MAX_ATTEMPTS:
+            # Transient failure (LLM timeout, DB hiccup…) → back to the queue
+            job.status = "queued"
+            job.stage = None
+            job.error = str(e)
+            await db.commit()
+        else:
+            await _finish(db, job, "failed", str(e))
+
+
+# 3) Worker pool
+async def _worker_loop(worker_no: int) -> None:
+    wakeup = _get_wakeup()
+    while True:
+        await _sweep_expired_leases()
+        try:
+            async with async_session() as db:
+                job = await _claim_next_job(db)
+                if job is not None:
+                    heartbeat = asyncio.create_task(_heartbeat(job.id))
+                    try:
+                        await run_job(db, job)
+                    finally:
+                        heartbeat.cancel()
+                    continue
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Analysis job worker {worker_no} error:", e)
+
+        # Idle: wait for a submit in this process or the next poll tick
+        wakeup.clear()
+        try:
+            await asyncio.wait_for(wakeup.wait(), timeout=JOB_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def start_job_workers() -> None:
+    if JOB_WORKERS <= 0 or _worker_tasks:
+        return
+    for i in range(JOB_WORKERS):
+        _worker_tasks.append(asyncio.create_task(_worker_loop(i)))
+
+
+async def stop_job_workers() -> None:
+    for task in _worker_tasks:
+        task.cancel()
+    await asyncio.gather(*_worker_tasks, return_exceptions=True)
+    _worker_tasks.clear()
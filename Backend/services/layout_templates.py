@@ -0,0 +1,382 @@
+# services/layout_templates.py
+"""
+Vendor layout templates learned from past extractions.
+
+Most volume comes from recurring vendors whose invoices share a layout. A
+document's layout is fingerprinted from its vendor header (top-most text
+block) and the quantized positions of the text blocks in the page header
+(PyMuPDF). After TEMPLATE_MIN_SAMPLES successful extractions for the same
+fingerprint, we learn for each InvoiceData field *where* it sits:
+
+- an anchor: the label words just before the value ("Invoice No", "Total Due")
+- or, when the value stands alone in its block, the block's relative position
+- or, for vendor_name / currency, a constant value shared by every sample
+
+Later invoices with the same fingerprint are extracted from the template in
+milliseconds. Templates live in a local SQLite file, carry a version, and are
+invalidated (version bumped, relearned) as soon as template-extracted values
+stop validating — e.g. subtotal + tax no longer equals total.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from datetime import date
+from pathlib import Path
+from typing import Optional
+
+import fitz  # PyMuPDF
+from dotenv import load_dotenv
+
+from services.rule_extractor import (
+    REQUIRED_FIELDS, ALL_FIELDS, AMOUNT_RE, DATE_PATTERNS, parse_amount, _parse_date, _find_dates,
+    extract_subtotal, extract_tax, amounts_consistent,
+)
+
+load_dotenv()
+
+TEMPLATES_ENABLED = os.getenv("LAYOUT_TEMPLATES_ENABLED", "true").lower() in ("1", "true", "yes")
+TEMPLATES_PATH = Path(os.getenv("LAYOUT_TEMPLATES_PATH", "cache/layout_templates.db"))
+TEMPLATE_MIN_SAMPLES = int(os.getenv("LAYOUT_TEMPLATE_MIN_SAMPLES", "3"))
+
+HEADER_REGION = 0.35  # top fraction of the page used for the layout signature
+HEADER_BLOCKS = 6  # …and at most this many blocks, so line-item counts don't change it
+GRID = 0.05  # block positions are quantized to 5% of the page
+MAX_POSITION_DRIFT = 0.03  # max spread of a positional field across samples
+ANCHOR_WORDS = 4
+
+AMOUNT_FIELDS = ("total_amount", "tax_amount")
+CONSTANT_FIELDS = ("vendor_name", "currency")  # same value on every invoice from a vendor
+INVOICE_NUMBER_TOKEN_RE = re.compile(r"[A-Z0-9][A-Z0-9\-/_.]{1,30}", re.I)
+
+_lock = threading.Lock()
+_conn: Optional[sqlite3.Connection] = None
+
+
+# 1) Layout reading / fingerprinting
+def read_layout(source) -> Optional[dict]:
+    """
+    Text blocks of page 1 with positions relative to the page (top to bottom),
+    plus the layout fingerprint. Returns None for documents without a usable text layer.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        doc = fitz.open(stream=source, filetype="pdf")
+    else:
+        doc = fitz.open(source)
+    with doc:
+        if doc.page_count == 0:
+            return None
+        page = doc[0]
+        width, height = page.rect.width or 1, page.rect.height or 1
+        blocks = []
+        for x0, y0, x1, y1, text, _, block_type in page.get_text("blocks"):
+            if block_type != 0 or not text.strip():
+                continue
+            blocks.append({
+                "text": text.strip(),
+                "bbox": (x0 / width, y0 / height, x1 / width, y1 / height),
+            })
+
+    if not blocks:
+        return None
+    blocks.sort(key=lambda b: (b["bbox"][1], b["bbox"][0]))
+
+    vendor_header = _normalize(blocks[0]["text"].splitlines()[0])
+    signature = sorted(
+        (round(b["bbox"][0] / GRID), round(b["bbox"][1] / GRID))
+        for b in blocks[:HEADER_BLOCKS] if b["bbox"][1] < HEADER_REGION
+    )
+    fingerprint = hashlib.sha1(f"{vendor_header}|{signature}".encode()).hexdigest()[:20]
+    return {"fingerprint": fingerprint, "vendor_header": vendor_header, "blocks": blocks}
+
+
+def _normalize(text: str) -> str:
+    text = re.sub(r"\d", "", text.lower())
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s]", " ", text)).strip()[:60]
+
+
+def _anchor_words(prefix: str) -> list[str]:
+    """Label words right before a value: same line first, else the line above."""
+    lines = prefix.split("\n")
+    for line in (lines[-1], lines[-2] if len(lines) > 1 else ""):
+        words = re.findall(r"[A-Za-z]+", line)
+        if words:
+            return words[-ANCHOR_WORDS:]
+    return []
+
+
+def _anchor_regex(words: list[str]) -> re.Pattern:
+    return re.compile(r"\b" + r"\W+".join(re.escape(w) for w in words) + r"\b\W*", re.I)
+
+
+# 2) Locating / parsing values inside a block
+def _value_spans(field: str, value, text: str) -> list[tuple[int, int]]:
+    """Spans in `text` where `value` (as extracted) appears."""
+    spans = []
+    if field in AMOUNT_FIELDS:
+        for m in AMOUNT_RE.finditer(text):
+            parsed = parse_amount(m.group(1))
+            if parsed is not None and abs(parsed - float(value)) < 0.005:
+                spans.append(m.span(1))
+    elif field == "invoice_date":
+        for pattern, formats, confidence in DATE_PATTERNS:
+            for m in pattern.finditer(text):
+                parsed = _parse_date(m.group(1), formats, confidence)
+                if parsed and parsed[0] == str(value):
+                    spans.append(m.span(1))
+    else:
+        idx = text.lower().find(str(value).lower())
+        if idx >= 0:
+            spans.append((idx, idx + len(str(value))))
+    return spans
+
+
+def _parse_field(field: str, text: str):
+    """Parse the first value of `field`'s type at the start of `text`."""
+    if field in AMOUNT_FIELDS:
+        for m in AMOUNT_RE.finditer(text):
+            parsed = parse_amount(m.group(1))
+            if parsed is not None:
+                return parsed
+        return None
+    if field == "invoice_date":
+        for line in text.splitlines():
+            dates = _find_dates(line)
+            if dates:
+                return dates[0][0]
+        return None
+    if field == "invoice_number":
+        for m in INVOICE_NUMBER_TOKEN_RE.finditer(text):
+            if any(c.isdigit() for c in m.group(0)):
+                return m.group(0).rstrip(".-/")
+        return None
+    line = text.strip().splitlines()[0] if text.strip() else ""
+    return line.strip() or None
+
+
+def _observe(field: str, value, blocks: list[dict]) -> Optional[dict]:
+    for block in blocks:
+        spans = _value_spans(field, value, block["text"])
+        if not spans:
+            continue
+        start, _ = spans[0]
+        return {
+            "anchor": " ".join(_anchor_words(block["text"][:start])).lower(),
+            "bbox": block["bbox"],
+            "value": value,
+        }
+    return None
+
+
+# 3) Persistence
+def _get_conn() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        TEMPLATES_PATH.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(TEMPLATES_PATH, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS templates (
+                fingerprint TEXT PRIMARY KEY,
+                vendor_header TEXT,
+                version INTEGER NOT NULL DEFAULT 1,
+                status TEXT NOT NULL DEFAULT 'learning',
+                field_rules TEXT,
+                hits INTEGER NOT NULL DEFAULT 0,
+                invalidations INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS template_samples (
+                fingerprint TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                observations TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_template_samples ON template_samples (fingerprint, version)")
+        conn.commit()
+        _conn = conn
+    return _conn
+
+
+def get_template(fingerprint: str) -> Optional[dict]:
+    with _lock:
+        row = _get_conn().execute(
+            "SELECT version, status, field_rules FROM templates WHERE fingerprint = ?", (fingerprint,)
+        ).fetchone()
+    if not row:
+        return None
+    version, status, field_rules = row
+    return {"version": version, "status": status, "field_rules": json.loads(field_rules) if field_rules else None}
+
+
+# 4) Learning
+def _learn_field(field: str, observations: list[Optional[dict]]) -> Optional[dict]:
+    if any(o is None for o in observations):
+        return None
+
+    values = {str(o["value"]) for o in observations}
+    if field in CONSTANT_FIELDS and len(values) == 1:
+        return {"kind": "constant", "value": observations[0]["value"]}
+
+    anchor, count = Counter(o["anchor"] for o in observations).most_common(1)[0]
+    if anchor and count == len(observations):
+        return {"kind": "anchor", "anchor": anchor}
+
+    xs = [o["bbox"][0] for o in observations]
+    ys = [o["bbox"][1] for o in observations]
+    if max(xs) - min(xs) <= MAX_POSITION_DRIFT and max(ys) - min(ys) <= MAX_POSITION_DRIFT:
+        return {"kind": "position", "x": sum(xs) / len(xs), "y": sum(ys) / len(ys)}
+    return None
+
+
+def learn_from_extraction(layout: dict, structured: dict) -> None:
+    """
+    Record where each extracted value sits; once enough samples agree,
+    activate the template. Only call this with validated extractions.
+    """
+    if not TEMPLATES_ENABLED or not layout:
+        return
+
+    observations = {
+        field: _observe(field, structured[field], layout["blocks"])
+        for field in ALL_FIELDS
+        if structured.get(field) not in (None, "")
+    }
+    if not all(observations.get(field) for field in REQUIRED_FIELDS):
+        return  # can't locate a required value on the page → not templatable
+
+    now = time.time()
+    fingerprint = layout["fingerprint"]
+    with _lock:
+        conn = _get_conn()
+        row = conn.execute("SELECT version, status FROM templates WHERE fingerprint = ?", (fingerprint,)).fetchone()
+        if row is None:
+            conn.execute(
+                "INSERT INTO templates (fingerprint, vendor_header, updated_at) VALUES (?, ?, ?)",
+                (fingerprint, layout["vendor_header"], now),
+            )
+            version, status = 1, "learning"
+        else:
+            version, status = row
+        if status == "active":
+            conn.commit()
+            return
+
+        conn.execute(
+            "INSERT INTO template_samples (fingerprint, version, observations, created_at) VALUES (?, ?, ?, ?)",
+            (fingerprint, version, json.dumps(observations, default=str), now),
+        )
+        samples = [
+            json.loads(r[0]) for r in conn.execute(
+                "SELECT observations FROM template_samples WHERE fingerprint = ? AND version = ? "
+                "ORDER BY created_at DESC LIMIT ?",
+                (fingerprint, version, TEMPLATE_MIN_SAMPLES),
+            )
+        ]
+
+        if len(samples) >= TEMPLATE_MIN_SAMPLES:
+            field_rules = {}
+            for field in ALL_FIELDS:
+                rule = _learn_field(field, [s.get(field) for s in samples])
+                if rule:
+                    field_rules[field] = rule
+            if all(field in field_rules for field in REQUIRED_FIELDS):
+                conn.execute(
+                    "UPDATE templates SET status = 'active', field_rules = ?, updated_at = ? WHERE fingerprint = ?",
+                    (json.dumps(field_rules), now, fingerprint),
+                )
+        conn.commit()
+
+
+# 5) Applying
+def _nearest_block(blocks: list[dict], x: float, y: float) -> Optional[dict]:
+    best, best_dist = None, None
+    for block in blocks:
+        dist = abs(block["bbox"][0] - x) + abs(block["bbox"][1] - y)
+        if best_dist is None or dist < best_dist:
+            best, best_dist = block, dist
+    if best_dist is not None and best_dist <= 2 * MAX_POSITION_DRIFT:
+        return best
+    return None
+
+
+def _apply_rule(field: str, rule: dict, blocks: list[dict]):
+    if rule["kind"] == "constant":
+        return rule["value"]
+    if rule["kind"] == "anchor":
+        pattern = _anchor_regex(rule["anchor"].split())
+        for block in blocks:
+            match = pattern.search(block["text"])
+            if match:
+                return _parse_field(field, block["text"][match.end():])
+        return None
+    block = _nearest_block(blocks, rule["x"], rule["y"])
+    return _parse_field(field, block["text"]) if block else None
+
+
+def extract_with_template(layout: dict) -> Optional[dict]:
+    """Values for every templated field, or None when no active template matches."""
+    if not TEMPLATES_ENABLED or not layout:
+        return None
+    template = get_template(layout["fingerprint"])
+    if not template or template["status"] != "active":
+        return None
+
+    values = {field: None for field in ALL_FIELDS}
+    for field, rule in template["field_rules"].items():
+        values[field] = _apply_rule(field, rule, layout["blocks"])
+    return values
+
+
+# 6) Validation / invalidation
+def validate_extraction(values: dict, text: str) -> bool:
+    """Checks a template (or any) extraction must pass to be trusted."""
+    if any(values.get(field) in (None, "") for field in REQUIRED_FIELDS):
+        return False
+    try:
+        date.fromisoformat(str(values["invoice_date"]))
+        total = float(values["total_amount"])
+        tax = float(values["tax_amount"]) if values.get("tax_amount") is not None else None
+    except (TypeError, ValueError):
+        return False
+    if total <= 0 or (tax is not None and not 0 <= tax < total):
+        return False
+
+    # Cross-check against the document: subtotal + tax must equal the total
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    subtotal = extract_subtotal(lines)
+    if subtotal:
+        doc_tax = tax if tax is not None else (extract_tax(lines) or {}).get("value")
+        if not amounts_consistent(subtotal["value"], doc_tax, total):
+            return False
+    return True
+
+
+def record_hit(fingerprint: str) -> None:
+    with _lock:
+        conn = _get_conn()
+        conn.execute("UPDATE templates SET hits = hits + 1 WHERE fingerprint = ?", (fingerprint,))
+        conn.commit()
+
+
+def invalidate_template(fingerprint: str) -> None:
+    """Bump the version and start relearning from fresh samples."""
+    with _lock:
+        conn = _get_conn()
+        conn.execute(
+            "UPDATE templates SET status = 'learning', field_rules = NULL, version = version + 1, "
+            "invalidations = invalidations + 1, updated_at = ? WHERE fingerprint = ?",
+            (time.time(), fingerprint),
+        )
+        conn.commit()
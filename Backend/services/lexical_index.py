@@ -0,0 +1,187 @@
+# services/lexical_index.py
+"""
+Local BM25 index (SQLite FTS5) over the same chunks as the vector store.
+
+Exact tokens — invoice numbers, VAT IDs, SKUs — are what embeddings handle
+worst and what users search for most, and a lexical lookup needs no
+embedding API call. vectorstore.index_invoices writes here under the same
+write lock as the vector store upsert, replacing an invoice's chunks in both, so
+the two indexes hold the same chunk ids.
+
+Chunks live in a regular table (with the filter columns indexed) and the
+FTS5 table indexes its text as external content, kept in sync by triggers.
+
+Note: in Chroma server mode (CHROMA_HOST) this index is still per host.
+
+Env vars:
+    LEXICAL_INDEX_PATH   SQLite file for the index
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LEXICAL_INDEX_PATH = Path(os.getenv("LEXICAL_INDEX_PATH", "vector_store/lexical.db"))
+
+_TERM_RE = re.compile(r"\w[\w\-./#]*")
+_SQL_VARIABLES = 500
+
+_lock = threading.Lock()
+_conn: Optional[sqlite3.Connection] = None
+
+
+def _get_conn() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        LEXICAL_INDEX_PATH.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(LEXICAL_INDEX_PATH, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                id INTEGER PRIMARY KEY,
+                chunk_id TEXT NOT NULL UNIQUE,
+                invoice_id TEXT NOT NULL,
+                user_id TEXT,
+                vendor TEXT,
+                invoice_day INTEGER,
+                currency TEXT,
+                text TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_chunks_invoice ON chunks (invoice_id);
+            CREATE INDEX IF NOT EXISTS idx_chunks_user ON chunks (user_id);
+            CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(text, content='chunks', content_rowid='id');
+            CREATE TRIGGER IF NOT EXISTS chunks_ai AFTER INSERT ON chunks BEGIN
+                INSERT INTO chunks_fts (rowid, text) VALUES (new.id, new.text);
+            END;
+            CREATE TRIGGER IF NOT EXISTS chunks_ad AFTER DELETE ON chunks BEGIN
+                INSERT INTO chunks_fts (chunks_fts, rowid, text) VALUES ('delete', old.id, old.text);
+            END;
+            """
+        )
+        conn.commit()
+        _conn = conn
+    return _conn
+
+
+def _delete(conn: sqlite3.Connection, invoice_ids: list[str]) -> None:
+    for start in range(0, len(invoice_ids), _SQL_VARIABLES):
+        batch = invoice_ids[start:start + _SQL_VARIABLES]
+        conn.execute(f"DELETE FROM chunks WHERE invoice_id IN ({','.join('?' * len(batch))})", batch)
+
+
+def replace_chunks(invoice_ids: list[str], ids: list[str], texts: list[str], metadatas: list[dict]) -> None:
+    """Replace every chunk of `invoice_ids` with the given ones (same ids as the vector store)."""
+    rows = [
+        (
+            chunk_id, meta["invoice_id"], meta.get("user_id"), meta.get("vendor"),
+            meta.get("invoice_day"), meta.get("currency"), text, json.dumps(meta),
+        )
+        for chunk_id, text, meta in zip(ids, texts, metadatas)
+    ]
+    with _lock:
+        conn = _get_conn()
+        with conn:
+            _delete(conn, invoice_ids)
+            conn.executemany(
+                "INSERT INTO chunks (chunk_id, invoice_id, user_id, vendor, invoice_day, currency, text, metadata) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+
+def delete_chunks(invoice_ids: list[str]) -> None:
+    with _lock:
+        conn = _get_conn()
+        with conn:
+            _delete(conn, invoice_ids)
+
+
+def clear_lexical_index() -> None:
+    with _lock:
+        conn = _get_conn()
+        with conn:
+            conn.execute("DELETE FROM chunks")
+
+
+def match_query(query: str) -> Optional[str]:
+    """
+    FTS5 query: every term as a quoted phrase, OR-ed and ranked by BM25.
+    Quoting keeps punctuation out of the FTS syntax and makes "INV-20931"
+    match the adjacent tokens inv + 20931.
+    """
+    terms = _TERM_RE.findall(query)
+    if not terms:
+        return None
+    return " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def filter_clause(filters: dict, alias: str = "") -> tuple[str, list]:
+    """
+    SQL condition + params for the search filters: user_id and optional
+    vendor, date_from, date_to and currency (same meaning as the Chroma
+    filter built by vectorstore.chroma_filter).
+    """
+    prefix = f"{alias}." if alias else ""
+    sql, params = f"{prefix}user_id = ?", [str(filters["user_id"])]
+    if filters.get("vendor"):
+        sql += f" AND {prefix}vendor = ?"
+        params.append(filters["vendor"].strip().lower())
+    if filters.get("date_from"):
+        sql += f" AND {prefix}invoice_day >= ?"
+        params.append(int(filters["date_from"].strftime("%Y%m%d")))
+    if filters.get("date_to"):
+        sql += f" AND {prefix}invoice_day <= ?"
+        params.append(int(filters["date_to"].strftime("%Y%m%d")))
+    if filters.get("currency"):
+        sql += f" AND {prefix}currency = ?"
+        params.append(filters["currency"].strip().upper())
+    return sql, params
+
+
+def search(query: str, k: int, filters: dict) -> list[tuple[str, dict, float]]:
+    """
+    Top-k (text, metadata, score) by BM25, best first (score = -bm25, higher
+    is better), restricted by `filters` (see filter_clause).
+    """
+    match = match_query(query)
+    if not match:
+        return []
+    condition, params = filter_clause(filters, "c")
+    sql = (
+        "SELECT c.text, c.metadata, bm25(chunks_fts) AS rank "
+        "FROM chunks_fts JOIN chunks c ON c.id = chunks_fts.rowid "
+        f"WHERE chunks_fts MATCH ? AND {condition} ORDER BY rank LIMIT ?"
+    )
+    with _lock:
+        rows = _get_conn().execute(sql, [match, *params, k]).fetchall()
+    return [(text, json.loads(metadata), -rank) for text, metadata, rank in rows]
+
+
+def chunk_counts() -> dict:
+    """{invoice_id: number of chunks}."""
+    with _lock:
+        return dict(_get_conn().execute("SELECT invoice_id, COUNT(*) FROM chunks GROUP BY invoice_id").fetchall())
+
+
+def optimize() -> None:
+    """Merge FTS segments and reclaim the space of deleted chunks."""
+    with _lock:
+        conn = _get_conn()
+        with conn:
+            conn.execute("INSERT INTO chunks_fts (chunks_fts) VALUES ('optimize')")
+        conn.execute("VACUUM")
+
+
+def count_chunks() -> int:
+    with _lock:
+        return _get_conn().execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
@@ -0,0 +1,142 @@
+# services/llm_provider.py
+"""
+Long-lived LLM clients and pre-built extraction chains.
+
+Created once at app startup (see app.py lifespan) instead of per request:
+- one shared httpx client pool (keep-alive) for every OpenAI-compatible model,
+  so requests reuse TLS connections
+- one chat model instance per (provider, model)
+- one compiled extraction chain per (provider, model[, partial field set])
+
+Env vars:
+    LLM_PROVIDER                  openai | gemini | mock (default provider)
+    LLM_MODEL                     model name for the default provider
+    LLM_HTTP_MAX_CONNECTIONS      total pooled connections
+    LLM_HTTP_MAX_KEEPALIVE        idle keep-alive connections kept open
+    LLM_HTTP_KEEPALIVE_EXPIRY     seconds an idle connection is kept
+    LLM_HTTP_TIMEOUT              per-request timeout in seconds
+    OPENAI_BASE_URL               (read by langchain-openai) e.g. a local fake server
+"""
+import os
+from typing import Optional
+
+import httpx
+from dotenv import load_dotenv
+from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_openai import ChatOpenAI
+
+from config import GOOGLE_API_KEY
+from langchain_components.chains import (
+    build_async_extraction_chain, build_async_partial_extraction_chain, build_async_batch_extraction_chain,
+)
+from services.mock_llm import MockChatModel
+
+load_dotenv()
+
+DEFAULT_MODELS = {
+    "openai": "gpt-4o-mini",
+    "gemini": "gemini-2.5-flash",
+    "mock": "rules",
+}
+
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
+LLM_MODEL = os.getenv("LLM_MODEL", DEFAULT_MODELS.get(LLM_PROVIDER, "gpt-4o-mini"))
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "100"))
+LLM_HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "20"))
+LLM_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "90"))
+LLM_HTTP_TIMEOUT = float(os.getenv("LLM_HTTP_TIMEOUT", "60"))
+
+
+class LLMProvider:
+    """Owns the pooled HTTP clients, chat models and compiled chains."""
+
+    def __init__(self):
+        self._http_client: Optional[httpx.Client] = None
+        self._http_async_client: Optional[httpx.AsyncClient] = None
+        self._llms = {}
+        self._chains = {}
+
+    def start(self) -> None:
+        if self._http_async_client is not None:
+            return
+        limits = httpx.Limits(
+            max_connections=LLM_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=LLM_HTTP_KEEPALIVE_EXPIRY,
+        )
+        timeout = httpx.Timeout(LLM_HTTP_TIMEOUT, connect=10.0)
+        self._http_client = httpx.Client(limits=limits, timeout=timeout)
+        self._http_async_client = httpx.AsyncClient(limits=limits, timeout=timeout)
+
+    async def aclose(self) -> None:
+        if self._http_async_client is not None:
+            await self._http_async_client.aclose()
+        if self._http_client is not None:
+            self._http_client.close()
+        self._http_client = None
+        self._http_async_client = None
+        self._llms.clear()
+        self._chains.clear()
+
+    @staticmethod
+    def _model(provider: str, model: Optional[str]) -> str:
+        return model or (LLM_MODEL if provider == LLM_PROVIDER else DEFAULT_MODELS[provider])
+
+    def get_llm(self, provider: str = LLM_PROVIDER, model: Optional[str] = None):
+        model = self._model(provider, model)
+        key = (provider, model)
+        if key not in self._llms:
+            self.start()  # lazily, for scripts/workers that skip the app lifespan
+            if provider == "openai":
+                self._llms[key] = ChatOpenAI(
+                    model=model,
+                    max_retries=0,  # retries/backoff are owned by services/llm_scheduler.py
+                    http_client=self._http_client,
+                    http_async_client=self._http_async_client,
+                )
+            elif provider == "gemini":
+                self._llms[key] = ChatGoogleGenerativeAI(model=model, api_key=GOOGLE_API_KEY, max_retries=0)
+            elif provider == "mock":
+                self._llms[key] = MockChatModel(model)
+            else:
+                raise ValueError(f"Unknown LLM provider: {provider}")
+        return self._llms[key]
+
+    def get_extraction_chain(self, provider: str = LLM_PROVIDER, model: Optional[str] = None):
+        key = (provider, self._model(provider, model), None)
+        if key not in self._chains:
+            self._chains[key] = build_async_extraction_chain(self.get_llm(provider, model))
+        return self._chains[key]
+
+    def get_partial_extraction_chain(self, fields, provider: str = LLM_PROVIDER, model: Optional[str] = None):
+        key = (provider, self._model(provider, model), tuple(fields))
+        if key not in self._chains:
+            self._chains[key] = build_async_partial_extraction_chain(self.get_llm(provider, model), fields)
+        return self._chains[key]
+
+    def get_batch_extraction_chain(self, provider: str = LLM_PROVIDER, model: Optional[str] = None):
+        key = (provider, self._model(provider, model), "batch")
+        if key not in self._chains:
+            self._chains[key] = build_async_batch_extraction_chain(self.get_llm(provider, model))
+        return self._chains[key]
+
+
+_provider = LLMProvider()
+
+
+def get_llm_provider() -> LLMProvider:
+    return _provider
+
+
+def start_llm_provider() -> None:
+    _provider.start()
+    # Build the default chain up front so the first request doesn't pay for it
+    try:
+        _provider.get_extraction_chain(LLM_PROVIDER)
+    except Exception as e:
+        # e.g. OPENAI_API_KEY not set: start anyway, the chain is built (and fails) on first use
+        print("LLM extraction chain not prebuilt:", e)
+
+
+async def stop_llm_provider() -> None:
+    await _provider.aclose()
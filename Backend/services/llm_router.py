@@ -0,0 +1,280 @@
+# services/llm_router.py
+"""
+Latency-driven routing over the configured LLM providers.
+
+LLM_ROUTER_PROVIDERS lists "provider:model" targets, e.g.
+    LLM_ROUTER_PROVIDERS=openai:gpt-4o-mini,gemini:gemini-2.5-flash@1000/1000000
+(default: just LLM_PROVIDER/LLM_MODEL, which behaves exactly like a direct call).
+Every target has its own RPM/TPM buckets in the scheduler, LLM_RPM_LIMIT /
+LLM_TPM_LIMIT unless the target sets "@rpm/tpm": a 429 from one provider
+only throttles that provider.
+
+For every target the router keeps a rolling window of latencies and
+errors (LLM_ROUTER_WINDOW calls). Each call:
+    1. ranks healthy targets by rolling median latency (targets without data
+       go first so they get measured); a target whose error rate exceeds
+       LLM_ROUTER_MAX_ERROR_RATE is benched for LLM_ROUTER_COOLDOWN seconds
+    2. sends the request to the best target
+    3. with LLM_HEDGING_ENABLED, if no answer by that target's p95, sends a
+       hedged request to the next target and takes whichever valid answer
+       arrives first (the loser is cancelled)
+    4. on failure or an invalid answer, falls back to the next target
+
+Both hedged answers go through the same `validate` function, so a hedge
+can't win with a response the primary would have been rejected for. A
+cancelled loser counts as neither a success nor an error; its elapsed time is
+kept as a (lower-bound) latency sample so a slow target still ranks as slow.
+"""
+import asyncio
+import os
+import statistics
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional, Union
+
+from dotenv import load_dotenv
+from pydantic import BaseModel
+
+from langchain_components.chains import InvoiceData, format_extraction_prompt, partial_invoice_model
+from services import metrics
+from services.llm_provider import get_llm_provider, LLM_PROVIDER, LLM_MODEL
+from services.llm_scheduler import run_llm_call, RateLimits, LLM_MAX_RETRIES, LLM_RPM_LIMIT, LLM_TPM_LIMIT
+from services.tokenizer import count_tokens
+
+load_dotenv()
+
+LLM_ROUTER_PROVIDERS = os.getenv("LLM_ROUTER_PROVIDERS", f"{LLM_PROVIDER}:{LLM_MODEL}")
+LLM_ROUTER_WINDOW = int(os.getenv("LLM_ROUTER_WINDOW", "100"))
+LLM_ROUTER_MAX_ERROR_RATE = float(os.getenv("LLM_ROUTER_MAX_ERROR_RATE", "0.5"))
+LLM_ROUTER_MIN_SAMPLES = int(os.getenv("LLM_ROUTER_MIN_SAMPLES", "10"))
+LLM_ROUTER_COOLDOWN = float(os.getenv("LLM_ROUTER_COOLDOWN", "30"))
+LLM_HEDGING_ENABLED = os.getenv("LLM_HEDGING_ENABLED", "false").lower() in ("1", "true", "yes")
+
+
+class LLMTarget:
+    """One provider/model with its rolling latency and error window."""
+
+    def __init__(self, provider: str, model: str, rpm: int = LLM_RPM_LIMIT, tpm: int = LLM_TPM_LIMIT):
+        self.provider = provider
+        self.model = model
+        self.limits = RateLimits(rpm, tpm)
+        self.latencies = deque(maxlen=LLM_ROUTER_WINDOW)
+        self.outcomes = deque(maxlen=LLM_ROUTER_WINDOW)  # True = success
+        self.cancelled = 0
+        self.benched_until = 0.0
+
+    @property
+    def name(self) -> str:
+        return f"{self.provider}:{self.model}"
+
+    def record(self, latency: Optional[float], ok: bool) -> None:
+        if latency is not None:
+            self.latencies.append(latency)
+        self.outcomes.append(ok)
+        if not ok and len(self.outcomes) >= LLM_ROUTER_MIN_SAMPLES and self.error_rate() > LLM_ROUTER_MAX_ERROR_RATE:
+            self.benched_until = time.monotonic() + LLM_ROUTER_COOLDOWN
+            self.outcomes.clear()  # start fresh after the cooldown
+            metrics.increment("llm_router_benched")
+
+    def record_cancelled(self, elapsed: float) -> None:
+        """Lost a hedge race: not an outcome, but it took at least `elapsed`."""
+        self.latencies.append(elapsed)
+        self.cancelled += 1
+
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.benched_until
+
+    def p50(self) -> float:
+        return statistics.median(self.latencies) if self.latencies else 0.0
+
+    def p95(self) -> Optional[float]:
+        if len(self.latencies) < LLM_ROUTER_MIN_SAMPLES:
+            return None
+        return statistics.quantiles(self.latencies, n=20)[-1]
+
+    def stats(self) -> dict:
+        p95 = self.p95()
+        return {
+            "healthy": self.healthy(),
+            "samples": len(self.latencies),
+            "p50": round(self.p50(), 3),
+            "p95": round(p95, 3) if p95 is not None else None,
+            "error_rate": round(self.error_rate(), 3),
+            "cancelled": self.cancelled,
+        }
+
+
+def parse_targets(spec: str) -> list[LLMTarget]:
+    targets = []
+    for item in spec.split(","):
+        item = item.strip()
+        if item:
+            item, _, limits = item.partition("@")
+            provider, _, model = item.partition(":")
+            rpm, _, tpm = limits.partition("/")
+            targets.append(LLMTarget(
+                provider, model or LLM_MODEL,
+                rpm=int(rpm) if rpm else LLM_RPM_LIMIT, tpm=int(tpm) if tpm else LLM_TPM_LIMIT,
+            ))
+    return targets
+
+
+class LLMRouter:
+    def __init__(self, targets: list[LLMTarget]):
+        self.targets = targets
+
+    def ranked(self) -> list[LLMTarget]:
+        healthy = [t for t in self.targets if t.healthy()]
+        # If everything is benched, try the one that comes back soonest
+        candidates = healthy or sorted(self.targets, key=lambda t: t.benched_until)[:1]
+        return sorted(candidates, key=lambda t: t.p50())
+
+    async def _attempt(self, target: LLMTarget, make_call, validate, user_id, tokens, max_retries):
+        started = None
+        if callable(tokens):
+            tokens = tokens(target)
+
+        def timed_call():
+            # Latency is measured from when the request leaves the scheduler queue
+            nonlocal started
+            started = time.perf_counter()
+            return make_call(target)
+
+        try:
+            result = await run_llm_call(
+                timed_call, user_id=user_id, tokens=tokens, max_retries=max_retries, limits=target.limits,
+            )
+            result = validate(result)
+        except asyncio.CancelledError:
+            if started is not None:
+                target.record_cancelled(time.perf_counter() - started)
+                metrics.increment(f"llm_router_cancelled_{target.name}")
+            raise
+        except Exception:
+            target.record(None, False)
+            metrics.increment(f"llm_router_errors_{target.name}")
+            raise
+        target.record(time.perf_counter() - started, True)
+        metrics.increment(f"llm_router_calls_{target.name}")
+        return result
+
+    async def call(
+        self,
+        make_call: Callable[[LLMTarget], Awaitable],
+        validate: Callable = lambda result: result,
+        user_id=None,
+        tokens: Union[float, Callable[[LLMTarget], float]] = 0,
+    ):
+        """
+        `make_call(target)` returns the request coroutine for that target;
+        `validate(result)` returns the checked result or raises.
+        `tokens` is the request's token cost, or `tokens(target)` computes it
+        for the target's model.
+        """
+        ranked = self.ranked()
+        # With a single target keep the scheduler's own retries; otherwise fall back instead
+        max_retries = LLM_MAX_RETRIES if len(ranked) == 1 else 0
+
+        pending = set()
+        last_error = None
+        next_index = 0
+        hedge = None
+
+        def launch():
+            nonlocal next_index
+            target = ranked[next_index]
+            next_index += 1
+            task = asyncio.create_task(self._attempt(target, make_call, validate, user_id, tokens, max_retries))
+            pending.add(task)
+            return task
+
+        launch()
+        primary = ranked[0]
+        try:
+            while pending:
+                timeout = None
+                if LLM_HEDGING_ENABLED and hedge is None and next_index == 1 and len(ranked) > 1:
+                    timeout = primary.p95()
+
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Primary is slower than its p95: hedge on the next-best target
+                    metrics.increment("llm_hedges")
+                    hedge = launch()
+                    continue
+
+                for task in done:
+                    pending.discard(task)
+                    if task.exception() is None:
+                        if task is hedge:
+                            metrics.increment("llm_hedge_wins")
+                        return task.result()
+                    last_error = task.exception()
+
+                if not pending and next_index < len(ranked):
+                    metrics.increment("llm_fallbacks")
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        raise last_error
+
+
+_router: Optional[LLMRouter] = None
+
+
+def get_llm_router() -> LLMRouter:
+    global _router
+    if _router is None:
+        _router = LLMRouter(parse_targets(LLM_ROUTER_PROVIDERS))
+    return _router
+
+
+def get_target(provider: str, model: str) -> Optional[LLMTarget]:
+    """The router's target for provider/model (its rate limits), if it routes to it."""
+    for target in get_llm_router().targets:
+        if target.provider == provider and target.model == model:
+            return target
+    return None
+
+
+def validate_llm_result(result, schema: type[BaseModel]) -> BaseModel:
+    """Same check for every provider: the answer must parse as `schema`."""
+    if isinstance(result, BaseModel):
+        result = result.model_dump()
+    return schema.model_validate(result)
+
+
+async def route_extraction(text: str, fields=None, user_id=None):
+    """
+    Full extraction (fields=None) or partial extraction of `fields`, on the
+    best available provider.
+    """
+    provider = get_llm_provider()
+    if fields is None:
+        schema = InvoiceData
+
+        def make_call(target: LLMTarget):
+            return provider.get_extraction_chain(target.provider, target.model)(text)
+    else:
+        fields = tuple(fields)
+        schema = partial_invoice_model(fields)
+
+        def make_call(target: LLMTarget):
+            return provider.get_partial_extraction_chain(fields, target.provider, target.model)(text)
+
+    prompt = format_extraction_prompt(text, fields)
+    return await get_llm_router().call(
+        make_call,
+        validate=lambda result: validate_llm_result(result, schema),
+        user_id=user_id,
+        tokens=lambda target: count_tokens(prompt, target.model),
+    )
+
+
+def router_stats() -> dict:
+    return {t.name: t.stats() for t in get_llm_router().targets}
@@ -0,0 +1,277 @@
+# services/llm_scheduler.py
+"""
+Central scheduler for LLM calls.
+
+Every extraction call goes through `run_llm_call`, which:
+- waits for a slot under the concurrency cap (LLM_MAX_CONCURRENCY)
+- waits for the requests-per-minute and tokens-per-minute token buckets of
+  the provider/model it goes to (RateLimits; the router gives every target
+  its own, defaulting to LLM_RPM_LIMIT / LLM_TPM_LIMIT; the caller passes a
+  tiktoken estimate), so a throttled provider doesn't hold up the others
+- serves waiting users round-robin, so one user's 50-file batch can't starve
+  everybody else
+- retries rate-limit / transient provider errors with exponential backoff and
+  full jitter, honouring Retry-After when the provider sends one
+
+When retries run out on a rate limit the call fails with LLMRateLimitError,
+which the routes turn into a 429 instead of a 500.
+"""
+import asyncio
+import os
+import random
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Optional
+
+from dotenv import load_dotenv
+
+from services import metrics
+
+load_dotenv()
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_RPM_LIMIT = int(os.getenv("LLM_RPM_LIMIT", "500"))
+LLM_TPM_LIMIT = int(os.getenv("LLM_TPM_LIMIT", "200000"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1.0"))  # seconds
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30.0"))  # seconds
+LLM_OUTPUT_TOKEN_ESTIMATE = int(os.getenv("LLM_OUTPUT_TOKEN_ESTIMATE", "300"))  # schema + answer
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = {"APIConnectionError", "APITimeoutError", "ResourceExhausted", "ServiceUnavailable", "DeadlineExceeded"}
+
+
+class LLMRateLimitError(Exception):
+    """The provider kept rate-limiting us after all retries."""
+
+    def __init__(self, message: str, retry_after: float = LLM_BACKOFF_MAX):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    code = getattr(error, "status_code", None) or getattr(error, "code", None)
+    return code if isinstance(code, int) else None
+
+
+def _is_retryable(error: Exception) -> bool:
+    return _status_code(error) in RETRYABLE_STATUS or type(error).__name__ in RETRYABLE_ERRORS
+
+
+def _is_rate_limit(error: Exception) -> bool:
+    return _status_code(error) == 429 or type(error).__name__ in ("RateLimitError", "ResourceExhausted")
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter: uniform(0, min(max, base * 2^attempt))."""
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt)))
+
+
+class TokenBucket:
+    """Classic token bucket: `capacity` tokens, refilled continuously over one minute."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available (0 if they already are)."""
+        self._refill()
+        amount = min(amount, self.capacity)  # a single oversized prompt must still go through
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+
+class RateLimits:
+    """The RPM and TPM buckets of one provider/model."""
+
+    def __init__(self, rpm: int = LLM_RPM_LIMIT, tpm: int = LLM_TPM_LIMIT):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+
+    def wait_time(self, tokens: float) -> float:
+        return max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+
+    def take(self, tokens: float) -> None:
+        self.requests.take(1)
+        self.tokens.take(tokens)
+
+    def throttle(self) -> None:
+        """The provider said 429: everyone else would hit the same limit, drain the request bucket."""
+        self.requests.tokens = 0
+
+
+class LLMScheduler:
+    def __init__(self, max_concurrency: int, rpm: int, tpm: int):
+        self.max_concurrency = max_concurrency
+        self.limits = RateLimits(rpm, tpm)  # for calls that don't name their own
+        self.active = 0
+        self._queues: "OrderedDict[str, deque]" = OrderedDict()  # user → waiting (future, tokens, limits)
+        self._changed = asyncio.Event()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    # 1) Fair queue
+    def queue_depth(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def _next_waiter(self) -> tuple[Optional[tuple], Optional[float]]:
+        """
+        Round-robin over users: the first user whose oldest request is within
+        its provider's limits goes next and moves to the back. Returns
+        (waiter, None), or (None, seconds until a limit frees up), or
+        (None, None) when nobody is waiting.
+        """
+        delay = None
+        for user in list(self._queues):
+            queue = self._queues[user]
+            while queue and queue[0][0].done():
+                queue.popleft()  # cancelled while waiting
+            if not queue:
+                del self._queues[user]
+                continue
+            _, tokens, limits = queue[0]
+            wait = limits.wait_time(tokens)
+            if wait > 0:
+                delay = wait if delay is None else min(delay, wait)
+                continue
+            waiter = queue.popleft()
+            del self._queues[user]
+            if queue:
+                self._queues[user] = queue
+            return waiter, None
+        return None, delay
+
+    async def _dispatch(self) -> None:
+        while True:
+            self._changed.clear()
+            if self.active >= self.max_concurrency:
+                await self._changed.wait()
+                continue
+
+            waiter, delay = self._next_waiter()
+            if waiter is None:
+                if delay is None:
+                    await self._changed.wait()
+                    continue
+                # Every waiting request is held back by its provider's buckets
+                metrics.increment("llm_throttle_waits")
+                try:
+                    await asyncio.wait_for(self._changed.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            future, tokens, limits = waiter
+            limits.take(tokens)
+            self.active += 1
+            future.set_result(None)
+
+    # 2) Slots
+    async def acquire(self, user_id, tokens: float, limits: Optional[RateLimits] = None) -> None:
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(str(user_id), deque()).append((future, tokens, limits or self.limits))
+        self._changed.set()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # granted just as we were cancelled
+            raise
+
+    def release(self) -> None:
+        self.active -= 1
+        self._changed.set()
+
+    # 3) Calls with retry
+    async def run(
+        self,
+        call: Callable[[], Awaitable],
+        user_id=None,
+        tokens: float = 0,
+        max_retries: int = LLM_MAX_RETRIES,
+        limits: Optional[RateLimits] = None,
+    ):
+        limits = limits or self.limits
+        attempt = 0
+        while True:
+            await self.acquire(user_id, tokens, limits)
+            try:
+                return await call()
+            except Exception as e:
+                if not _is_retryable(e):
+                    raise
+                metrics.increment("llm_rate_limited" if _is_rate_limit(e) else "llm_transient_errors")
+                if _is_rate_limit(e):
+                    limits.throttle()
+                if attempt >= max_retries:
+                    if _is_rate_limit(e):
+                        raise LLMRateLimitError(f"LLM provider rate limit: {e}", _retry_after(e) or LLM_BACKOFF_MAX) from e
+                    raise
+                delay = max(backoff_delay(attempt), _retry_after(e) or 0)
+            finally:
+                self.release()
+
+            metrics.increment("llm_retries")
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def close(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+
+
+_scheduler: Optional[LLMScheduler] = None
+
+
+def get_llm_scheduler() -> LLMScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = LLMScheduler(LLM_MAX_CONCURRENCY, LLM_RPM_LIMIT, LLM_TPM_LIMIT)
+    return _scheduler
+
+
+async def run_llm_call(
+    call: Callable[[], Awaitable],
+    user_id=None,
+    tokens: float = 0,
+    max_retries: int = LLM_MAX_RETRIES,
+    limits: Optional[RateLimits] = None,
+):
+    """Run `call()` (an LLM request) under `limits` (its provider's RPM/TPM buckets), with retries."""
+    return await get_llm_scheduler().run(
+        call, user_id=user_id, tokens=tokens + LLM_OUTPUT_TOKEN_ESTIMATE, max_retries=max_retries, limits=limits,
+    )
+
+
+async def stop_llm_scheduler() -> None:
+    global _scheduler
+    if _scheduler is not None:
+        await _scheduler.close()
+        _scheduler = None
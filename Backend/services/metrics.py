@@ -0,0 +1,37 @@
+# services/metrics.py
+"""
+Tiny in-process counters for pipeline metrics (cache hits, LLM calls skipped,
+tokens saved, …). Values are per uvicorn worker process; exposed as JSON on
+GET /metrics.
+"""
+import threading
+from collections import defaultdict
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+
+
+def increment(name: str, value: float = 1) -> None:
+    with _lock:
+        _counters[name] += value
+
+
+def get(name: str) -> float:
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def ratio(numerator: str, denominator: str) -> float:
+    with _lock:
+        total = _counters.get(denominator, 0)
+        return round(_counters.get(numerator, 0) / total, 4) if total else 0.0
+
+
+def snapshot() -> dict:
+    with _lock:
+        return dict(_counters)
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
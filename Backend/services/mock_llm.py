@@ -0,0 +1,93 @@
+# services/mock_llm.py
+"""
+Local mock LLM provider (LLM_PROVIDER=mock).
+
+Implements the small part of the LangChain chat-model interface the chains
+use (`with_structured_output(...).ainvoke/invoke`). "Answers" come from the
+rule-based extractor run on the document text found in the prompt, so
+batch packing, result mapping, retries and routing can be exercised without
+network access or API keys.
+
+Env vars:
+    MOCK_LLM_LATENCY        seconds to sleep per call
+    MOCK_LLM_FAILURE_RATE   probability [0, 1] that a call fails with a 503
+"""
+import asyncio
+import os
+import random
+import re
+import time
+
+from dotenv import load_dotenv
+from pydantic import BaseModel
+
+from services.rule_extractor import extract_fields
+
+load_dotenv()
+
+MOCK_LLM_LATENCY = float(os.getenv("MOCK_LLM_LATENCY", "0"))
+MOCK_LLM_FAILURE_RATE = float(os.getenv("MOCK_LLM_FAILURE_RATE", "0"))
+
+_DOCUMENT_RE = re.compile(r"^=== DOCUMENT (\S+) ===$", re.M)
+_PLACEHOLDERS = {str: "unknown", float: 0.0}
+
+
+class MockLLMError(Exception):
+    """Injected provider failure; looks like a 503 to the scheduler."""
+
+    status_code = 503
+
+
+def _answer(schema: type[BaseModel], text: str, **known) -> BaseModel:
+    fields = extract_fields(text)
+    values = dict(known)
+    for name, info in schema.model_fields.items():
+        if name in known:
+            continue
+        value = fields[name]["value"] if name in fields else None
+        if value is None and info.is_required():
+            value = _PLACEHOLDERS.get(info.annotation)
+        values[name] = value
+    return schema(**values)
+
+
+class _MockStructuredModel:
+    def __init__(self, llm: "MockChatModel", schema: type[BaseModel]):
+        self.llm = llm
+        self.schema = schema
+
+    def _respond(self, prompt: str) -> BaseModel:
+        self.llm.calls += 1
+        if random.random() < self.llm.failure_rate:
+            raise MockLLMError("mock provider: injected failure")
+
+        if "invoices" in self.schema.model_fields:
+            # Batch prompt: one answer per "=== DOCUMENT <id> ===" block
+            item_schema = self.schema.model_fields["invoices"].annotation.__args__[0]
+            parts = _DOCUMENT_RE.split(prompt)[1:]
+            items = [_answer(item_schema, text, document_id=doc_id) for doc_id, text in zip(parts[::2], parts[1::2])]
+            return self.schema(invoices=items)
+
+        text = prompt.split("Invoice Text:", 1)[-1]
+        return _answer(self.schema, text)
+
+    async def ainvoke(self, prompt: str) -> BaseModel:
+        if self.llm.latency:
+            await asyncio.sleep(self.llm.latency)
+        return self._respond(prompt)
+
+    def invoke(self, prompt: str) -> BaseModel:
+        if self.llm.latency:
+            time.sleep(self.llm.latency)
+        return self._respond(prompt)
+
+
+class MockChatModel:
+    def __init__(self, model: str = "rules", latency: float = MOCK_LLM_LATENCY, failure_rate: float = MOCK_LLM_FAILURE_RATE):
+        self.model = model
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.calls = 0
+
+    def with_structured_output(self, schema: type[BaseModel]) -> _MockStructuredModel:
+        return _MockStructuredModel(self, schema)
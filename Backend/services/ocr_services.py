@@ -1,26 +1,149 @@
 # services/ocr_services.py
 
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, Iterable
+
 import fitz  # PyMuPDF
 import pytesseract
-from pdf2image import convert_from_path
+from dotenv import load_dotenv
+from PIL import Image
+
+from services.text_constants import PAGE_SEPARATOR
+
+load_dotenv()
+
+# Pages are rasterized one at a time and OCR'd in parallel; at most
+# OCR_MAX_PAGES_IN_MEMORY page bitmaps exist at any time.
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1)))
+OCR_MAX_PAGES_IN_MEMORY = int(os.getenv("OCR_MAX_PAGES_IN_MEMORY", "4"))
+OCR_MAX_PAGES = int(os.getenv("OCR_MAX_PAGES", "50"))  # per-document OCR page limit
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+
+# Per-page digital-vs-OCR decision (see page_needs_ocr)
+PAGE_MIN_TEXT_CHARS = int(os.getenv("PAGE_MIN_TEXT_CHARS", "40"))
+PAGE_MIN_TEXT_DENSITY = float(os.getenv("PAGE_MIN_TEXT_DENSITY", "2.0"))  # chars per 100x100pt
+PAGE_MIN_IMAGE_COVERAGE = float(os.getenv("PAGE_MIN_IMAGE_COVERAGE", "0.3"))  # fraction of page area
+
+# Tesseract spawns its own OpenMP threads per call; with page-level
+# parallelism that oversubscribes the CPU, so pin each call to one thread.
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+
+def ocr_pages(render_page: Callable[[int], Image.Image], page_numbers: Iterable[int]) -> Dict[int, str]:
+    """
+    Rasterize pages one at a time and OCR them in parallel.
+    `render_page(n)` returns a PIL image for page n and is always called from
+    this thread (PyMuPDF documents are not thread-safe). Results are keyed by
+    page number so callers can reassemble them in order.
+    """
+    max_in_flight = max(1, min(OCR_WORKERS, OCR_MAX_PAGES_IN_MEMORY))
+
+    def ocr_image(img: Image.Image) -> str:
+        try:
+            return pytesseract.image_to_string(img)
+        finally:
+            img.close()
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        pending = {}
+        for page_no in page_numbers:
+            # Window: don't render another page until one of the in-flight pages is done
+            if len(pending) >= max_in_flight:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[pending.pop(future)] = future.result()
+            pending[pool.submit(ocr_image, render_page(page_no))] = page_no
+
+        for future in pending:
+            results[pending[future]] = future.result()
+
+    return results
+
+
+def _open_pdf(source) -> fitz.Document:
+    if isinstance(source, (bytes, bytearray)):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(source)
+
+
+def _render_page(page: fitz.Page) -> Image.Image:
+    pix = page.get_pixmap(dpi=OCR_DPI, colorspace=fitz.csGRAY)
+    return Image.frombytes("L", (pix.width, pix.height), pix.samples)
+
+
+def page_needs_ocr(page: fitz.Page, text: str) -> bool:
+    """
+    Decide per page whether the digital text layer is usable:
+    - pages without (significant) images are always digital — there is nothing to OCR
+    - image-heavy pages with little or sparse text are scans → OCR
+    """
+    page_area = abs(page.rect) or 1.0
+    image_area = 0.0
+    for info in page.get_image_info():
+        bbox = fitz.Rect(info["bbox"]) & page.rect
+        image_area += abs(bbox)
+    image_coverage = min(image_area / page_area, 1.0)
+
+    if image_coverage < PAGE_MIN_IMAGE_COVERAGE:
+        return False
+
+    chars = len(text.strip())
+    density = chars / (page_area / 10000)
+    return chars < PAGE_MIN_TEXT_CHARS or density < PAGE_MIN_TEXT_DENSITY
+
+
+def extract_pdf_text(source) -> str:
+    """
+    Hybrid extraction: digital text (PyMuPDF) where the page has it, OCR only
+    for image-only pages. `source` is a path or a bytes buffer. Pages are
+    joined with PAGE_SEPARATOR in document order.
+    """
+    with _open_pdf(source) as doc:
+        page_texts = []
+        ocr_page_numbers = []
+        for page in doc:
+            text = page.get_text()
+            page_texts.append(text)
+            if page_needs_ocr(page, text):
+                ocr_page_numbers.append(page.number)
+
+        if len(ocr_page_numbers) > OCR_MAX_PAGES:
+            print(f"OCR page limit reached: processing {OCR_MAX_PAGES} of {len(ocr_page_numbers)} scanned pages")
+            ocr_page_numbers = ocr_page_numbers[:OCR_MAX_PAGES]
+
+        if ocr_page_numbers:
+            ocr_texts = ocr_pages(lambda n: _render_page(doc[n]), ocr_page_numbers)
+            for page_no, text in ocr_texts.items():
+                page_texts[page_no] = text
+
+    return PAGE_SEPARATOR.join(page_texts)
+
+
+def ocr_pdf_pages(source) -> str:
+    """OCR every page of a scanned PDF (capped at OCR_MAX_PAGES), text in page order."""
+    with _open_pdf(source) as doc:
+        page_numbers = range(min(doc.page_count, OCR_MAX_PAGES))
+        if doc.page_count > OCR_MAX_PAGES:
+            print(f"OCR page limit reached: processing {OCR_MAX_PAGES} of {doc.page_count} pages")
+        texts = ocr_pages(lambda n: _render_page(doc[n]), page_numbers)
+
+    return PAGE_SEPARATOR.join(texts[n] for n in page_numbers)
 
 
 # 1️⃣ Digital PDF text extraction
 async def extract_text_from_file(file_path: str) -> str:
-    text = ""
     with fitz.open(file_path) as doc:
-        for page in doc:
-            text += page.get_text()
+        text = "".join(page.get_text() for page in doc)
 
     return text.strip()
 
 
 # 2️⃣ OCR extraction for scanned PDFs
 async def ocr_scanned_pdf(file_path: str) -> str:
-    images = convert_from_path(file_path)
-    text = ""
-    for img in images:
-        text += pytesseract.image_to_string(img)
+    text = await asyncio.to_thread(ocr_pdf_pages, file_path)
 
     return text.strip()
 
@@ -29,21 +152,12 @@ async def ocr_scanned_pdf(file_path: str) -> str:
 async def extract_invoice_text(file_path: str) -> str:
     """
     Aim:
-    - Try digital text extraction first (PyMuPDF)
-    - If no text → run OCR using Tesseract
+    - Use digital text extraction (PyMuPDF) on pages that have a text layer
+    - Run OCR using Tesseract only on image-only (scanned) pages
     """
+    text = await asyncio.to_thread(extract_pdf_text, file_path)
 
-    # Try digital extraction
-    digital_text = await extract_text_from_file(file_path)
-
-    if digital_text and len(digital_text) > 20:
-        # Text found successfully → just return it
-        return digital_text
-
-    # No text or too little = scanned PDF → use OCR
-    ocr_text = await ocr_scanned_pdf(file_path)
-
-    if ocr_text:
-        return ocr_text
+    if text.strip():
+        return text.strip()
 
     return "No text could be extracted from this PDF."
@@ -0,0 +1,163 @@
+# services/prompt_compactor.py
+"""
+Token-budgeted prompt compaction: only invoice-relevant text goes to the LLM.
+
+Multi-page contracts and long statements are mostly terms & conditions and
+line items the extraction schema never asks for. When a document is over
+PROMPT_TOKEN_BUDGET tokens (short receipts are sent untouched):
+    1. drop OCR noise (lines with almost no letters/digits), lines repeated on
+       every page (running headers/footers) and legal/boilerplate lines
+    2. rank the remaining lines:
+       - total / subtotal / tax lines (+ the next line, where OCR often puts
+         the value): always kept, whatever the budget
+       - header block of the first page (vendor, invoice number, dates)
+       - invoice-number, labelled date and currency lines (+ the next line)
+       - everything else, in document order
+       Amounts and dates alone don't make a line important: on a long
+       invoice every line item has them.
+    3. keep lines by rank until PROMPT_TOKEN_BUDGET tokens, emit them in
+       original order
+
+Rules and templates still see the full text; only the prompt is compacted.
+"""
+import os
+import re
+from collections import Counter
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from services.rule_extractor import (
+    CURRENCY_CODES, CURRENCY_SYMBOLS, DATE_LABEL_RE,
+    INVOICE_NUMBER_RE, SUBTOTAL_LABEL_RE, TAX_LABEL_RE, TOTAL_LABELS,
+)
+from services.text_constants import PAGE_SEPARATOR
+from services.tokenizer import count_tokens
+
+load_dotenv()
+
+PROMPT_COMPACTION_ENABLED = os.getenv("PROMPT_COMPACTION_ENABLED", "true").lower() in ("1", "true", "yes")
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1500"))
+PROMPT_HEADER_LINES = int(os.getenv("PROMPT_HEADER_LINES", "15"))
+
+# Bump when the compaction rules change (part of the extraction cache key)
+PROMPT_COMPACTOR_VERSION = "2"
+
+BOILERPLATE_RE = re.compile(
+    r"\b(terms\s+(?:and|&)\s+conditions|all\s+rights\s+reserved|governing\s+law|liabilit(?:y|ies)|indemnif|"
+    r"warrant(?:y|ies)|arbitration|confidential|privacy\s+policy|hereby|thereof|herein|"
+    r"page\s+\d+\s+(?:of|/)\s+\d+|thank\s+you\s+for\s+your\s+business)\b",
+    re.I,
+)
+_CURRENCY_RE = re.compile(
+    "[" + re.escape("".join(CURRENCY_SYMBOLS)) + r"]|\b(" + "|".join(sorted(CURRENCY_CODES)) + r")\b"
+)
+_ALNUM_RE = re.compile(r"[A-Za-z0-9]")
+_SPACES_RE = re.compile(r"[ \t]{2,}")
+
+TOTALS, HEADER, KEY, BODY = 0, 1, 2, 3  # line ranks, most important first
+_DIGIT_RE = re.compile(r"\d")
+
+
+def _is_noise(line: str) -> bool:
+    return len(_ALNUM_RE.findall(line)) < 2
+
+
+def _is_totals_line(line: str) -> bool:
+    return bool(
+        any(pattern.search(line) for pattern, _ in TOTAL_LABELS)
+        or SUBTOTAL_LABEL_RE.search(line)
+        or TAX_LABEL_RE.search(line)
+    )
+
+
+def _is_key_line(line: str) -> bool:
+    return bool(
+        INVOICE_NUMBER_RE.search(line)
+        or DATE_LABEL_RE.search(line)
+        # "Currency: EUR", "All amounts in USD" — not every line item priced in $
+        or (_CURRENCY_RE.search(line) and not _DIGIT_RE.search(line))
+    )
+
+
+def _clean_lines(text: str) -> list[tuple[int, str]]:
+    """(page number, line) pairs without noise, boilerplate or running headers/footers."""
+    pages = [
+        [_SPACES_RE.sub(" ", line.strip()) for line in page.splitlines()]
+        for page in text.split(PAGE_SEPARATOR)
+    ]
+    pages = [[line for line in page if line and not _is_noise(line)] for page in pages]
+
+    # A line seen on most pages is a running header/footer; keep its first occurrence only
+    repeated = set()
+    if len(pages) > 2:
+        counts = Counter(line for page in pages for line in set(page))
+        repeated = {line for line, n in counts.items() if n > len(pages) / 2}
+
+    lines, seen = [], set()
+    for page_no, page in enumerate(pages):
+        for line in page:
+            if line in repeated:
+                if line in seen:
+                    continue
+                seen.add(line)
+            elif BOILERPLATE_RE.search(line) and not (_is_totals_line(line) or _is_key_line(line)):
+                continue
+            lines.append((page_no, line))
+    return lines
+
+
+def compact_prompt_text(text: str, budget: int = PROMPT_TOKEN_BUDGET, model: Optional[str] = None) -> tuple[str, dict]:
+    """
+    Returns (compacted text, stats) where stats has original_tokens,
+    compacted_tokens and tokens_saved. Tokens are counted for `model`.
+    """
+    original_tokens = count_tokens(text, model)
+    if original_tokens <= budget:
+        return text, {"original_tokens": original_tokens, "compacted_tokens": original_tokens, "tokens_saved": 0}
+
+    lines = _clean_lines(text)
+
+    # 1️⃣ Rank every line
+    ranks = [BODY] * len(lines)
+    for i, (page_no, line) in enumerate(lines):
+        if _is_totals_line(line):
+            rank = TOTALS
+        elif page_no == 0 and i < PROMPT_HEADER_LINES:
+            rank = HEADER
+        elif _is_key_line(line):
+            rank = KEY
+        else:
+            continue
+        ranks[i] = min(ranks[i], rank)
+        if rank != HEADER and i + 1 < len(lines):
+            ranks[i + 1] = min(ranks[i + 1], rank)  # value on the next line
+
+    # 2️⃣ Fill the budget by rank, then by position
+    costs = [count_tokens(line, model) + 1 for _, line in lines]  # +1 for the newline
+    keep, used = set(), 0
+    for i in sorted(range(len(lines)), key=lambda i: (ranks[i], i)):
+        if used + costs[i] > budget and ranks[i] != TOTALS:
+            if ranks[i] == BODY:
+                break  # body lines are in document order: nothing later fits better
+            continue
+        keep.add(i)
+        used += costs[i]
+
+    # 3️⃣ Emit in document order, with a page break between pages
+    out, last_page = [], 0
+    for i in sorted(keep):
+        page_no, line = lines[i]
+        if page_no != last_page:
+            out.append(PAGE_SEPARATOR)
+            last_page = page_no
+        out.append(line)
+    compacted = "\n".join(out)
+
+    compacted_tokens = count_tokens(compacted, model)
+    stats = {
+        "original_tokens": original_tokens,
+        "compacted_tokens": compacted_tokens,
+        "tokens_saved": max(original_tokens - compacted_tokens, 0),
+    }
+    return compacted, stats
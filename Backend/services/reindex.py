@@ -0,0 +1,113 @@
+# services/reindex.py
+"""
+Rebuild the invoice vector index from invoices.raw_text.
+
+    python -m services.reindex [--reset] [--batch-size 100] [--queue]
+
+Invoices are read in primary-key order, BATCH_SIZE at a time, chunked and
+written to the index with one embedding + upsert per batch. Progress and
+throughput are printed after every batch. Safe to re-run: an invoice's
+chunks are replaced, never duplicated. Soft-deleted invoices are skipped.
+With VECTOR_BACKEND=faiss the run ends by compacting (training) the FAISS
+index.
+
+With --queue nothing is indexed here: every invoice is marked pending and
+the running app's background indexer (services/indexer.py) picks them up.
+"""
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import select, update, func
+
+from database.db import async_session
+from database.models import Invoice
+from services.indexer import enqueue_reindex, invoice_index_item, INDEX_COLUMNS
+from services.vectorstore import index_invoices, reset_vectorstore, VECTOR_BACKEND
+
+if VECTOR_BACKEND == "faiss":
+    from services import faiss_store
+
+# Soft-deleted invoices stay out of the index
+INDEXABLE = (Invoice.raw_text.isnot(None), Invoice.index_status != "deleted")
+
+
+async def reindex(batch_size: int = 100, reset: bool = False) -> dict:
+    if reset:
+        print("Dropping the existing index…")
+        await asyncio.to_thread(reset_vectorstore)
+
+    async with async_session() as db:
+        total = await db.scalar(select(func.count()).select_from(Invoice).where(*INDEXABLE))
+
+    done = chunks_written = cache_hits = api_requests = 0
+    last_id = None
+    started = time.perf_counter()
+
+    while True:
+        # Keyset pagination: stable and cheap however large the table is
+        query = (
+            select(*INDEX_COLUMNS)
+            .where(*INDEXABLE)
+            .order_by(Invoice.id)
+            .limit(batch_size)
+        )
+        if last_id is not None:
+            query = query.where(Invoice.id > last_id)
+        async with async_session() as db:
+            rows = (await db.execute(query)).all()
+        if not rows:
+            break
+
+        items = [invoice_index_item(row) for row in rows]
+        summary = await asyncio.to_thread(index_invoices, items)
+        async with async_session() as db:
+            await db.execute(
+                update(Invoice)
+                .where(Invoice.id.in_([row.id for row in rows]), Invoice.index_status != "deleted")
+                .values(index_status="indexed", indexed_at=func.now(), index_error=None)
+            )
+            await db.commit()
+        chunks_written += summary["chunks"]
+        cache_hits += summary["cache_hits"]
+        api_requests += summary["api_requests"]
+        done += len(rows)
+        last_id = rows[-1].id
+
+        elapsed = time.perf_counter() - started
+        print(
+            f"{done}/{total} invoices ({done / max(total, 1):.0%}), {chunks_written} chunks — "
+            f"{done / elapsed:.1f} invoices/s, {chunks_written / elapsed:.1f} chunks/s, "
+            f"embedding cache hit rate {cache_hits / max(chunks_written, 1):.0%}, {api_requests} API requests"
+        )
+
+    if VECTOR_BACKEND == "faiss":
+        # Everything written above sits in the FAISS delta: train and build the base index
+        print("Building the FAISS index…")
+        print(await asyncio.to_thread(faiss_store.compact))
+
+    elapsed = time.perf_counter() - started
+    print(f"Reindexed {done} invoices ({chunks_written} chunks) in {elapsed:.1f}s")
+    return {"invoices": done, "chunks": chunks_written, "cache_hits": cache_hits, "api_requests": api_requests, "seconds": elapsed}
+
+
+async def queue_reindex(reset: bool = False) -> int:
+    if reset:
+        print("Dropping the existing index…")
+        await asyncio.to_thread(reset_vectorstore)
+    async with async_session() as db:
+        queued = await enqueue_reindex(db)
+    print(f"Queued {queued} invoices for the background indexer")
+    return queued
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the invoice vector index from invoices.raw_text")
+    parser.add_argument("--reset", action="store_true", help="drop the existing index first")
+    parser.add_argument("--batch-size", type=int, default=100, help="invoices per embedding/upsert batch")
+    parser.add_argument("--queue", action="store_true", help="queue every invoice for the background indexer instead")
+    args = parser.parse_args()
+    if args.queue:
+        asyncio.run(queue_reindex(reset=args.reset))
+    else:
+        asyncio.run(reindex(batch_size=args.batch_size, reset=args.reset))
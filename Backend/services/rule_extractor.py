@@ -0,0 +1,300 @@
+# services/rule_extractor.py
+"""
+Deterministic fast path for invoice fields.
+
+Runs before the LLM: regexes for labelled fields ("Invoice No:", "Total"),
+currency-symbol detection and date parsing. Every field comes back with a
+confidence in [0, 1]; the extractor only calls the LLM for required fields
+that are missing or below RULE_CONFIDENCE_THRESHOLD. Weak optional values
+(a "$" read as USD) are sent along when the LLM is called anyway and kept
+as the best guess when it isn't.
+"""
+import os
+import re
+from datetime import datetime
+from typing import Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+RULE_EXTRACTION_ENABLED = os.getenv("RULE_EXTRACTION_ENABLED", "true").lower() in ("1", "true", "yes")
+RULE_CONFIDENCE_THRESHOLD = float(os.getenv("RULE_CONFIDENCE_THRESHOLD", "0.8"))
+
+# Bump when the rules change so cached extractions are recomputed
+RULE_EXTRACTOR_VERSION = "2"
+
+REQUIRED_FIELDS = ("vendor_name", "invoice_number", "invoice_date", "total_amount")
+ALL_FIELDS = REQUIRED_FIELDS + ("tax_amount", "currency")
+
+CURRENCY_SYMBOLS = {
+    "€": "EUR",
+    "£": "GBP",
+    "₦": "NGN",
+    "₹": "INR",
+    "¥": "JPY",
+    "₩": "KRW",
+    "₱": "PHP",
+    "$": "USD",  # ambiguous (CAD, AUD, …) → lower confidence below
+}
+CURRENCY_CODES = {
+    "USD", "EUR", "GBP", "NGN", "INR", "JPY", "CNY", "CAD", "AUD", "NZD", "CHF",
+    "ZAR", "KES", "GHS", "SEK", "NOK", "DKK", "PLN", "BRL", "MXN", "SGD", "HKD", "AED",
+}
+
+_AMOUNT = r"[-+]?\d{1,3}(?:[,.\u00a0\u202f]\d{3})*(?:[.,]\d{1,2})?|[-+]?\d+(?:[.,]\d{1,2})?"
+AMOUNT_RE = re.compile(rf"(?<![\w.,])({_AMOUNT})(?![\w])")
+
+INVOICE_NUMBER_RE = re.compile(
+    r"\b(invoice|inv|receipt|bill|tax invoice)\s*(?:no\.?|number|num\.?|#|id)\s*[:#.]?\s*([A-Z0-9][A-Z0-9\-/_.]{1,30})",
+    re.IGNORECASE,
+)
+
+# Labelled totals, most specific first: (pattern, confidence)
+TOTAL_LABELS = [
+    (re.compile(r"\b(grand\s+total|total\s+due|amount\s+due|balance\s+due|total\s+amount|amount\s+payable|total\s+payable)\b", re.I), 0.95),
+    (re.compile(r"(?<!sub)(?<!sub\s)\btotal\b", re.I), 0.85),
+]
+TAX_LABEL_RE = re.compile(r"\b(vat|gst|hst|sales\s+tax|tax)\b(?!\s*(?:id|no|number|invoice|reg))", re.I)
+EXCLUDED_TOTAL_RE = re.compile(r"\b(sub\s*-?\s*total|total\s+(?:excl|before|net|items|qty|quantity|pages?|vat|tax|gst))\b", re.I)
+
+DATE_LABEL_RE = re.compile(r"\b(invoice\s+date|date\s+of\s+issue|issue\s+date|issued|receipt\s+date|date)\b", re.I)
+DUE_DATE_RE = re.compile(r"\b(due|payment\s+date|delivery|ship)", re.I)
+DATE_PATTERNS = [
+    # (regex, strptime formats, confidence)
+    (re.compile(r"\b(\d{4}-\d{1,2}-\d{1,2})\b"), ("%Y-%m-%d",), 0.95),
+    (re.compile(r"\b(\d{4}/\d{1,2}/\d{1,2})\b"), ("%Y/%m/%d",), 0.9),
+    (re.compile(r"\b(\d{1,2}\s+[A-Za-z]{3,9}\.?,?\s+\d{4})\b"), ("%d %B %Y", "%d %b %Y", "%d %B, %Y", "%d %b, %Y"), 0.9),
+    (re.compile(r"\b([A-Za-z]{3,9}\.?\s+\d{1,2},?\s+\d{4})\b"), ("%B %d, %Y", "%b %d, %Y", "%B %d %Y", "%b %d %Y"), 0.9),
+    (re.compile(r"\b(\d{1,2}[/.\-]\d{1,2}[/.\-]\d{4})\b"), None, 0.85),  # day/month order resolved below
+]
+
+VENDOR_LABEL_RE = re.compile(r"^\s*(?:from|vendor|supplier|sold\s+by|seller|billed\s+by|issued\s+by)\s*[:\-]\s*(.+)$", re.I)
+COMPANY_SUFFIX_RE = re.compile(
+    r"\b(ltd|limited|llc|l\.l\.c\.|inc|incorporated|plc|gmbh|corp|corporation|co\.|company|s\.a\.|b\.v\.|pty|enterprises|ventures|store|stores|supermarket)\b\.?",
+    re.I,
+)
+NOT_VENDOR_RE = re.compile(r"\b(invoice|receipt|bill\s+to|ship\s+to|date|page|tel|phone|email|www\.|http|total)\b", re.I)
+
+
+def _field(value, confidence: float) -> dict:
+    return {"value": value, "confidence": round(confidence, 2)}
+
+
+def parse_amount(raw: str) -> Optional[float]:
+    """Parse '1,234.56', '1.234,56', '1\u00a0234,56' or '1234' into a float."""
+    s = re.sub(r"[\s\u00a0\u202f]", "", raw)
+    if not s:
+        return None
+    last_dot, last_comma = s.rfind("."), s.rfind(",")
+    if last_comma > last_dot:
+        # comma is the decimal separator if followed by 1–2 digits
+        if len(s) - last_comma - 1 in (1, 2):
+            s = s.replace(".", "").replace(",", ".")
+        else:
+            s = s.replace(",", "")
+    else:
+        s = s.replace(",", "")
+        if s.count(".") > 1:
+            head, _, tail = s.rpartition(".")
+            s = head.replace(".", "") + "." + tail
+    try:
+        return float(s)
+    except ValueError:
+        return None
+
+
+def _amounts_in(line: str, skip_rates: bool = False) -> list[float]:
+    values = []
+    for match in AMOUNT_RE.finditer(line):
+        if skip_rates and line[match.end():].lstrip().startswith("%"):
+            continue
+        value = parse_amount(match.group(1))
+        if value is not None:
+            values.append(value)
+    return values
+
+
+def _parse_date(raw: str, formats, base_confidence: float) -> Optional[tuple[str, float]]:
+    raw = raw.replace(".", "").strip() if formats and "%b" in " ".join(formats) else raw.strip()
+    if formats:
+        for fmt in formats:
+            try:
+                return datetime.strptime(raw, fmt).date().isoformat(), base_confidence
+            except ValueError:
+                continue
+        return None
+
+    # dd/mm/yyyy vs mm/dd/yyyy
+    a, b, year = (int(p) for p in re.split(r"[/.\-]", raw))
+    if a > 12 and b <= 12:
+        day, month, confidence = a, b, base_confidence
+    elif b > 12 and a <= 12:
+        day, month, confidence = b, a, base_confidence
+    else:
+        day, month, confidence = a, b, 0.6  # ambiguous, assume day-first
+    try:
+        return datetime(year, month, day).date().isoformat(), confidence
+    except ValueError:
+        return None
+
+
+def _find_dates(line: str) -> list[tuple[str, float]]:
+    found = []
+    for pattern, formats, confidence in DATE_PATTERNS:
+        for match in pattern.finditer(line):
+            parsed = _parse_date(match.group(1), formats, confidence)
+            if parsed:
+                found.append(parsed)
+    return found
+
+
+def extract_invoice_number(lines: list[str]) -> Optional[dict]:
+    for line in lines:
+        match = INVOICE_NUMBER_RE.search(line)
+        if match and any(c.isdigit() for c in match.group(2)):
+            label = match.group(1).lower()
+            confidence = 0.95 if label.startswith(("invoice", "inv", "tax")) else 0.85
+            return _field(match.group(2).rstrip(".-/"), confidence)
+    return None
+
+
+def extract_invoice_date(lines: list[str]) -> Optional[dict]:
+    labelled, unlabelled = [], []
+    for line in lines:
+        dates = _find_dates(line)
+        if not dates:
+            continue
+        if DATE_LABEL_RE.search(line) and not DUE_DATE_RE.search(line):
+            labelled.extend(dates)
+        elif not DUE_DATE_RE.search(line):
+            unlabelled.extend(dates)
+
+    if labelled:
+        value, confidence = labelled[0]
+        return _field(value, confidence)
+    if unlabelled:
+        value, confidence = unlabelled[0]
+        # A lone unlabelled date on a receipt is very likely the invoice date
+        single = len({v for v, _ in unlabelled}) == 1
+        return _field(value, confidence * (0.95 if single else 0.7))
+    return None
+
+
+def extract_total(lines: list[str]) -> Optional[dict]:
+    for pattern, confidence in TOTAL_LABELS:
+        candidates = []
+        for line in lines:
+            if EXCLUDED_TOTAL_RE.search(line) or not pattern.search(line):
+                continue
+            amounts = _amounts_in(line[pattern.search(line).end():])
+            if amounts:
+                candidates.append(amounts[-1])
+        if candidates:
+            # The last labelled total on a document is normally the final one
+            value = candidates[-1]
+            if len(set(candidates)) > 1 and max(candidates) != value:
+                confidence -= 0.2
+            return _field(value, confidence)
+    return None
+
+
+SUBTOTAL_LABEL_RE = re.compile(r"\b(sub\s*-?\s*total|total\s+(?:excl\.?|before\s+tax|net))\b", re.I)
+
+
+def extract_subtotal(lines: list[str]) -> Optional[dict]:
+    for line in lines:
+        match = SUBTOTAL_LABEL_RE.search(line)
+        if not match:
+            continue
+        amounts = _amounts_in(line[match.end():])
+        if amounts:
+            return _field(amounts[-1], 0.85)
+    return None
+
+
+def amounts_consistent(subtotal: float, tax: Optional[float], total: float, tolerance: float = 0.001) -> bool:
+    """subtotal + tax == total, within rounding (2 cents or `tolerance` relative)."""
+    expected = subtotal + (tax or 0)
+    return abs(expected - total) <= max(0.02, abs(total) * tolerance)
+
+
+def extract_tax(lines: list[str]) -> Optional[dict]:
+    for line in lines:
+        match = TAX_LABEL_RE.search(line)
+        if not match or EXCLUDED_TOTAL_RE.search(line):
+            continue
+        # Skip the rate ("VAT 7.5%", "Sales Tax (8%)") and keep the amount
+        amounts = _amounts_in(line[match.end():], skip_rates=True)
+        if amounts:
+            return _field(amounts[-1], 0.85)
+    return None
+
+
+def extract_currency(text: str) -> Optional[dict]:
+    codes = re.findall(r"\b([A-Z]{3})\b", text)
+    for code in codes:
+        if code in CURRENCY_CODES:
+            return _field(code, 0.9)
+    for symbol, code in CURRENCY_SYMBOLS.items():
+        if symbol in text:
+            return _field(code, 0.7 if symbol == "$" else 0.9)
+    return None
+
+
+def extract_vendor(lines: list[str]) -> Optional[dict]:
+    for line in lines[:40]:
+        match = VENDOR_LABEL_RE.match(line)
+        if match:
+            return _field(match.group(1).strip(), 0.9)
+
+    header = [l for l in lines[:10] if l.strip()]
+    for line in header:
+        if COMPANY_SUFFIX_RE.search(line) and not NOT_VENDOR_RE.search(line):
+            return _field(line.strip(), 0.85)
+    for line in header:
+        if not NOT_VENDOR_RE.search(line) and not _amounts_in(line) and len(line.strip()) > 2:
+            return _field(line.strip(), 0.5)
+    return None
+
+
+def extract_fields(text: str) -> dict:
+    """Return {field: {"value", "confidence"}} for every field the rules could find."""
+    lines = [line.strip() for line in text.splitlines()]
+    lines = [line for line in lines if line]
+
+    fields = {
+        "vendor_name": extract_vendor(lines),
+        "invoice_number": extract_invoice_number(lines),
+        "invoice_date": extract_invoice_date(lines),
+        "total_amount": extract_total(lines),
+        "tax_amount": extract_tax(lines),
+        "currency": extract_currency(text),
+    }
+
+    # Sanity: tax can't exceed the total
+    total, tax = fields["total_amount"], fields["tax_amount"]
+    if total and tax and tax["value"] >= total["value"]:
+        fields["tax_amount"] = None
+
+    return {name: field for name, field in fields.items() if field}
+
+
+def unresolved_fields(fields: dict, threshold: float = RULE_CONFIDENCE_THRESHOLD) -> list[str]:
+    """
+    Fields to send to the LLM. Empty when every required field was found with
+    enough confidence; otherwise the weak required fields plus any weak or
+    missing optional ones (they ride along on the same call for free).
+    """
+    def weak(name):
+        field = fields.get(name)
+        return not field or field["confidence"] < threshold
+
+    required = [name for name in REQUIRED_FIELDS if weak(name)]
+    if not required:
+        return []
+    return required + [name for name in ALL_FIELDS if name not in REQUIRED_FIELDS and weak(name)]
+
+
+def confident_values(fields: dict, threshold: float = RULE_CONFIDENCE_THRESHOLD) -> dict:
+    return {name: f["value"] for name, f in fields.items() if f["confidence"] >= threshold}
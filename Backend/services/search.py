@@ -0,0 +1,182 @@
+# services/search.py
+"""
+Invoice search: hybrid lexical (BM25) + semantic retrieval.
+
+Every search is scoped to one user: the user_id (and the optional vendor,
+date-range and currency filters) are applied inside both indexes, so other
+tenants' chunks never take top-k slots and never leave the index.
+
+Modes (SEARCH_MODE, or per request):
+    hybrid   BM25 (services/lexical_index.py) and vector hits combined with
+             reciprocal rank fusion: score = sum of 1 / (SEARCH_RRF_K + rank)
+    vector   embedding similarity only
+    lexical  BM25 only
+In hybrid mode, queries that look like identifiers (every term has a digit:
+"INV-20931", "DE123456789", "SKU 44-B7") go to BM25 only and skip the
+embedding call entirely.
+
+Chunk hits are collapsed into one result per invoice (best chunk score
+first, with the matching chunks attached). Pagination is by opaque cursor
+over the collapsed invoice list. The indexes have no offset, so page N
+re-queries with a larger top-k, capped at SEARCH_MAX_FETCH chunks.
+
+Env vars:
+    SEARCH_MODE             hybrid | vector | lexical
+    SEARCH_RRF_K            rank fusion constant
+    SEARCH_MAX_K            max invoices per page
+    SEARCH_MAX_FETCH        max chunks pulled from an index for one page
+    SEARCH_CHUNKS_PER_HIT   over-fetch factor (chunks expected per invoice)
+"""
+import asyncio
+import base64
+import json
+import os
+import re
+from datetime import date
+from typing import Optional
+
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+
+from services import metrics, lexical_index
+from services.vectorstore import search_chunks
+
+load_dotenv()
+
+SEARCH_MODES = ("hybrid", "vector", "lexical")
+SEARCH_MODE = os.getenv("SEARCH_MODE", "hybrid")
+SEARCH_RRF_K = int(os.getenv("SEARCH_RRF_K", "60"))
+SEARCH_MAX_K = int(os.getenv("SEARCH_MAX_K", "50"))
+SEARCH_MAX_FETCH = int(os.getenv("SEARCH_MAX_FETCH", "1000"))
+SEARCH_CHUNKS_PER_HIT = int(os.getenv("SEARCH_CHUNKS_PER_HIT", "3"))
+
+IDENTIFIER_TERM_RE = re.compile(r"^(?=.*\d)[\w\-./#]+$")
+
+
+class InvalidCursorError(ValueError):
+    pass
+
+
+def encode_cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"offset": offset}).encode()).decode()
+
+
+def decode_cursor(cursor: Optional[str]) -> int:
+    if not cursor:
+        return 0
+    try:
+        offset = int(json.loads(base64.urlsafe_b64decode(cursor.encode()))["offset"])
+    except Exception:
+        raise InvalidCursorError("Invalid cursor")
+    if offset < 0:
+        raise InvalidCursorError("Invalid cursor")
+    return offset
+
+
+def collapse_hits(hits: list) -> list[dict]:
+    """(Document, score) chunk hits → one result per invoice, best score first."""
+    results = {}
+    for doc, score in hits:
+        meta = doc.metadata
+        invoice_id = meta.get("invoice_id")
+        result = results.get(invoice_id)
+        if result is None:
+            result = results[invoice_id] = {
+                "invoice_id": invoice_id,
+                "score": score,
+                "filename": meta.get("filename"),
+                "vendor_name": meta.get("vendor_name"),
+                "invoice_date": meta.get("invoice_date"),
+                "currency": meta.get("currency"),
+                "chunks": [],
+            }
+        result["score"] = max(result["score"], score)
+        result["chunks"].append({
+            "text": doc.page_content,
+            "chunk_index": meta.get("chunk_index"),
+            "page_start": meta.get("page_start"),
+            "page_end": meta.get("page_end"),
+            "char_start": meta.get("char_start"),
+            "char_end": meta.get("char_end"),
+            "score": score,
+        })
+    return sorted(results.values(), key=lambda r: r["score"], reverse=True)
+
+
+def looks_like_identifier(query: str) -> bool:
+    """Invoice numbers, VAT IDs, SKUs: a few terms, each containing a digit."""
+    terms = query.split()
+    return 0 < len(terms) <= 3 and all(IDENTIFIER_TERM_RE.match(term) for term in terms)
+
+
+def rrf_fuse(*rankings: list) -> list:
+    """Reciprocal rank fusion of (Document, score) rankings, keyed by chunk."""
+    fused, docs = {}, {}
+    for ranking in rankings:
+        for rank, (doc, _) in enumerate(ranking, start=1):
+            key = (doc.metadata.get("invoice_id"), doc.metadata.get("chunk_index"))
+            fused[key] = fused.get(key, 0.0) + 1.0 / (SEARCH_RRF_K + rank)
+            docs.setdefault(key, doc)
+    return sorted(((docs[key], score) for key, score in fused.items()), key=lambda hit: hit[1], reverse=True)
+
+
+def _lexical_hits(query: str, filters: dict, k: int) -> list:
+    return [(Document(page_content=text, metadata=meta), score) for text, meta, score in lexical_index.search(query, k, filters)]
+
+
+def _ranked_chunks(query: str, filters: dict, fetch: int, mode: str) -> tuple[list, bool]:
+    """Chunk hits for `mode`, and whether the indexes ran out before `fetch`."""
+    rankings = []
+    if mode in ("hybrid", "lexical"):
+        rankings.append(_lexical_hits(query, filters, fetch))
+    if mode in ("hybrid", "vector"):
+        rankings.append(search_chunks(query, k=fetch, filters=filters))
+    exhausted = all(len(ranking) < fetch for ranking in rankings)
+    return (rankings[0] if len(rankings) == 1 else rrf_fuse(*rankings)), exhausted
+
+
+def _search_page(query: str, filters: dict, offset: int, k: int, mode: str) -> tuple[list[dict], bool]:
+    # Grow top-k until the page (plus one invoice, to know if there's a next page) is filled
+    wanted = offset + k + 1
+    fetch = min(wanted * SEARCH_CHUNKS_PER_HIT, SEARCH_MAX_FETCH)
+    while True:
+        hits, exhausted = _ranked_chunks(query, filters, fetch, mode)
+        invoices = collapse_hits(hits)
+        if len(invoices) >= wanted or exhausted or fetch >= SEARCH_MAX_FETCH:
+            break
+        fetch = min(fetch * 2, SEARCH_MAX_FETCH)
+    return invoices[offset:offset + k], len(invoices) > offset + k
+
+
+async def search_invoices(
+    query: str,
+    user_id: str,
+    k: int = 10,
+    cursor: Optional[str] = None,
+    vendor: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    currency: Optional[str] = None,
+    mode: Optional[str] = None,
+) -> dict:
+    """
+    One page of a user's invoices matching `query`:
+    {"results": [...], "next_cursor": str | None, "mode": str}.
+    """
+    if not user_id:
+        raise ValueError("user_id is required")
+    mode = mode or SEARCH_MODE
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode: {mode}")
+    if mode == "hybrid" and looks_like_identifier(query):
+        # Exact identifiers: BM25 finds them, and no embedding call is needed
+        mode = "lexical"
+        metrics.increment("searches_embedding_skipped")
+    k = max(1, min(k, SEARCH_MAX_K))
+    offset = decode_cursor(cursor)
+    filters = {"user_id": user_id, "vendor": vendor, "date_from": date_from, "date_to": date_to, "currency": currency}
+
+    # Query embedding + index lookups are blocking: keep them off the event loop
+    page, has_more = await asyncio.to_thread(_search_page, query, filters, offset, k, mode)
+    metrics.increment("searches_total")
+    return {"results": page, "next_cursor": encode_cursor(offset + k) if has_more else None, "mode": mode}
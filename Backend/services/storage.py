@@ -0,0 +1,68 @@
+# services/storage.py
+"""
+Streaming upload helpers: copy an UploadFile to disk in fixed-size chunks,
+enforcing the size limit and computing the SHA-256 in the same pass, so peak
+memory per upload is one chunk regardless of file size.
+"""
+import hashlib
+import os
+import tempfile
+from typing import Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(64 * 1024)))  # 64KB
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", str(10 * 1024 * 1024)))  # 10MB
+
+
+class UploadTooLargeError(Exception):
+    pass
+
+
+class EmptyUploadError(Exception):
+    pass
+
+
+async def stream_upload_to_path(upload, dest_path: str, max_size: int = MAX_UPLOAD_SIZE) -> Tuple[int, str]:
+    """
+    Write `upload` to `dest_path` chunk by chunk.
+    Returns (size_in_bytes, sha256_hex). The partial file is removed on error.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(dest_path, "wb") as f:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadTooLargeError(f"File too large. Maximum size: {max_size / 1024 / 1024}MB")
+                digest.update(chunk)
+                f.write(chunk)
+
+        if size == 0:
+            raise EmptyUploadError("Empty file uploaded")
+    except BaseException:
+        try:
+            os.remove(dest_path)
+        except OSError:
+            pass
+        raise
+
+    return size, digest.hexdigest()
+
+
+async def stream_upload_to_temp(upload, suffix: str = "", max_size: int = MAX_UPLOAD_SIZE) -> Tuple[str, int, str]:
+    """
+    Same as stream_upload_to_path, into a uniquely named temp file
+    (safe when two users upload files with the same name).
+    Returns (temp_path, size_in_bytes, sha256_hex); the caller removes the file.
+    """
+    fd, temp_path = tempfile.mkstemp(prefix="invoice-", suffix=suffix)
+    os.close(fd)
+    size, sha256 = await stream_upload_to_path(upload, temp_path, max_size)
+    return temp_path, size, sha256
@@ -0,0 +1,8 @@
+# services/text_constants.py
+"""
+Markers shared by text extraction and the modules that consume its output
+(chunker, prompt compactor). Kept dependency-free so chunking and indexing
+don't import the OCR stack.
+"""
+
+PAGE_SEPARATOR = "\f"  # same form-feed page break pdfminer used to emit
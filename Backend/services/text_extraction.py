@@ -0,0 +1,40 @@
+# services/text_extraction.py
+"""
+Synchronous text extraction, kept free of LangChain / vector store imports so
+it is cheap to load inside the process-pool workers (see services/workers.py).
+"""
+import io
+
+import pytesseract
+
+from services.image_preprocess import load_image_for_ocr, preprocess_for_ocr, TESSERACT_CONFIG
+from services.ocr_services import extract_pdf_text
+
+
+def _open_source(source):
+    """Paths are passed through untouched (no copy); buffers are wrapped in BytesIO."""
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    return source
+
+
+def extract_text_from_source(source, filename: str) -> str:
+    """
+    Extract raw text from a PDF (PyMuPDF, OCR for scanned pages only)
+    or an image (Tesseract).
+    `source` is a filesystem path or an in-memory bytes buffer.
+    """
+    text = ""
+    if filename.lower().endswith(".pdf"):
+        try:
+            text = extract_pdf_text(source)
+        except Exception as e:
+            print("PDF extraction error:", e)
+    else:
+        try:
+            img = preprocess_for_ocr(load_image_for_ocr(_open_source(source)))
+            text = pytesseract.image_to_string(img, config=TESSERACT_CONFIG)
+        except Exception as e:
+            print("OCR error:", e)
+
+    return text
@@ -0,0 +1,60 @@
+# services/tokenizer.py
+"""
+Token counting with tiktoken, used for LLM rate-limit budgets and chunk sizes.
+
+Callers pass the model the text is for (the router picks one per call); the
+encoding follows it when tiktoken knows it (OpenAI models) and falls back to
+o200k_base otherwise — close enough for budgeting Gemini calls.
+Embedding inputs are counted with EMBEDDING_ENCODING (cl100k_base, used by
+the OpenAI embedding models).
+If the BPE file can't be loaded (offline container), a chars/4 estimate is used.
+"""
+import os
+from functools import lru_cache
+from typing import Optional
+
+import tiktoken
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING")  # force an encoding, e.g. cl100k_base
+EMBEDDING_ENCODING = os.getenv("EMBEDDING_ENCODING", "cl100k_base")
+DEFAULT_ENCODING = "o200k_base"
+
+
+@lru_cache(maxsize=32)
+def get_encoding(model: Optional[str] = None):
+    try:
+        if TOKENIZER_ENCODING:
+            return tiktoken.get_encoding(TOKENIZER_ENCODING)
+        try:
+            return tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding(DEFAULT_ENCODING)
+        except KeyError:
+            return tiktoken.get_encoding(DEFAULT_ENCODING)
+    except Exception as e:
+        print("Tokenizer unavailable, estimating tokens from length:", e)
+        return None
+
+
+@lru_cache(maxsize=1)
+def get_embedding_encoding():
+    try:
+        return tiktoken.get_encoding(EMBEDDING_ENCODING)
+    except Exception as e:
+        print("Embedding tokenizer unavailable, estimating tokens from length:", e)
+        return None
+
+
+def _count(encoding, text: str) -> int:
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    return _count(get_encoding(model), text)
+
+
+def count_embedding_tokens(text: str) -> int:
+    return _count(get_embedding_encoding(), text)
@@ -1,30 +1,276 @@
+# services/vectorstore.py
+"""
+Invoice chunk index. Queried through services/search.py.
+
+VECTOR_BACKEND picks the vector store:
+    chroma  (default) Chroma collection, described below
+    faiss   memory-mapped, quantized FAISS index for millions of chunks
+            (services/faiss_store.py)
+
+The Chroma collection is persistent: it lives in CHROMA_PATH and survives restarts
+and deploys, and is opened once at startup (see app.py lifespan) so the
+first /search doesn't pay for loading it.
+
+A local (CHROMA_PATH) index belongs to one process: Chroma keeps its HNSW
+index in memory, so a second process on the same directory would search a
+stale copy. The owner holds a lock on the directory and any other process
+opening it fails with ChromaInUseError (the app then refuses to start). To
+run several uvicorn workers, or several hosts, run a Chroma server and set
+CHROMA_HOST; every worker then uses the same index. Scripts that touch the
+index (services/reindex.py, services/index_maintenance.py) need the app
+stopped in local mode, or `reindex --queue`.
+
+Every write also updates the local BM25 index (services/lexical_index.py)
+with the same chunks. Rebuild both from invoices.raw_text with
+`python -m services.reindex`.
+
+Env vars:
+    VECTOR_BACKEND      chroma | faiss
+    CHROMA_PATH         on-disk index directory (local mode)
+    CHROMA_HOST         Chroma server host (server mode, overrides CHROMA_PATH)
+    CHROMA_PORT         Chroma server port
+    CHROMA_COLLECTION   collection name
+"""
+import os
+import threading
+from contextlib import nullcontext
+
+from dotenv import load_dotenv
+from filelock import FileLock, Timeout
 from langchain_chroma import Chroma
 from langchain_openai import OpenAIEmbeddings
-from dotenv import load_dotenv
+
+from langchain_core.documents import Document
+
+from services import metrics, lexical_index
+from services.embedding_cache import CachedEmbeddings, EMBEDDING_BATCH_SIZE
 
 load_dotenv()
 
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").lower()
+CHROMA_PATH = os.getenv("CHROMA_PATH", "vector_store")
+CHROMA_HOST = os.getenv("CHROMA_HOST")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8000"))
+CHROMA_COLLECTION = os.getenv("CHROMA_COLLECTION", "invoices")
+
+if VECTOR_BACKEND == "faiss":
+    from services import faiss_store
 
-# CHROMA_PATH = "vector_store"
-embeddings = OpenAIEmbeddings()
+UPSERT_BATCH_SIZE = 1000  # well under Chroma's max batch size
 
-vectorstore = Chroma(
-    collection_name="invoices",
-    embedding_function=embeddings,
-    # persist_directory=CHROMA_PATH
-)
+_vectorstore = None
+_collection = None
+_embeddings = None
+_owner_lock = None
+_open_lock = threading.Lock()
+_local_write_lock = threading.Lock()
 
-def add_invoice_chunks(invoice_id: str, chunks: list[str], metadata_base: dict):
-    ids = [f"{invoice_id}::{i}" for i in range(len(chunks))]
-    metadatas = [{**metadata_base, "chunk_index": i} for i in range(len(chunks))]
-    
-    vectorstore.add_texts(texts=chunks, metadatas=metadatas, ids=ids)
 
-    # persist to disk
+class ChromaInUseError(RuntimeError):
+    """The local Chroma directory is already open in another process."""
+
+
+def _claim_chroma_path() -> None:
+    """Become the only process using CHROMA_PATH (held until the process exits)."""
+    global _owner_lock
+    if _owner_lock is not None:
+        return
+    os.makedirs(CHROMA_PATH, exist_ok=True)
+    lock = FileLock(os.path.join(CHROMA_PATH, ".owner.lock"))
     try:
-        vectorstore.persist()
-    except:
-        pass
+        lock.acquire(timeout=0)
+    except Timeout:
+        raise ChromaInUseError(
+            f"Chroma index {CHROMA_PATH} is open in another process; "
+            "set CHROMA_HOST to share one index between several workers"
+        ) from None
+    _owner_lock = lock
+
+
+def get_embeddings() -> CachedEmbeddings:
+    global _embeddings
+    if _embeddings is None:
+        with _open_lock:
+            if _embeddings is None:
+                # Cache + batching in front of the embedding API (see services/embedding_cache.py)
+                _embeddings = CachedEmbeddings(OpenAIEmbeddings(chunk_size=EMBEDDING_BATCH_SIZE))
+    return _embeddings
+
+
+def get_vectorstore() -> Chroma:
+    global _vectorstore, _collection
+    if _vectorstore is None:
+        embeddings = get_embeddings()
+        with _open_lock:
+            if _vectorstore is None:
+                import chromadb
+
+                if CHROMA_HOST:
+                    client = chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT)
+                else:
+                    _claim_chroma_path()
+                    client = chromadb.PersistentClient(path=CHROMA_PATH)
+                _vectorstore = Chroma(collection_name=CHROMA_COLLECTION, embedding_function=embeddings, client=client)
+                # Writes go to the collection directly, with embeddings we already computed
+                _collection = client.get_or_create_collection(CHROMA_COLLECTION, embedding_function=None)
+    return _vectorstore
+
+
+def get_collection():
+    """The chromadb collection behind the vector store (writes, counts)."""
+    get_vectorstore()
+    return _collection
+
+
+def warm_vectorstore() -> int:
+    """Open the index (loads it from disk) and return the number of stored chunks."""
+    if VECTOR_BACKEND == "faiss":
+        return faiss_store.warm()
+    return get_collection().count()
+
+
+def write_lock():
+    """Serialize local index writes (across worker processes for FAISS, across threads for Chroma)."""
+    if VECTOR_BACKEND == "faiss":
+        faiss_store.FAISS_PATH.mkdir(parents=True, exist_ok=True)
+        return FileLock(str(faiss_store.FAISS_PATH / ".write.lock"))
+    if CHROMA_HOST:
+        return nullcontext()
+    return _local_write_lock  # one process owns a local Chroma index
+
+
+def index_invoices(items: list[tuple[str, list[str], dict]]) -> dict:
+    """
+    Index several invoices in one write: `items` is (invoice_id, chunks,
+    metadata_base), chunks being strings or chunker.Chunk (whose page and
+    offset metadata is stored with it). An invoice's previous chunks are
+    replaced, so indexing the same invoice twice never leaves stale chunks behind.
+
+    Returns {"chunks", "cache_hits", "api_requests", "api_requests_saved",
+    "per_invoice": {invoice_id: {"chunks", "cached"}}}; requests saved are
+    counted against one uncached embedding call per invoice.
+    """
+    texts, metadatas, ids, owners = [], [], [], []
+    for invoice_id, chunks, metadata_base in items:
+        base = {k: v for k, v in metadata_base.items() if v is not None}  # Chroma rejects None values
+        for i, chunk in enumerate(chunks):
+            text, extra = (chunk, {}) if isinstance(chunk, str) else (chunk.text, chunk.metadata)
+            texts.append(text)
+            metadatas.append({**base, **extra, "invoice_id": invoice_id, "chunk_index": i})
+            ids.append(f"{invoice_id}::{i}")
+            owners.append(invoice_id)
+
+    per_invoice = {invoice_id: {"chunks": len(chunks), "cached": 0} for invoice_id, chunks, _ in items}
+    summary = {"chunks": len(texts), "cache_hits": 0, "api_requests": 0, "api_requests_saved": 0, "per_invoice": per_invoice}
+    if not items:
+        return summary
+
+    # Embed before taking the lock: other workers shouldn't wait on the embedding API
+    embeddings, stats = [], {"cached": [], "hits": 0, "api_requests": 0}
+    if texts:
+        embeddings, stats = get_embeddings().embed_with_stats(texts)
+    for owner, cached in zip(owners, stats["cached"]):
+        per_invoice[owner]["cached"] += cached
+
+    baseline = sum(1 for _, chunks, _ in items if chunks)
+    summary.update(
+        cache_hits=stats["hits"],
+        api_requests=stats["api_requests"],
+        api_requests_saved=max(baseline - stats["api_requests"], 0),
+    )
+    metrics.increment("embedding_api_requests_saved", summary["api_requests_saved"])
+
+    invoice_ids = [invoice_id for invoice_id, _, _ in items]
+    with write_lock():
+        if VECTOR_BACKEND == "faiss":
+            faiss_store.replace_chunks(invoice_ids, ids, texts, metadatas, embeddings)
+        else:
+            collection = get_collection()
+            existing = collection.get(where={"invoice_id": {"$in": invoice_ids}}, include=[])["ids"]
+            stale = set(existing) - set(ids)
+            if stale:
+                collection.delete(ids=list(stale))
+            for start in range(0, len(texts), UPSERT_BATCH_SIZE):
+                end = start + UPSERT_BATCH_SIZE
+                collection.upsert(
+                    ids=ids[start:end], embeddings=embeddings[start:end], metadatas=metadatas[start:end], documents=texts[start:end]
+                )
+        # Same chunks in the BM25 index (services/lexical_index.py)
+        lexical_index.replace_chunks(invoice_ids, ids, texts, metadatas)
+    if VECTOR_BACKEND == "faiss":
+        # Fold a large delta into the trained base index (outside the write lock, which compact takes)
+        faiss_store.compact_if_needed()
+    return summary
+
+
+def add_invoice_chunks(invoice_id: str, chunks: list[str], metadata_base: dict) -> dict:
+    return index_invoices([(invoice_id, chunks, metadata_base)])
+
+
+def delete_invoice_vectors(invoice_ids: list[str]) -> None:
+    """Remove invoices' chunks from the vector and BM25 indexes (deleted invoices)."""
+    if not invoice_ids:
+        return
+    with write_lock():
+        if VECTOR_BACKEND == "faiss":
+            # Rows go now; their base vectors are tombstones until the next compaction
+            faiss_store.delete_invoices(invoice_ids)
+        else:
+            get_collection().delete(where={"invoice_id": {"$in": invoice_ids}})
+        lexical_index.delete_chunks(invoice_ids)
+
+
+def indexed_chunk_counts() -> dict:
+    """{invoice_id: number of chunks} in the vector store (consistency checks)."""
+    if VECTOR_BACKEND == "faiss":
+        return faiss_store.chunk_counts()
+    counts = {}
+    collection = get_collection()
+    offset = 0
+    while True:
+        page = collection.get(include=["metadatas"], limit=UPSERT_BATCH_SIZE * 10, offset=offset)
+        if not page["ids"]:
+            break
+        for meta in page["metadatas"]:
+            invoice_id = (meta or {}).get("invoice_id")
+            counts[invoice_id] = counts.get(invoice_id, 0) + 1
+        offset += len(page["ids"])
+    return counts
+
+
+def reset_vectorstore() -> None:
+    """Drop every chunk (used before a full rebuild)."""
+    global _vectorstore, _collection
+    with write_lock():
+        if VECTOR_BACKEND == "faiss":
+            faiss_store.clear()
+        else:
+            get_vectorstore().delete_collection()
+            _vectorstore = _collection = None
+        lexical_index.clear_lexical_index()
+
+
+def chroma_filter(filters: dict) -> dict:
+    """Chroma `where` for the search filters (fields written by indexer.invoice_index_item)."""
+    conditions = [{"user_id": str(filters["user_id"])}]
+    if filters.get("vendor"):
+        conditions.append({"vendor": filters["vendor"].strip().lower()})
+    if filters.get("date_from"):
+        conditions.append({"invoice_day": {"$gte": int(filters["date_from"].strftime("%Y%m%d"))}})
+    if filters.get("date_to"):
+        conditions.append({"invoice_day": {"$lte": int(filters["date_to"].strftime("%Y%m%d"))}})
+    if filters.get("currency"):
+        conditions.append({"currency": filters["currency"].strip().upper()})
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
 
-def search_invoice_text(query: str, k=5):
-    return vectorstore.similarity_search(query, k=k)
+def search_chunks(query: str, k: int, filters: dict) -> list:
+    """
+    Top-k (Document, relevance score) pairs, best first. `filters` (user_id
+    and optional vendor, date_from, date_to, currency) are applied inside
+    the index, before the top-k cut.
+    """
+    if VECTOR_BACKEND == "faiss":
+        vector = get_embeddings().embed_query(query)
+        return [(Document(page_content=text, metadata=meta), score) for text, meta, score in faiss_store.search(vector, k, filters)]
+    return get_vectorstore().similarity_search_with_relevance_scores(query, k=k, filter=chroma_filter(filters))
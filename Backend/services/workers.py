@@ -0,0 +1,56 @@
+# services/workers.py
+"""
+Shared executors so blocking work never runs on the asyncio event loop.
+
+- CPU-bound text extraction (PDF parsing, Tesseract) goes to a process pool.
+- LLM calls stay on the loop (they are awaited via `ainvoke`); their
+  concurrency and rate limits live in services/llm_scheduler.py.
+
+Sizing is controlled by env vars:
+    TEXT_EXTRACTION_WORKERS  processes in the pool (0 = use a thread instead)
+"""
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TEXT_EXTRACTION_WORKERS = int(os.getenv("TEXT_EXTRACTION_WORKERS", str(min(4, os.cpu_count() or 1))))
+TEXT_EXTRACTION_START_METHOD = os.getenv("TEXT_EXTRACTION_START_METHOD", "spawn")
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(
+            max_workers=TEXT_EXTRACTION_WORKERS,
+            mp_context=multiprocessing.get_context(TEXT_EXTRACTION_START_METHOD),
+        )
+    return _process_pool
+
+
+async def run_cpu_bound(fn, *args, **kwargs):
+    """
+    Run a picklable, module-level function in the process pool.
+    Falls back to a thread when the pool is disabled (TEXT_EXTRACTION_WORKERS=0).
+    """
+    call = partial(fn, *args, **kwargs)
+    if TEXT_EXTRACTION_WORKERS <= 0:
+        return await asyncio.to_thread(call)
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_process_pool(), call)
+
+
+def shutdown_workers() -> None:
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
@@ -0,0 +1,54 @@
+# tests/conftest.py
+"""
+Test settings: a throwaway SQLite database and cache/index files, the mock
+LLM provider and no API keys. The env vars are set before any app module is
+imported, since the modules read them at import time.
+"""
+import os
+import tempfile
+
+_TMP_DIR = tempfile.mkdtemp(prefix="invoice-analyzer-tests-")
+
+os.environ.update({
+    "DATABASE_URL": f"sqlite+aiosqlite:///{_TMP_DIR}/test.db",
+    "LLM_PROVIDER": "mock",
+    "LLM_ROUTER_PROVIDERS": "mock:rules",
+    "OPENAI_API_KEY": "test",
+    "EXTRACTION_CACHE_PATH": f"{_TMP_DIR}/extraction_cache.db",
+    "EMBEDDING_CACHE_PATH": f"{_TMP_DIR}/embedding_cache.db",
+    "LAYOUT_TEMPLATES_PATH": f"{_TMP_DIR}/layout_templates.db",
+    "CHROMA_PATH": f"{_TMP_DIR}/vector_store",
+    "FAISS_PATH": f"{_TMP_DIR}/faiss",
+    "LEXICAL_INDEX_PATH": f"{_TMP_DIR}/lexical.db",
+    "INDEXER_WORKERS": "0",
+    "ANALYSIS_JOB_WORKERS": "0",
+})
+
+import pytest
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def db_tables(anyio_backend):
+    from database.db import engine, Base
+    import database.models  # noqa: F401  (registers the tables)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await engine.dispose()
+
+
+@pytest.fixture
+async def llm_scheduler(anyio_backend):
+    """The shared LLM scheduler is bound to one event loop: drop it after each test."""
+    from services.llm_scheduler import get_llm_scheduler, stop_llm_scheduler
+
+    yield get_llm_scheduler()
+    await stop_llm_scheduler()
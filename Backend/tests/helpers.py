@@ -0,0 +1,23 @@
+# tests/helpers.py
+"""Module-level stand-ins that can be pickled into the text-extraction process pool."""
+import time
+
+EXTRACTION_SECONDS = 1.5
+
+INVOICE_TEXT = """ACME Supplies Ltd
+Invoice No: INV-1001
+Date: 2025-03-14
+Subtotal: $100.00
+Sales Tax (8%): $8.00
+Total: $108.00
+"""
+
+
+def slow_text_extraction(source, filename: str) -> str:
+    """Stands in for PDF parsing / OCR: keeps its worker process busy, then returns text."""
+    time.sleep(EXTRACTION_SECONDS)
+    return INVOICE_TEXT
+
+
+def text_extraction(source, filename: str) -> str:
+    return INVOICE_TEXT
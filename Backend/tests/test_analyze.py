@@ -0,0 +1,27 @@
+# tests/test_analyze.py
+"""file_id lookups on the analyze endpoints."""
+import uuid
+
+import httpx
+import pytest
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("path", ["/api/analyze", "/api/analyze/jobs"])
+@pytest.mark.parametrize("file_id", ["*", "../*", "not-a-uuid"])
+async def test_invalid_file_id_is_rejected(db_tables, path, file_id):
+    from app import app
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.post(path, data={"file_id": file_id})
+    assert response.status_code == 400, response.text
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("path", ["/api/analyze", "/api/analyze/jobs"])
+async def test_unknown_file_id_is_not_found(db_tables, path):
+    from app import app
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.post(path, data={"file_id": str(uuid.uuid4())})
+    assert response.status_code == 404, response.text
@@ -0,0 +1,100 @@
+# tests/test_batch_ingest.py
+"""Batch ingestion: bounded sub-batch inserts, per-row fallback and the file limit."""
+import io
+import zipfile
+
+import pytest
+
+from tests.helpers import INVOICE_TEXT
+
+
+async def _fake_extract(source, filename, **kwargs):
+    return {"text": INVOICE_TEXT, "structured": {"vendor_name": filename, "total_amount": 108.0}, "cached": False}
+
+
+def _zip(names: list[str]) -> io.BytesIO:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        for name in names:
+            zf.writestr(name, b"%PDF-1.4 not a real pdf")
+    buffer.seek(0)
+    return buffer
+
+
+@pytest.mark.anyio
+async def test_inserts_in_sub_batches_and_a_bad_row_only_fails_itself(db_tables, monkeypatch):
+    from database.db import async_session
+    from services import batch_ingest, db_services
+
+    monkeypatch.setattr(batch_ingest, "extract_invoice_data", _fake_extract)
+    monkeypatch.setattr(batch_ingest, "BATCH_INSERT_SIZE", 10)
+
+    insert_sizes = []
+    save_invoices_bulk = db_services.save_invoices_bulk
+
+    async def flaky_save(db, invoices):
+        insert_sizes.append(len(invoices))
+        if any(invoice.vendor_name == "bad.pdf" for invoice in invoices):
+            raise ValueError("constraint violated")
+        return await save_invoices_bulk(db, invoices)
+
+    monkeypatch.setattr(batch_ingest, "save_invoices_bulk", flaky_save)
+
+    names = [f"invoice-{i}.pdf" for i in range(24)] + ["bad.pdf", "notes.txt"]
+    async with async_session() as db:
+        summary = await batch_ingest.ingest_batch(db, batch_ingest.iter_zip_entries(_zip(names)))
+
+    statuses = {r["filename"]: r["status"] for r in summary["results"]}
+    assert [r["filename"] for r in summary["results"]] == names
+    assert summary["succeeded"] == 24
+    assert statuses["bad.pdf"] == "failed"
+    assert statuses["notes.txt"] == "failed"
+    assert max(insert_sizes) <= 10
+
+
+@pytest.mark.anyio
+async def test_zip_members_over_the_limit_are_not_extracted(db_tables, monkeypatch):
+    from database.db import async_session
+    from services import batch_ingest
+
+    monkeypatch.setattr(batch_ingest, "extract_invoice_data", _fake_extract)
+    monkeypatch.setattr(batch_ingest, "BATCH_MAX_FILES", 3)
+    extracted = []
+    extract_member = batch_ingest._extract_zip_member
+
+    def counting_extract(zf, info):
+        extracted.append(info.filename)
+        return extract_member(zf, info)
+
+    monkeypatch.setattr(batch_ingest, "_extract_zip_member", counting_extract)
+
+    async with async_session() as db:
+        summary = await batch_ingest.ingest_batch(db, batch_ingest.iter_zip_entries(_zip([f"{i}.pdf" for i in range(8)])))
+
+    assert len(extracted) == 3
+    assert (summary["succeeded"], summary["failed"], summary["skipped"]) == (3, 0, 5)
+    assert [r["status"] for r in summary["results"]].count("skipped") == 5
+
+
+@pytest.mark.anyio
+async def test_oversized_and_empty_uploads_fail_only_their_entry(db_tables, monkeypatch):
+    from starlette.datastructures import UploadFile
+
+    from database.db import async_session
+    from services import batch_ingest
+
+    monkeypatch.setattr(batch_ingest, "extract_invoice_data", _fake_extract)
+    monkeypatch.setattr(batch_ingest, "BATCH_MAX_ENTRY_SIZE", 1024)
+    files = [
+        UploadFile(io.BytesIO(b"%PDF-1.4 small"), filename="ok.pdf"),
+        UploadFile(io.BytesIO(b"x" * 4096), filename="huge.pdf"),
+        UploadFile(io.BytesIO(b""), filename="empty.pdf"),
+    ]
+
+    async with async_session() as db:
+        summary = await batch_ingest.ingest_batch(db, batch_ingest.iter_upload_entries(files))
+
+    statuses = {r["filename"]: (r["status"], r.get("error", "")) for r in summary["results"]}
+    assert statuses["ok.pdf"][0] == "succeeded"
+    assert statuses["huge.pdf"][0] == "failed" and "too large" in statuses["huge.pdf"][1]
+    assert statuses["empty.pdf"] == ("failed", "Empty file uploaded")
@@ -0,0 +1,60 @@
+# tests/test_batch_llm.py
+"""Packed LLM requests (services/batch_llm.py) against the mock provider."""
+import asyncio
+
+import pytest
+
+from services import batch_llm, metrics
+from services.batch_llm import LLMBatcher
+from services.llm_provider import get_llm_provider
+
+pytestmark = pytest.mark.usefixtures("llm_scheduler")
+
+
+def invoice(n: int) -> str:
+    return f"ACME Supplies Ltd\nInvoice No: INV-{n:04d}\nDate: 2025-03-14\nTotal: ${100 + n}.00\n"
+
+
+@pytest.mark.anyio
+async def test_concurrent_documents_share_one_request():
+    batcher = LLMBatcher()
+    requests_before = metrics.get("llm_batch_requests")
+
+    results = await asyncio.gather(*(batcher.extract(invoice(n)) for n in range(3)))
+
+    assert metrics.get("llm_batch_requests") == requests_before + 1
+    assert [r.invoice_number for r in results] == ["INV-0000", "INV-0001", "INV-0002"]
+    assert [r.total_amount for r in results] == [100.0, 101.0, 102.0]
+    await batcher.close()
+
+
+@pytest.mark.anyio
+async def test_failed_pack_is_retried_document_by_document(monkeypatch):
+    def failing_chain():
+        async def chain(texts):
+            raise RuntimeError("pack rejected")
+        return chain
+
+    monkeypatch.setattr(get_llm_provider(), "get_batch_extraction_chain", failing_chain)
+    batcher = LLMBatcher()
+    retries_before = metrics.get("llm_batch_retries")
+
+    results = await asyncio.gather(*(batcher.extract(invoice(n)) for n in range(2)))
+
+    assert [r.invoice_number for r in results] == ["INV-0000", "INV-0001"]
+    assert metrics.get("llm_batch_retries") == retries_before + 2
+    await batcher.close()
+
+
+@pytest.mark.anyio
+async def test_close_waits_for_in_flight_packs(monkeypatch):
+    monkeypatch.setattr(batch_llm, "BATCH_LLM_WINDOW", 60)  # only close() sends the pack
+    batcher = LLMBatcher()
+
+    waiting = [asyncio.create_task(batcher.extract(invoice(n))) for n in range(2)]
+    await asyncio.sleep(0)
+    assert not any(task.done() for task in waiting)
+
+    await batcher.close()
+    assert not batcher._tasks
+    assert [task.result().invoice_number for task in waiting] == ["INV-0000", "INV-0001"]
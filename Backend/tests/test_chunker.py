@@ -0,0 +1,42 @@
+# tests/test_chunker.py
+"""Token-aware chunking: no chunk over the limit, offsets pointing back into the source."""
+import pytest
+
+from services.chunker import iter_chunks
+from services.tokenizer import count_embedding_tokens
+
+
+def assert_well_formed(text: str, chunks: list, max_tokens: int) -> None:
+    assert chunks
+    for chunk in chunks:
+        assert chunk.tokens <= max_tokens
+        assert count_embedding_tokens(chunk.text) <= max_tokens
+        # Lines are joined with single newlines: the span starts and ends with the chunk's lines
+        lines = chunk.text.split("\n")
+        source = text[chunk.char_start:chunk.char_end]
+        assert source.startswith(lines[0]) and source.endswith(lines[-1])
+        assert all(line in source for line in lines)
+
+
+@pytest.mark.parametrize("text", [
+    "x" * 10_000,  # one word, no whitespace at all
+    "Attachment: " + "QUJD" * 3000 + " end of attachment",  # base64 blob inside a sentence
+    "word " * 3000,  # one long line of short words
+], ids=["one-word", "base64-in-sentence", "many-words"])
+def test_long_lines_are_split_within_the_limit(text):
+    chunks = list(iter_chunks(text, max_tokens=512, overlap_tokens=64))
+    assert_well_formed(text, chunks, 512)
+    # Nothing is lost: every non-blank character is in some chunk
+    covered = set()
+    for chunk in chunks:
+        covered.update(range(chunk.char_start, chunk.char_end))
+    assert all(i in covered for i, char in enumerate(text) if not char.isspace())
+
+
+def test_invoice_keeps_rows_whole():
+    rows = [f"SKU-{i:05d}  freight handling   {i % 7 + 1} x 12.50   {(i % 7 + 1) * 12.5:.2f}" for i in range(200)]
+    text = "ACME Supplies Ltd\nInvoice Number: INV-1001\n\n" + "\n".join(rows) + "\n\nSubtotal: 100.00\nTotal: 108.00"
+    chunks = list(iter_chunks(text, max_tokens=256, overlap_tokens=32))
+    assert_well_formed(text, chunks, 256)
+    for chunk in chunks:
+        assert all(line in rows or not line.startswith("SKU-") for line in chunk.text.splitlines())
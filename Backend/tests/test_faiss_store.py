@@ -0,0 +1,96 @@
+# tests/test_faiss_store.py
+"""FAISS backend: cached tenant selectors stay correct across writes; a large delta compacts itself."""
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+
+from services import faiss_store, vectorstore
+
+DIM = 8
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(faiss_store, "FAISS_PATH", tmp_path / "faiss")
+    monkeypatch.setattr(faiss_store, "_conn", None)
+    monkeypatch.setattr(faiss_store, "_base", {"generation": None, "index": None})
+    monkeypatch.setattr(faiss_store, "_delta", {"generation": None, "last_id": 0, "ids": np.empty(0, dtype=np.int64), "vectors": None})
+    monkeypatch.setattr(faiss_store, "_selectors", OrderedDict())
+    monkeypatch.setattr(faiss_store, "FAISS_EXACT_SEARCH_MAX", 0)  # always go through the selectors
+    yield faiss_store
+    faiss_store._conn.close()
+
+
+def write(invoice_id: str, user_id: str, vectors: np.ndarray) -> None:
+    ids = [f"{invoice_id}::{i}" for i in range(len(vectors))]
+    metadatas = [{"invoice_id": invoice_id, "user_id": user_id, "chunk_index": i} for i in range(len(vectors))]
+    faiss_store.replace_chunks([invoice_id], ids, [f"text {chunk_id}" for chunk_id in ids], metadatas, vectors)
+
+
+def invoices_found(query: np.ndarray, user_id: str, k: int = 10) -> set:
+    return {meta["invoice_id"] for _, meta, _ in faiss_store.search(query, k, {"user_id": user_id})}
+
+
+def test_cached_selectors_follow_writes(store):
+    rng = np.random.default_rng(0)
+    write("a1", "alice", rng.normal(size=(5, DIM)))
+    write("b1", "bob", rng.normal(size=(5, DIM)))
+    store.compact()
+    write("a2", "alice", rng.normal(size=(5, DIM)))  # delta
+    query = rng.normal(size=DIM)
+
+    assert invoices_found(query, "alice") == {"a1", "a2"}
+    assert invoices_found(query, "bob") == {"b1"}
+    bob_entry = next(entry for key, entry in store._selectors.items() if "bob" in key[1])
+
+    # Alice's chunks change: her cached ids are rebuilt, Bob's entry is reused as is
+    store.delete_invoices(["a1"])
+    write("a3", "alice", rng.normal(size=(2, DIM)))
+    assert invoices_found(query, "alice") == {"a2", "a3"}
+    assert invoices_found(query, "bob") == {"b1"}
+    assert next(entry for key, entry in store._selectors.items() if "bob" in key[1]) is bob_entry
+
+
+def test_worker_holding_the_old_base_reopens_it_after_clear(store, monkeypatch):
+    rng = np.random.default_rng(1)
+    write("a1", "alice", rng.normal(size=(5, DIM)))
+    store.compact()
+    query = rng.normal(size=DIM)
+    assert invoices_found(query, "alice") == {"a1"}
+    # What another worker still holds after the reset below
+    old_generation = store._base["generation"]
+    stale_base, stale_delta = dict(store._base), dict(store._delta)
+
+    store.clear()  # e.g. reindex --reset
+    write("a2", "alice", rng.normal(size=(5, DIM)))
+    store.compact()
+
+    monkeypatch.setattr(faiss_store, "_base", dict(stale_base))
+    monkeypatch.setattr(faiss_store, "_delta", dict(stale_delta))
+    monkeypatch.setattr(faiss_store, "_selectors", OrderedDict())
+    assert invoices_found(query, "alice") == {"a2"}
+    assert faiss_store._base["generation"] == store.stats()["generation"] > old_generation
+
+
+def test_large_delta_is_compacted_after_the_write(store, monkeypatch):
+    monkeypatch.setattr(faiss_store, "FAISS_COMPACT_DELTA", 20)
+    monkeypatch.setattr(vectorstore, "VECTOR_BACKEND", "faiss")
+    monkeypatch.setattr(vectorstore, "faiss_store", faiss_store, raising=False)
+    monkeypatch.setattr(vectorstore.lexical_index, "replace_chunks", lambda *args: None)
+
+    class Embeddings:
+        def embed_with_stats(self, texts):
+            vectors = np.random.default_rng(len(texts)).normal(size=(len(texts), DIM)).tolist()
+            return vectors, {"cached": [0] * len(texts), "hits": 0, "api_requests": 1}
+
+    monkeypatch.setattr(vectorstore, "get_embeddings", lambda: Embeddings())
+    meta = {"user_id": "alice"}
+
+    vectorstore.index_invoices([("i1", [f"chunk {i}" for i in range(15)], meta)])
+    assert store.stats()["delta"] == 15 and store.stats()["generation"] == 0
+
+    vectorstore.index_invoices([("i2", [f"chunk {i}" for i in range(10)], meta)])
+    stats = store.stats()
+    assert stats["delta"] == 0 and stats["generation"] == 1 and stats["vectors"] == 25
+    assert invoices_found(np.ones(DIM), "alice") == {"i1", "i2"}
@@ -0,0 +1,23 @@
+# tests/test_image_preprocess.py
+"""Receipt photo preprocessing before OCR."""
+import pytest
+from PIL import Image, ImageDraw, ImageFont
+
+from services.image_preprocess import estimate_skew
+
+
+def _receipt(lines: int = 20) -> Image.Image:
+    img = Image.new("L", (1200, 1800), 250)
+    draw = ImageDraw.Draw(img)
+    font = ImageFont.load_default(size=50)
+    for i in range(lines):
+        draw.text((80, 80 + 80 * i), f"ITEM {i:02d}    FREIGHT    12.34", fill=20, font=font)
+    return img
+
+
+@pytest.mark.parametrize("angle", [-3.0, 2.5])
+@pytest.mark.parametrize("background", [250, 60])
+def test_skew_is_found_on_a_dark_table(angle, background):
+    # A rotated receipt photographed on a darker table leaves dark corners after cropping
+    photo = _receipt().rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=background)
+    assert estimate_skew(photo) == pytest.approx(-angle)
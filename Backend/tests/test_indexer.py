@@ -0,0 +1,50 @@
+# tests/test_indexer.py
+"""Indexer leases: batches claimed by a dead indexer go back to the queue."""
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import select, update
+
+
+async def _claimed_invoice(db, lease_age: float, attempts: int = 1):
+    from database.models import Invoice
+    from database.schemas import InvoiceCreate
+    from services import indexer
+    from services.db_services import save_invoice
+
+    saved = await save_invoice(db, InvoiceCreate(
+        filename="a.pdf", vendor_name=None, invoice_number=None, invoice_date=None,
+        total_amount=None, tax_amount=None, currency=None, raw_text="Invoice INV-1 Total 10.00",
+    ))
+    await db.execute(
+        update(Invoice)
+        .where(Invoice.id == saved["id"])
+        .values(index_status="indexing", index_attempts=attempts, index_started_at=indexer._now() - timedelta(seconds=lease_age))
+    )
+    await db.commit()
+    return saved["id"]
+
+
+async def _status(invoice_id) -> str:
+    from database.db import async_session
+    from database.models import Invoice
+
+    async with async_session() as db:
+        return await db.scalar(select(Invoice.index_status).where(Invoice.id == invoice_id))
+
+
+@pytest.mark.anyio
+async def test_expired_leases_are_requeued_or_failed(db_tables):
+    from database.db import async_session
+    from services import indexer
+
+    async with async_session() as db:
+        alive = await _claimed_invoice(db, lease_age=1)
+        lost = await _claimed_invoice(db, lease_age=indexer.INDEXER_LEASE_SECONDS + 5)
+        poison = await _claimed_invoice(db, lease_age=indexer.INDEXER_LEASE_SECONDS + 5, attempts=indexer.INDEXER_MAX_ATTEMPTS)
+
+    await indexer._requeue_expired()
+
+    assert await _status(alive) == "indexing"
+    assert await _status(lost) == "pending"
+    assert await _status(poison) == "failed"
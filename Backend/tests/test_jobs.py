@@ -0,0 +1,57 @@
+# tests/test_jobs.py
+"""Analysis job leases: work left 'running' by a dead worker goes back to the queue."""
+import asyncio
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import update
+
+
+async def _running_job(db, heartbeat_age: float, attempts: int = 1):
+    from database.models import AnalysisJob
+    from services import jobs
+
+    job = await jobs.create_job(db, "/tmp/missing.pdf", "missing.pdf")
+    await db.execute(
+        update(AnalysisJob)
+        .where(AnalysisJob.id == job.id)
+        .values(status="running", attempts=attempts, heartbeat_at=jobs._now() - timedelta(seconds=heartbeat_age))
+    )
+    await db.commit()
+    return job.id
+
+
+@pytest.mark.anyio
+async def test_expired_leases_are_requeued_or_failed(db_tables):
+    from database.db import async_session
+    from services import jobs
+
+    async with async_session() as db:
+        alive = await _running_job(db, heartbeat_age=1)
+        lost = await _running_job(db, heartbeat_age=jobs.JOB_LEASE_SECONDS + 5)
+        poison = await _running_job(db, heartbeat_age=jobs.JOB_LEASE_SECONDS + 5, attempts=jobs.JOB_MAX_ATTEMPTS)
+
+    await jobs._requeue_expired_jobs()
+
+    async with async_session() as db:
+        assert (await jobs.get_job(db, alive))["status"] == "running"
+        assert (await jobs.get_job(db, lost))["status"] == "queued"
+        assert (await jobs.get_job(db, poison))["status"] == "failed"
+
+
+@pytest.mark.anyio
+async def test_heartbeat_renews_the_lease(db_tables, monkeypatch):
+    from database.db import async_session
+    from services import jobs
+
+    monkeypatch.setattr(jobs, "JOB_HEARTBEAT_INTERVAL", 0.05)
+    async with async_session() as db:
+        job_id = await _running_job(db, heartbeat_age=jobs.JOB_LEASE_SECONDS + 5)
+
+    heartbeat = asyncio.create_task(jobs._heartbeat(job_id))
+    await asyncio.sleep(0.3)
+    heartbeat.cancel()
+    await jobs._requeue_expired_jobs()
+
+    async with async_session() as db:
+        assert (await jobs.get_job(db, job_id))["status"] == "running"
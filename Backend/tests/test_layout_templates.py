@@ -0,0 +1,74 @@
+# tests/test_layout_templates.py
+"""Vendor layout templates: learned after N agreeing extractions, applied to the same layout, relearned once they stop validating."""
+import pytest
+
+from services import layout_templates
+
+FINGERPRINT = "acme-layout"
+
+
+@pytest.fixture
+def templates(tmp_path, monkeypatch):
+    monkeypatch.setattr(layout_templates, "TEMPLATES_PATH", tmp_path / "layout_templates.db")
+    monkeypatch.setattr(layout_templates, "_conn", None)
+    monkeypatch.setattr(layout_templates, "TEMPLATES_ENABLED", True)
+    monkeypatch.setattr(layout_templates, "TEMPLATE_MIN_SAMPLES", 3)
+    yield layout_templates
+    layout_templates._conn.close()
+
+
+def invoice(n: int, totals_block: str = None) -> tuple[dict, dict, str]:
+    """(layout, structured values, text) of the n-th invoice from the same vendor layout."""
+    subtotal, tax = 100 + 10 * n, 10 + n
+    values = {
+        "vendor_name": "ACME Supplies Ltd",
+        "invoice_number": f"INV-100{n}",
+        "invoice_date": f"2025-04-0{n}",
+        "total_amount": float(subtotal + tax),
+        "tax_amount": float(tax),
+    }
+    totals_block = totals_block or f"Subtotal: ${subtotal:.2f}\nVAT: ${tax:.2f}\nTotal: ${subtotal + tax:.2f}"
+    blocks = [
+        {"text": "ACME Supplies Ltd", "bbox": (0.05, 0.03, 0.4, 0.06)},
+        {"text": f"Invoice No: {values['invoice_number']}\nDate: {values['invoice_date']}", "bbox": (0.6, 0.05, 0.95, 0.1)},
+        {"text": totals_block, "bbox": (0.6, 0.7, 0.95, 0.8)},
+    ]
+    layout = {"fingerprint": FINGERPRINT, "vendor_header": "acme supplies ltd", "blocks": blocks}
+    return layout, values, "\n".join(block["text"] for block in blocks)
+
+
+def test_template_lifecycle(templates):
+    # Learning: no template until TEMPLATE_MIN_SAMPLES extractions agree
+    for n in (1, 2):
+        templates.learn_from_extraction(*invoice(n)[:2])
+        assert templates.extract_with_template(invoice(n)[0]) is None
+    templates.learn_from_extraction(*invoice(3)[:2])
+    template = templates.get_template(FINGERPRINT)
+    assert (template["version"], template["status"]) == (1, "active")
+    assert template["field_rules"]["vendor_name"]["kind"] == "constant"
+    assert template["field_rules"]["total_amount"] == {"kind": "anchor", "anchor": "total"}
+
+    # Applying: a new invoice with the same layout is read from the template
+    layout, expected, text = invoice(4)
+    values = templates.extract_with_template(layout)
+    assert {field: values[field] for field in expected} == expected
+    assert templates.validate_extraction(values, text)
+    assert templates.extract_with_template({**layout, "fingerprint": "other-layout"}) is None
+
+    # The vendor moved its total: the "Total" anchor now reads the item count, subtotal + tax != total
+    layout, _, text = invoice(5, totals_block="Subtotal: $150.00\nVAT: $15.00\nTotal items: 3\nAmount due: $165.00")
+    values = templates.extract_with_template(layout)
+    assert values["total_amount"] == 3.0
+    assert not templates.validate_extraction(values, text)
+
+    # Invalidation: version bumped, relearned from fresh samples only
+    templates.invalidate_template(FINGERPRINT)
+    template = templates.get_template(FINGERPRINT)
+    assert (template["version"], template["status"], template["field_rules"]) == (2, "learning", None)
+    assert templates.extract_with_template(layout) is None
+    for n in (5, 6):
+        templates.learn_from_extraction(*invoice(n)[:2])
+    assert templates.get_template(FINGERPRINT)["status"] == "learning"
+    templates.learn_from_extraction(*invoice(7)[:2])
+    template = templates.get_template(FINGERPRINT)
+    assert (template["version"], template["status"]) == (2, "active")
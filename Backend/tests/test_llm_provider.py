@@ -0,0 +1,20 @@
+# tests/test_llm_provider.py
+"""Startup of the long-lived LLM clients."""
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def test_startup_survives_a_missing_api_key():
+    # Fresh interpreter: the provider reads LLM_PROVIDER at import time
+    env = {k: v for k, v in os.environ.items() if k != "OPENAI_API_KEY"}
+    env["LLM_PROVIDER"] = "openai"
+    started = subprocess.run(
+        [sys.executable, "-c", "from services.llm_provider import start_llm_provider; start_llm_provider()"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=120,
+    )
+    assert started.returncode == 0, started.stderr
+    assert "LLM extraction chain not prebuilt" in started.stdout
@@ -0,0 +1,128 @@
+# tests/test_llm_router.py
+"""Routing LLM calls across providers, against MockChatModel targets."""
+import asyncio
+import time
+
+import pytest
+
+from services import llm_router, metrics
+from services.llm_provider import LLMProvider
+from services.llm_router import LLMRouter, parse_targets, LLM_ROUTER_MIN_SAMPLES
+from services.llm_scheduler import LLMRateLimitError, RateLimits, get_llm_scheduler
+from services.mock_llm import MockChatModel
+
+pytestmark = pytest.mark.usefixtures("llm_scheduler")
+
+INVOICE = "ACME Supplies Ltd\nInvoice No: INV-1001\nDate: 2025-03-14\nTotal: $108.00\n"
+
+
+@pytest.fixture
+def mock_targets(monkeypatch):
+    """Route over mock models built by the test: `mock_targets(spec, **models)` → (router, models)."""
+    def make(spec: str, **models: MockChatModel):
+        provider = LLMProvider()
+        for name, model in models.items():
+            provider._llms[("mock", name)] = model
+        router = LLMRouter(parse_targets(spec))
+        monkeypatch.setattr(llm_router, "get_llm_provider", lambda: provider)
+        monkeypatch.setattr(llm_router, "get_llm_router", lambda: router)
+        return router, models
+    return make
+
+
+def seed_latency(target, seconds: float) -> None:
+    target.latencies.extend([seconds] * LLM_ROUTER_MIN_SAMPLES)
+
+
+@pytest.mark.anyio
+async def test_tokens_are_counted_for_the_chosen_model(monkeypatch, mock_targets):
+    counted_for = []
+
+    def count_tokens(text, model=None):
+        counted_for.append(model)
+        return 100
+
+    monkeypatch.setattr(llm_router, "count_tokens", count_tokens)
+    mock_targets("mock:rules-v2")
+
+    result = await llm_router.route_extraction(INVOICE)
+    assert result.invoice_number == "INV-1001"
+    assert counted_for == ["rules-v2"]
+
+
+@pytest.mark.anyio
+async def test_fails_over_to_the_next_target(mock_targets):
+    router, models = mock_targets("mock:down,mock:up", down=MockChatModel("down", failure_rate=1), up=MockChatModel("up"))
+    down, up = router.targets
+    seed_latency(up, 0.5)  # `down` looks faster, so it is tried first
+    fallbacks_before = metrics.get("llm_fallbacks")
+
+    result = await llm_router.route_extraction(INVOICE)
+
+    assert result.invoice_number == "INV-1001"
+    assert (models["down"].calls, models["up"].calls) == (1, 1)
+    assert list(down.outcomes) == [False] and list(up.outcomes)[-1] is True
+    assert metrics.get("llm_fallbacks") == fallbacks_before + 1
+
+
+@pytest.mark.anyio
+async def test_slow_primary_is_hedged_and_the_loser_cancelled(monkeypatch, mock_targets):
+    monkeypatch.setattr(llm_router, "LLM_HEDGING_ENABLED", True)
+    router, models = mock_targets("mock:slow,mock:fast", slow=MockChatModel("slow", latency=2), fast=MockChatModel("fast"))
+    slow, fast = router.targets
+    seed_latency(slow, 0.05)  # p95 50ms: hedge after that
+    seed_latency(fast, 0.2)
+    hedges_before, wins_before = metrics.get("llm_hedges"), metrics.get("llm_hedge_wins")
+
+    started = time.perf_counter()
+    result = await llm_router.route_extraction(INVOICE)
+    elapsed = time.perf_counter() - started
+    await asyncio.sleep(0)  # let the cancelled loser record itself
+
+    assert result.invoice_number == "INV-1001"
+    assert elapsed < 1
+    assert metrics.get("llm_hedges") == hedges_before + 1
+    assert metrics.get("llm_hedge_wins") == wins_before + 1
+    # The loser is neither a success nor an error
+    assert slow.cancelled == 1 and not slow.outcomes
+    assert list(fast.outcomes) == [True]
+
+
+@pytest.mark.anyio
+async def test_failing_target_is_benched(mock_targets):
+    router, models = mock_targets("mock:down,mock:up", down=MockChatModel("down", failure_rate=1), up=MockChatModel("up"))
+    down, up = router.targets
+    seed_latency(up, 0.5)
+
+    for _ in range(LLM_ROUTER_MIN_SAMPLES + 3):
+        assert (await llm_router.route_extraction(INVOICE)).invoice_number == "INV-1001"
+
+    # Benched after MIN_SAMPLES failures: later calls go straight to `up`
+    assert not down.healthy()
+    assert models["down"].calls == LLM_ROUTER_MIN_SAMPLES
+    assert models["up"].calls == LLM_ROUTER_MIN_SAMPLES + 3
+    assert router.ranked() == [up]
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+
+@pytest.mark.anyio
+async def test_rate_limit_only_throttles_its_own_provider():
+    scheduler = get_llm_scheduler()
+    throttled, other = RateLimits(rpm=60), RateLimits(rpm=60)
+
+    async def rate_limited():
+        raise RateLimited("slow down")
+
+    async def ok():
+        return "ok"
+
+    with pytest.raises(LLMRateLimitError):
+        await scheduler.run(rate_limited, max_retries=0, limits=throttled)
+    assert throttled.wait_time(1) > 0
+
+    started = time.perf_counter()
+    assert await asyncio.wait_for(scheduler.run(ok, limits=other), timeout=1) == "ok"
+    assert time.perf_counter() - started < 0.5
@@ -0,0 +1,54 @@
+# tests/test_prompt_compactor.py
+"""Prompt compaction must keep what extraction needs (latency: benchmarks/bench_prompt_compaction.py)."""
+from services.prompt_compactor import compact_prompt_text, PROMPT_TOKEN_BUDGET
+from services.rule_extractor import extract_fields
+
+
+def long_invoice(items: int = 400) -> str:
+    lines = [
+        "Globex Logistics Ltd",
+        "Invoice No: INV-2024-0415",
+        "Invoice Date: 2024-03-15",
+        "Bill To: Initech Supplies",
+        "",
+    ]
+    subtotal = 0.0
+    for i in range(items):
+        amount = (i % 97 + 1) * 3.25
+        subtotal += amount
+        lines.append(f"{i + 1:04d} 2024-03-{i % 28 + 1:02d} Freight handling zone {i % 9} 1 x ${amount:,.2f} ${amount:,.2f}")
+    tax = round(subtotal * 0.08, 2)
+    lines += [
+        "",
+        f"Subtotal: ${subtotal:,.2f}",
+        f"Sales Tax (8%): ${tax:,.2f}",
+        f"Total Due: ${subtotal + tax:,.2f}",
+        "",
+        "Terms and conditions: payment within 30 days; liability is limited to the invoice amount.",
+    ]
+    return "\n".join(lines)
+
+
+def test_totals_survive_compaction_of_a_long_invoice():
+    text = long_invoice()
+    compacted, stats = compact_prompt_text(text)
+
+    assert stats["original_tokens"] > PROMPT_TOKEN_BUDGET
+    assert stats["compacted_tokens"] < stats["original_tokens"]
+    for label in ("Subtotal:", "Sales Tax (8%):", "Total Due:"):
+        assert label in compacted
+
+    # The compacted prompt carries the same fields as the full text
+    full, short = extract_fields(text), extract_fields(compacted)
+    for name in ("vendor_name", "invoice_number", "invoice_date", "total_amount", "tax_amount", "currency"):
+        assert short[name]["value"] == full[name]["value"], name
+
+
+def test_totals_are_kept_even_over_budget():
+    compacted, _ = compact_prompt_text(long_invoice(), budget=10)
+    assert "Total Due:" in compacted and "Sales Tax (8%):" in compacted and "Subtotal:" in compacted
+
+
+def test_short_documents_are_untouched():
+    text = "ACME Supplies Ltd\nInvoice No: INV-1001\nTotal: $108.00"
+    assert compact_prompt_text(text)[0] == text
@@ -0,0 +1,48 @@
+# tests/test_responsiveness.py
+"""Read endpoints must keep answering while an upload is being extracted."""
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from tests.helpers import slow_text_extraction, EXTRACTION_SECONDS
+
+MAX_READ_LATENCY = 0.5  # seconds, far below the extraction time
+
+
+@pytest.mark.anyio
+async def test_reads_stay_responsive_during_extraction(db_tables, monkeypatch):
+    from app import app
+    from services import extractor
+    from services.workers import shutdown_workers
+
+    monkeypatch.setattr(extractor, "extract_text_from_source", slow_text_extraction)
+
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=60) as client:
+            started = time.perf_counter()
+            analyze = asyncio.create_task(
+                client.post("/api/analyze", files={"file": ("receipt.png", b"not really an image", "image/png")})
+            )
+            read_latencies = []
+            while not analyze.done():
+                read_started = time.perf_counter()
+                response = await client.get("/api/invoices")
+                read_latencies.append(time.perf_counter() - read_started)
+                assert response.status_code == 200
+                await asyncio.sleep(0.05)
+            response = await analyze
+            analyze_seconds = time.perf_counter() - started
+
+            assert response.status_code == 200, response.text
+            assert response.json()["data"]["total_amount"] == 108.0
+            assert analyze_seconds >= EXTRACTION_SECONDS
+            assert len(read_latencies) >= 5
+            assert max(read_latencies) < MAX_READ_LATENCY, read_latencies
+
+            listed = (await client.get("/api/invoices")).json()
+            assert listed["total"] == 1
+    finally:
+        shutdown_workers()
@@ -0,0 +1,45 @@
+# tests/test_rule_extractor.py
+"""Rule-based fast path: which fields it resolves and what reaches the LLM."""
+import pytest
+
+from services.layout_templates import validate_extraction
+from services.rule_extractor import extract_fields, unresolved_fields, confident_values
+from tests.helpers import INVOICE_TEXT, text_extraction
+
+
+def test_tax_amount_is_not_mistaken_for_the_rate():
+    fields = extract_fields(INVOICE_TEXT)
+    assert fields["tax_amount"]["value"] == 8.0
+    assert extract_fields("VAT 7.5%: 75.00\nTotal: 1,075.00")["tax_amount"]["value"] == 75.0
+    assert extract_fields("Tax 8 % 16.00\nTotal 216.00")["tax_amount"]["value"] == 16.0
+    assert "tax_amount" not in extract_fields("VAT 7.5% included\nTotal: 1,075.00")
+
+
+def test_total_ignores_tax_totals_and_quantities():
+    assert extract_fields("Total 120.00\nTotal VAT 20.00")["total_amount"]["value"] == 120.0
+    assert extract_fields("Total 120.00\nTotal Tax 20.00")["total_amount"]["value"] == 120.0
+    # A plain space doesn't group digits: the quantity stays apart from the amount
+    assert extract_fields("Total: 12 100.00")["total_amount"]["value"] == 100.0
+    assert extract_fields("Total: 1\u00a0234,56")["total_amount"]["value"] == 1234.56
+
+
+def test_confident_invoice_passes_validation_without_the_llm():
+    fields = extract_fields(INVOICE_TEXT)
+    assert unresolved_fields(fields) == []
+    assert validate_extraction(confident_values(fields), INVOICE_TEXT)
+
+
+@pytest.mark.anyio
+async def test_weak_optional_values_are_kept_when_the_llm_is_skipped(monkeypatch):
+    from services import extractor
+    from services.workers import shutdown_workers
+
+    monkeypatch.setattr(extractor, "extract_text_from_source", text_extraction)
+    try:
+        result = await extractor.extract_invoice_data(b"a receipt photo only this test uploads", "receipt.png")
+    finally:
+        shutdown_workers()
+
+    assert result["extraction_method"] == "rules"
+    assert result["structured"]["tax_amount"] == 8.0
+    assert result["structured"]["currency"] == "USD"
@@ -0,0 +1,63 @@
+# tests/test_vectorstore.py
+"""The local Chroma index: writes through the chromadb collection, one owning process."""
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from services import vectorstore
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+class HashEmbeddings:
+    """Deterministic offline stand-in for the cached OpenAI embeddings."""
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return [float(len(text) % 7), float(text.count("a")), 1.0]
+
+    def embed_with_stats(self, texts):
+        return self.embed_documents(texts), {"cached": [0] * len(texts), "hits": 0, "api_requests": 1}
+
+
+@pytest.fixture
+def chroma(tmp_path, monkeypatch):
+    monkeypatch.setattr(vectorstore, "VECTOR_BACKEND", "chroma")
+    monkeypatch.setattr(vectorstore, "CHROMA_HOST", None)
+    monkeypatch.setattr(vectorstore, "CHROMA_PATH", str(tmp_path / "chroma"))
+    monkeypatch.setattr(vectorstore, "_vectorstore", None)
+    monkeypatch.setattr(vectorstore, "_collection", None)
+    monkeypatch.setattr(vectorstore, "_owner_lock", None)
+    monkeypatch.setattr(vectorstore, "get_embeddings", lambda: HashEmbeddings())
+    return tmp_path / "chroma"
+
+
+def test_reindexing_replaces_chunks_and_delete_removes_them(chroma):
+    meta = {"user_id": "u1", "vendor": None}
+    vectorstore.index_invoices([("inv-a", ["alpha", "beta", "gamma"], meta), ("inv-b", ["delta"], meta)])
+    assert vectorstore.indexed_chunk_counts() == {"inv-a": 3, "inv-b": 1}
+
+    vectorstore.index_invoices([("inv-a", ["alpha"], meta)])  # shorter now: stale chunks go
+    assert vectorstore.indexed_chunk_counts() == {"inv-a": 1, "inv-b": 1}
+    assert vectorstore.warm_vectorstore() == 2
+
+    vectorstore.delete_invoice_vectors(["inv-b"])
+    assert vectorstore.indexed_chunk_counts() == {"inv-a": 1}
+
+
+def test_a_second_process_cannot_open_the_local_index(chroma):
+    assert vectorstore.warm_vectorstore() == 0
+
+    env = {**os.environ, "CHROMA_PATH": str(chroma), "VECTOR_BACKEND": "chroma"}
+    env.pop("CHROMA_HOST", None)
+    second = subprocess.run(
+        [sys.executable, "-c", "from services.vectorstore import warm_vectorstore; warm_vectorstore()"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=120,
+    )
+    assert second.returncode != 0
+    assert "ChromaInUseError" in second.stderr and "CHROMA_HOST" in second.stderr